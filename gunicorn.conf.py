@@ -0,0 +1,38 @@
+import gc
+import os
+import tempfile
+
+# Workers write their metrics here so /metrics can sum them (main/metrics.py)
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "waterproj-metrics"))
+
+# Import the Django app, and with it the ML model (see ML_PRELOAD), once in
+# the master process. Forked workers then share those pages copy-on-write
+# instead of each unpickling a private copy on its first /predict/ request.
+preload_app = True
+
+
+def on_starting(server):
+    # Forget the workers of a previous run, then report the master's own series
+    # (the model load done by the preload)
+    from main.metrics import get_metrics
+
+    get_metrics().clear_directory()
+    get_metrics().flush()
+
+
+def pre_fork(server, worker):
+    # Keep the cyclic GC from walking (and so writing to) every object loaded
+    # in the master, which would un-share those pages in each worker.
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    # Write out history rows still sitting in the write-behind buffer
+    from main.history import shutdown_history_writer
+
+    shutdown_history_writer()
+
+    # Its series leave the /metrics totals with it
+    from main.metrics import get_metrics
+
+    get_metrics().remove_snapshot()
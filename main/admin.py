@@ -1,8 +1,97 @@
-from django.contrib import admin
-from .models import PredictionHistory
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.urls import path
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
+
+from .models import ApiToken, HistoryDailySummary, HistoryScore, PredictionHistory, RescoreJob
+from .registry import get_model_bundle
+from .rescoring import JobBusy, start_background_rescore
+
+
+class HistoryScoreInline(admin.TabularInline):
+    model = HistoryScore
+    fields = ('model_version', 'result', 'confidence')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(PredictionHistory)
 class PredictionHistoryAdmin(admin.ModelAdmin):
-    list_display = ('user', 'ph_input', 'tds_input', 'result', 'prediction_date')
-    list_filter = ('user', 'result', 'prediction_date')
+    list_display = ('user', 'ph_input', 'tds_input', 'result', 'lab_result', 'model_version', 'prediction_date')
+    list_filter = ('user', 'result', 'lab_result', 'model_version', 'prediction_date')
     search_fields = ('user__username', 'result')
+    readonly_fields = ('lab_verified_at',)
+    inlines = [HistoryScoreInline]
+    # Adds a "Re-score history" button to the object tools
+    change_list_template = 'admin/main/predictionhistory/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('rescore/', self.admin_site.admin_view(self.rescore_view), name='main_predictionhistory_rescore'),
+        ] + super().get_urls()
+
+    @method_decorator(require_POST)
+    def rescore_view(self, request):
+        # Whole-table job: resumes the promoted version's checkpoint, or
+        # scores the rows added since its last run
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        version = get_model_bundle().version
+        try:
+            job = start_background_rescore(version)
+        except JobBusy as e:
+            self.message_user(request, str(e), messages.WARNING)
+        else:
+            self.message_user(request, f"Re-scoring history ids {job.last_id + 1}..{job.target_id} with {version} "
+                                       f"in the background; follow it under Re-scoring Jobs.")
+        return redirect('admin:main_predictionhistory_changelist')
+
+    def save_model(self, request, obj, form, change):
+        # A new or corrected lab result moves past `retrain_model --source lab`'s watermark
+        if 'lab_result' in form.changed_data:
+            obj.lab_verified_at = timezone.now() if obj.lab_result else None
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'name', 'created')
+    search_fields = ('user__username', 'name')
+    readonly_fields = ('key_hash', 'created')
+
+
+@admin.register(HistoryDailySummary)
+class HistoryDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'result', 'count', 'ph_min', 'ph_max', 'tds_min', 'tds_max')
+    list_filter = ('result', 'day')
+    search_fields = ('user__username',)
+
+    # Maintained by the history write path and `manage.py rebuild_history_summary`
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RescoreJob)
+class RescoreJobAdmin(admin.ModelAdmin):
+    list_display = ('model_version', 'status', 'progress_percent', 'rows_scored', 'rows_changed', 'updated_at')
+    list_filter = ('status',)
+
+    @admin.display(description='Progress')
+    def progress_percent(self, obj):
+        return f"{obj.progress:.1%}"
+
+    # Written by main/rescoring.py only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,305 @@
+"""
+JSON API for machine clients (field stations, IoT gateways).
+
+Same scoring and analytics as the HTML views, without template rendering,
+sessions or the messages framework. Every endpoint authenticates with an
+``Authorization: Token <key>`` header (``manage.py create_api_token``).
+Responses are compact by default; pass ``?full=1`` for the complete
+analytics payload that ``predict.html`` shows.
+"""
+import asyncio
+import json
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .drift import drift_report
+from .export import export_owner, export_queryset, parse_export_filters, streaming_export_response
+from .metrics import API_TOKEN_CACHE_REQUESTS, get_metrics
+from .models import ApiToken, PredictionHistory
+from .summary import summarize
+from .views import parse_batch_samples, predict_batch, predict_one, save_history
+
+COMPACT_FIELDS = ("prediction_result", "confidence", "quality_index")
+
+logger = logging.getLogger(__name__)
+
+
+def token_cache_key(key_hash):
+    return f"apitoken:{key_hash}"
+
+
+def resolve_token(key):
+    """Active user owning API ``key``, or None.
+
+    Lookups are cached for API_TOKEN_CACHE_SECONDS, since the ORM query
+    otherwise costs as much as the prediction itself. Deleting a token evicts
+    it (see models.py); deactivating its user takes effect within that window.
+    """
+    key_hash = ApiToken.hash_key(key)
+    user = cache.get(token_cache_key(key_hash))
+    get_metrics().inc(API_TOKEN_CACHE_REQUESTS, result="miss" if user is None else "hit")
+    if user is None:
+        token = ApiToken.objects.select_related("user").filter(
+            key_hash=key_hash, user__is_active=True
+        ).first()
+        if token is None:
+            return None
+        user = token.user
+        cache.set(token_cache_key(key_hash), user, getattr(settings, "API_TOKEN_CACHE_SECONDS", 60))
+    return user
+
+
+def authenticate_token(request):
+    scheme, _, key = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    if scheme.lower() in ("token", "bearer") and key.strip():
+        return resolve_token(key.strip())
+    return None
+
+
+def _unauthorized():
+    return JsonResponse({"error": "Invalid or missing API token."}, status=401)
+
+
+def token_required(view):
+    """Resolve the API token to ``request.api_user`` or answer 401.
+
+    Token requests carry no session cookie, so CSRF protection does not apply.
+    """
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user = authenticate_token(request)
+        if user is None:
+            return _unauthorized()
+        request.api_user = user
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _wants_full(request):
+    return request.GET.get("full", "") in ("1", "true", "yes")
+
+
+def _compact(payload):
+    return {field: payload[field] for field in COMPACT_FIELDS}
+
+
+def _read_reading(request):
+    """(ph, tds) from a JSON body or form fields; raises ValueError."""
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Request body is not valid JSON.")
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object with 'ph' and 'tds'.")
+    else:
+        data = request.POST
+    ph_raw, tds_raw = data.get("ph", data.get("pH")), data.get("tds", data.get("TDS"))
+    if ph_raw in (None, "") or tds_raw in (None, ""):
+        raise ValueError("Please provide both pH and TDS.")
+    try:
+        ph, tds = float(ph_raw), float(tds_raw)
+    except (TypeError, ValueError):
+        raise ValueError("pH and TDS must be numeric.")
+    if not (math.isfinite(ph) and math.isfinite(tds)):
+        raise ValueError("pH and TDS must be finite numbers.")
+    return ph, tds
+
+
+def _prediction_error(e):
+    logger.exception("Prediction failed")
+    if isinstance(e, FileNotFoundError):
+        return JsonResponse({"error": "Model file missing on server."}, status=503)
+    return JsonResponse({"error": "Internal server error during prediction."}, status=500)
+
+
+@require_POST
+@token_required
+def api_predict(request):
+    try:
+        ph, tds = _read_reading(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        payload = predict_one(ph, tds)
+    except Exception as e:
+        return _prediction_error(e)
+
+    save_history(request.api_user, [{"ph": ph, "tds": tds, **payload}])
+    body = dict(payload) if _wants_full(request) else _compact(payload)
+    body["model_version"] = payload["model_version"]
+    return JsonResponse(body)
+
+
+@require_POST
+@token_required
+def api_predict_batch(request):
+    try:
+        ph, tds = parse_batch_samples(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        results = predict_batch(ph, tds)
+    except Exception as e:
+        return _prediction_error(e)
+
+    save_history(request.api_user, results)
+    full = _wants_full(request)
+    return JsonResponse({
+        "count": len(results),
+        "model_version": results[0]["model_version"] if results else None,
+        "results": [
+            {k: v for k, v in r.items() if k != "model_version"} if full else _compact(r)
+            for r in results
+        ],
+    })
+
+
+@require_GET
+@token_required
+def api_history(request):
+    """Newest-first history of the token's user; page with ``before=<id>``."""
+    max_limit = getattr(settings, "API_HISTORY_MAX_LIMIT", 1000)
+    try:
+        limit = min(max(int(request.GET.get("limit", 100)), 1), max_limit)
+        before = int(request.GET["before"]) if request.GET.get("before") else None
+    except ValueError:
+        return JsonResponse({"error": "limit and before must be integers."}, status=400)
+
+    rows = PredictionHistory.objects.filter(user=request.api_user)
+    if before is not None:
+        rows = rows.filter(id__lt=before)
+    rows = list(
+        rows.order_by("-id").values_list("id", "prediction_date", "ph_input", "tds_input", "result")[:limit]
+    )
+    return JsonResponse({
+        "count": len(rows),
+        "next_before": rows[-1][0] if len(rows) == limit else None,
+        "results": [
+            {"id": pk, "date": date.isoformat(), "ph": ph, "tds": tds, "result": result}
+            for pk, date, ph, tds, result in rows
+        ],
+    })
+
+
+@require_GET
+@token_required
+def api_history_summary(request):
+    """Per-result and per-day totals for the last ``days`` days (default 30)."""
+    max_days = getattr(settings, "HISTORY_SUMMARY_MAX_DAYS", 366)
+    try:
+        days = min(max(int(request.GET.get("days", 30)), 1), max_days)
+    except ValueError:
+        return JsonResponse({"error": "days must be an integer."}, status=400)
+
+    summary = summarize(request.api_user, days)
+    return JsonResponse({
+        "since": summary["since"].isoformat(),
+        "days": days,
+        "total": summary["total"],
+        "by_result": summary["by_result"],
+        "daily": [
+            {
+                "day": s.day.isoformat(), "result": s.result, "count": s.count,
+                "ph_min": s.ph_min, "ph_max": s.ph_max, "ph_mean": s.ph_mean,
+                "tds_min": s.tds_min, "tds_max": s.tds_max, "tds_mean": s.tds_mean,
+            }
+            for s in summary["daily"]
+        ],
+    })
+
+
+@require_GET
+@token_required
+def api_drift(request):
+    """Staff only: production pH/TDS and class distributions per model version
+    against the training data (PSI, KS, quantiles; see main/drift.py)."""
+    if not request.api_user.is_staff:
+        return JsonResponse({"error": "Staff token required."}, status=403)
+    try:
+        return JsonResponse(drift_report(version=request.GET.get("version") or None))
+    except (OSError, ValueError):
+        logger.exception("Drift report failed")
+        return JsonResponse({"error": "Training data for the drift reference is unavailable."}, status=503)
+
+
+@require_GET
+@token_required
+def api_history_export(request):
+    """Stream history as ?format=ndjson (default) or csv; filters start, end,
+    result, and for staff tokens ``user`` (a username, or "all")."""
+    fmt = request.GET.get("format", "ndjson")
+    try:
+        owner = export_owner(request.api_user, request.GET)
+        start, end, result = parse_export_filters(request.GET)
+        if fmt not in ("csv", "ndjson"):
+            raise ValueError("format must be 'csv' or 'ndjson'.")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return streaming_export_response(export_queryset(owner, start, end, result), fmt)
+
+
+# -------------------------
+# Async (ASGI) prediction path
+# -------------------------
+_INFERENCE_POOL = None
+
+
+def get_inference_pool():
+    """Bounded pool that runs model calls off the event loop."""
+    global _INFERENCE_POOL
+    if _INFERENCE_POOL is None:
+        _INFERENCE_POOL = ThreadPoolExecutor(
+            max_workers=getattr(settings, "ASYNC_INFERENCE_THREADS", 4),
+            thread_name_prefix="inference",
+        )
+    return _INFERENCE_POOL
+
+
+async def api_predict_async(request):
+    """Async /api/predict for ASGI servers (uvicorn).
+
+    Inference runs in the bounded inference pool and the history row goes to
+    the background history writer, so the event loop never waits on the model
+    or on the database write. The hand-off itself runs in the sync thread:
+    when the writer falls behind, ``submit`` writes the overflow batch on the
+    calling thread, and the ORM refuses to run on the event loop.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed."}, status=405)
+    user = await sync_to_async(authenticate_token)(request)
+    if user is None:
+        return _unauthorized()
+    try:
+        ph, tds = _read_reading(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(get_inference_pool(), predict_one, ph, tds)
+    except Exception as e:
+        return _prediction_error(e)
+
+    await sync_to_async(save_history)(user, [{"ph": ph, "tds": tds, **payload}], background=True)
+    body = dict(payload) if _wants_full(request) else _compact(payload)
+    body["model_version"] = payload["model_version"]
+    return JsonResponse(body)
+
+
+# Django 4.2's csrf_exempt decorator does not support coroutine views
+api_predict_async.csrf_exempt = True
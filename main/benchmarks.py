@@ -0,0 +1,646 @@
+"""
+Benchmarks for the prediction and history hot paths.
+
+Run with ``python manage.py benchmark <suite> [<suite> ...]``. Every run uses
+a throwaway test database, so the configured database is never touched.
+Suites are plain functions registered with ``@suite`` that return a dict of
+measurements.
+
+``--output results.json`` saves a run (with the library versions and machine
+it ran on); ``--baseline results.json`` compares against a saved run and
+fails when a latency or throughput got worse by more than ``--threshold``
+percent. Random inputs are seeded, so runs on the same machine are comparable.
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.test import AsyncClient, Client, override_settings
+
+SUITES = {}
+
+
+def suite(name):
+    def register(fn):
+        SUITES[name] = fn
+        return fn
+    return register
+
+
+def measure(fn, repeat=200, warmup=10):
+    """Time ``repeat`` calls of ``fn`` after ``warmup`` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    total = time.perf_counter() - start
+    return {
+        "calls": repeat,
+        "total_s": round(total, 4),
+        "per_call_ms": round(total / repeat * 1000, 4),
+        "per_s": round(repeat / total, 1) if total else None,
+    }
+
+
+@contextmanager
+def throwaway_database():
+    """Run against a fresh on-disk test database (SQLite file in a temp dir).
+
+    On disk rather than in memory so that write costs and cross-thread locking
+    behave as they do in production. Under ``manage.py test`` the in-memory
+    test database is already throwaway and is used as is: closing an
+    in-memory SQLite connection is a no-op, so it could not be swapped out.
+    """
+    if connection.vendor == "sqlite" and connection.is_in_memory_db():
+        yield
+        return
+    old_name = connection.settings_dict["NAME"]
+    old_test = dict(connection.settings_dict.get("TEST", {}))
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == "sqlite":
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmp, "bench.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict["TEST"] = old_test
+
+
+def latency_summary(latencies, wall):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "req_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def make_client(user=None):
+    # Host must pass ALLOWED_HOSTS; setup_test_environment() is avoided on
+    # purpose because it instruments template rendering.
+    client = Client(HTTP_HOST="localhost")
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+@contextmanager
+def async_client():
+    """AsyncClient, with its fixed ``Host: testserver`` allowed.
+
+    Django 4.2's AsyncClient ignores HTTP_HOST and HTTP_* extras (pass
+    headers={...} instead), so requests would otherwise fail host validation.
+    """
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        yield AsyncClient()
+
+
+def make_user(username):
+    from django.contrib.auth.models import User
+    return User.objects.create_user(username=username, password="bench-Passw0rd!")
+
+
+# -------------------------
+# Suites
+# -------------------------
+@suite("api")
+def bench_api(repeat=200):
+    """Requests/s of the HTML predict_view versus the JSON /api/predict."""
+    from .models import ApiToken
+
+    user = make_user("bench-api")
+    key = ApiToken.issue(user, name="bench")
+    html = make_client(user)
+    api = make_client()
+    reading = {"ph": 7.2, "tds": 310}
+
+    results = {
+        "html_predict": measure(lambda: html.post("/predict/", reading), repeat),
+        "api_predict": measure(
+            lambda: api.post("/api/predict", reading, HTTP_AUTHORIZATION=f"Token {key}"), repeat
+        ),
+    }
+    results["api_speedup"] = round(
+        results["api_predict"]["per_s"] / results["html_predict"]["per_s"], 2
+    )
+    return results
+
+
+@suite("async")
+def bench_async(requests=400, concurrency=16):
+    """Load test: sync /api/predict (WSGI) vs async /api/async/predict (ASGI).
+
+    Both run in-process with ``concurrency`` requests in flight: threads for
+    the WSGI path, coroutines for the ASGI path. Readings vary so the
+    prediction cache does not hide the model call.
+    """
+    from .history import get_history_writer
+    from .models import ApiToken
+
+    user = make_user("bench-async")
+    key = ApiToken.issue(user, name="bench")
+    headers = {"HTTP_AUTHORIZATION": f"Token {key}"}
+    rng = np.random.default_rng(0)
+    readings = [
+        {"ph": round(float(p), 2), "tds": round(float(t), 1)}
+        for p, t in zip(rng.uniform(4, 10, requests), rng.uniform(50, 2000, requests))
+    ]
+
+    def sync_call(reading):
+        start = time.perf_counter()
+        Client(HTTP_HOST="localhost").post("/api/predict", reading, **headers)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        sync_latencies = list(pool.map(sync_call, readings))
+    sync_wall = time.perf_counter() - start
+
+    async def run_async(client):
+        gate = asyncio.Semaphore(concurrency)
+
+        async def call(reading):
+            async with gate:
+                t0 = time.perf_counter()
+                response = await client.post(
+                    "/api/async/predict", reading, headers={"Authorization": f"Token {key}"}
+                )
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - t0
+
+        return await asyncio.gather(*(call(r) for r in readings))
+
+    # New readings for the async pass so both paths miss the cache equally
+    readings = [{"ph": r["ph"], "tds": r["tds"] + 0.1} for r in readings]
+    start = time.perf_counter()
+    with async_client() as client:
+        async_latencies = asyncio.run(run_async(client))
+    async_wall = time.perf_counter() - start
+
+    flush_start = time.perf_counter()
+    get_history_writer().flush()
+    return {
+        "concurrency": concurrency,
+        "wsgi_sync": latency_summary(sync_latencies, sync_wall),
+        "asgi_async": latency_summary(async_latencies, async_wall),
+        "history_drain_s": round(time.perf_counter() - flush_start, 4),
+    }
+
+
+@suite("history_writes")
+def bench_history_writes(rows=2000, threads=8):
+    """Insert throughput: one transaction per row vs the write-behind writer.
+
+    ``threads`` request threads each save ``rows / threads`` single-row
+    results, as concurrent gunicorn threads would.
+    """
+    from .history import get_history_writer
+    from .views import save_history
+
+    user = make_user("bench-history")
+    result = {"ph": 7.2, "tds": 310.0, "prediction_result": "Safe", "model_version": "bench"}
+    per_thread = rows // threads
+
+    def run(background):
+        def work(_):
+            for _ in range(per_thread):
+                save_history(user, [result], background=background)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(work, range(threads)))
+        request_s = time.perf_counter() - start
+        if background:
+            get_history_writer().flush()
+        total_s = time.perf_counter() - start
+        return {
+            "rows": per_thread * threads,
+            "request_path_s": round(request_s, 4),
+            "rows_per_s": round(per_thread * threads / total_s, 1),
+        }
+
+    results = {"sync": run(False), "buffered": run(True)}
+    results["buffered"]["writer"] = get_history_writer().stats()
+    return results
+
+
+def seed_history(user, rows, chunk=50000):
+    """Insert ``rows`` history rows for ``user``, one per minute going back from now.
+
+    Raw executemany, since bulk_create would stamp every row with the same
+    auto_now_add date.
+    """
+    from datetime import timedelta
+
+    from django.db import transaction
+    from django.utils import timezone
+
+    from .models import PredictionHistory
+
+    table = PredictionHistory._meta.db_table
+    now = timezone.now()
+    rng = np.random.default_rng(0)
+    sql = (f"INSERT INTO {table} (user_id, ph_input, tds_input, result, model_version, prediction_date, lab_result) "
+           f"VALUES (%s, %s, %s, %s, %s, %s, '')")
+    labels = np.array(["Safe", "Moderate", "Contaminated"])
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        ph = np.round(rng.uniform(4.5, 9.5, n), 2)
+        tds = np.round(rng.uniform(50, 2000, n), 2)
+        result = labels[rng.integers(0, 3, n)]
+        params = [
+            (user.pk, float(ph[i]), float(tds[i]), str(result[i]), "bench",
+             connection.ops.adapt_datetimefield_value(now - timedelta(minutes=start + i)))
+            for i in range(n)
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+@suite("history_page")
+def bench_history_page(rows=1000000, page_size=50, legacy_rows=20000):
+    """History page cost at ``rows`` rows for one user.
+
+    Compares the keyset-paginated view (first page and a page 90% deep) with
+    an OFFSET query for the same deep page, and with the old render-everything
+    page at ``legacy_rows`` rows.
+    """
+    from django.template.loader import render_to_string
+
+    from .models import PredictionHistory
+    from .views import encode_cursor
+
+    user = make_user("bench-page")
+    start = time.perf_counter()
+    seed_history(user, rows)
+    seed_s = time.perf_counter() - start
+    client = make_client(user)
+
+    ordered = PredictionHistory.objects.filter(user=user).order_by("-prediction_date", "-id")
+    depth = int(rows * 0.9)
+    cursor = encode_cursor(ordered.only("id", "prediction_date")[depth])
+    keyset_qs = ordered.only("id", "prediction_date", "ph_input", "tds_input", "result")
+
+    with connection.cursor() as c:
+        sql, sql_params = keyset_qs[:page_size].query.sql_with_params()
+        c.execute("EXPLAIN QUERY PLAN " + sql, sql_params)
+        plan = [row[-1] for row in c.fetchall()]
+
+    legacy_user = make_user("bench-page-legacy")
+    seed_history(legacy_user, legacy_rows)
+
+    def legacy_render():
+        history = PredictionHistory.objects.filter(user=legacy_user).order_by("-prediction_date")
+        render_to_string("main/history.html", {"history": history})
+
+    return {
+        "rows": rows,
+        "seed_s": round(seed_s, 2),
+        "query_plan": plan,
+        "first_page": measure(lambda: client.get(f"/history/?page_size={page_size}"), repeat=50, warmup=3),
+        "keyset_deep_page": measure(
+            lambda: client.get(f"/history/?after={cursor}&page_size={page_size}"), repeat=50, warmup=3
+        ),
+        "offset_deep_page_query": measure(
+            lambda: list(keyset_qs[depth:depth + page_size]), repeat=5, warmup=1
+        ),
+        f"legacy_full_render_{legacy_rows}_rows": measure(legacy_render, repeat=3, warmup=0),
+    }
+
+
+def int_list(value):
+    """Suite parameter given as a comma-separated string (--set sizes=1,10,100)."""
+    if isinstance(value, int):
+        return [value]
+    return [int(v) for v in str(value).split(",") if v.strip()]
+
+
+def repeats_for(rows, budget=200000, low=3, high=200):
+    """Fewer repeats for bigger batches, so each size takes similar time."""
+    return max(low, min(high, budget // max(rows, 1)))
+
+
+def random_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.round(rng.uniform(4, 10, n), 2), np.round(rng.uniform(50, 2000, n), 1)
+
+
+@suite("predict_view")
+def bench_predict_view(repeat=300):
+    """Single-reading POST /predict/ through the test client.
+
+    "repeated" posts one reading (prediction cache hits after the first),
+    "distinct" a new reading every time (cache misses, so the model and the
+    analytics run); "logged_in" adds the history write.
+    """
+    user = make_user("bench-predict-view")
+    anonymous = make_client()
+    logged_in = make_client(user)
+    ph, tds = random_readings(3 * (repeat + 10), seed=1)
+    readings = iter(zip(ph.tolist(), tds.tolist()))
+
+    def post_distinct(client):
+        p, t = next(readings)
+        return client.post("/predict/", {"ph": p, "tds": t})
+
+    return {
+        "repeated": measure(lambda: anonymous.post("/predict/", {"ph": 7.2, "tds": 310}), repeat),
+        "distinct": measure(lambda: post_distinct(anonymous), repeat),
+        "logged_in_distinct": measure(lambda: post_distinct(logged_in), repeat),
+    }
+
+
+@suite("model")
+def bench_model(sizes="1,10,100,1000,10000,100000"):
+    """Raw model calls per batch size: sklearn predict/predict_proba, the
+    compiled forest, and whichever predictor the request path picks."""
+    from .views import get_model_bundle
+
+    bundle = get_model_bundle()
+    model = bundle.model
+    results = {"model_version": bundle.version}
+    for size in int_list(sizes):
+        ph, tds = random_readings(size, seed=size)
+        X = np.column_stack([ph, tds])
+        repeat = repeats_for(size)
+        timings = {
+            "sklearn_predict": measure(lambda: model.predict(X), repeat, warmup=1),
+            "sklearn_predict_proba": measure(lambda: model.predict_proba(X), repeat, warmup=1),
+        }
+        if bundle.compiled is not None:
+            timings["compiled_predict_proba"] = measure(
+                lambda: bundle.compiled.predict_proba(X), repeat, warmup=1
+            )
+        predictor = bundle.predictor(size)
+        timings["request_path_predict_proba"] = measure(lambda: predictor.predict_proba(X), repeat, warmup=1)
+        timings["request_path_predictor"] = type(predictor).__name__
+        for timing in timings.values():
+            if isinstance(timing, dict):
+                timing["per_row_us"] = round(timing["per_call_ms"] * 1000 / size, 4)
+        results[f"batch_{size}"] = timings
+    return results
+
+
+@suite("analytics")
+def bench_analytics(sizes="1,100,10000", repeat=2000):
+    """Rule-engine analytics: the per-reading path (analyze_one and the
+    scalar helpers in views) and the vectorized ``analyze`` per batch size."""
+    from . import views
+    from .rules import get_rule_engine
+
+    engine = get_rule_engine()
+    ph, tds = random_readings(repeat, seed=2)
+    pairs = list(zip(ph.tolist(), tds.tolist()))
+    readings = iter(pairs * 20)
+
+    def scalar_helpers():
+        p, t = next(readings)
+        views.calculate_quality_index(p, t)
+        views.calculate_parameter_contribution(p, t)
+        views.check_compliance(p, t)
+        views.get_health_risk_profile(p, t)
+        views.get_action_cards("Safe", p, t)
+
+    results = {
+        "analyze_one": measure(lambda: engine.analyze_one(*next(readings), "Moderate"), repeat),
+        "scalar_helpers": measure(scalar_helpers, repeat),
+    }
+    labels = np.array(["Safe", "Moderate", "Contaminated"])
+    for size in int_list(sizes):
+        ph, tds = random_readings(size, seed=size)
+        results_labels = labels[np.arange(size) % 3].tolist()
+        timing = measure(lambda: engine.analyze(ph, tds, results_labels), repeats_for(size, 100000), warmup=1)
+        timing["per_row_us"] = round(timing["per_call_ms"] * 1000 / size, 4)
+        results[f"analyze_batch_{size}"] = timing
+    return results
+
+
+@suite("history_insert")
+def bench_history_insert(rows=5000, single_rows=500):
+    """PredictionHistory insert throughput: one ORM create (and transaction)
+    per row, one bulk_create, and write_history_rows (bulk_create plus the
+    daily summary update, what the views use)."""
+    from .history import write_history_rows
+    from .models import PredictionHistory
+
+    user = make_user("bench-insert")
+    ph, tds = random_readings(rows, seed=3)
+    labels = np.array(["Safe", "Moderate", "Contaminated"])[np.arange(rows) % 3].tolist()
+
+    def make_rows(n):
+        return [
+            PredictionHistory(user=user, ph_input=p, tds_input=t, result=r, model_version="bench")
+            for p, t, r in zip(ph[:n].tolist(), tds[:n].tolist(), labels[:n])
+        ]
+
+    def timed(fn, n):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        return {"rows": n, "total_s": round(elapsed, 4), "rows_per_s": round(n / elapsed, 1)}
+
+    per_row = make_rows(single_rows)
+    results = {
+        "orm_create_per_row": timed(lambda: [row.save() for row in per_row], single_rows),
+        "bulk_create": timed(lambda: PredictionHistory.objects.bulk_create(make_rows(rows)), rows),
+        "write_history_rows": timed(lambda: write_history_rows(make_rows(rows)), rows),
+    }
+    return results
+
+
+@suite("history_view")
+def bench_history_view(row_counts="10,1000,100000", repeat=30):
+    """GET /history/ (first page plus the per-result summary) for users with
+    each of ``row_counts`` history rows."""
+    from .summary import rebuild_summaries
+
+    results = {}
+    for rows in int_list(row_counts):
+        user = make_user(f"bench-history-view-{rows}")
+        seed_history(user, rows)
+        rebuild_summaries(user)
+        client = make_client(user)
+        results[f"rows_{rows}"] = measure(lambda: client.get("/history/"), repeat, warmup=3)
+    return results
+
+
+PAGES = {"home": "/", "login": "/login/", "register": "/register/", "predict": "/predict/"}
+
+
+@suite("pages")
+def bench_pages(repeat=300):
+    """GET of the mostly static pages, anonymous (without cookies, like a
+    first visit, and as a returning visitor revalidating its copy with
+    If-None-Match) and logged in (GET /predict/)."""
+    from django.core.cache import cache
+
+    cache.clear()
+    client = make_client()
+
+    def first_visit(url):
+        client.cookies.clear()
+        return client.get(url)
+
+    results = {}
+    for name, url in PAGES.items():
+        returning = make_client()
+        etag = returning.get(url).get("ETag")
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        results[name] = {
+            "bytes": len(first_visit(url).content),
+            "first_visit": measure(lambda: first_visit(url), repeat),
+            "revalidate": measure(lambda: returning.get(url, **headers), repeat),
+            "revalidate_status": returning.get(url, **headers).status_code,
+        }
+    logged_in = make_client(make_user("bench-pages"))
+    results["predict_logged_in"] = measure(lambda: logged_in.get("/predict/"), repeat)
+    return results
+
+
+# SQLite as Django leaves it: rollback journal, fsync on every commit, and
+# sqlite3's default 5 s busy timeout
+DEFAULT_SQLITE_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def _stress_worker(args):
+    """One forked "gunicorn worker": single-row history writes, as sync-mode
+    predict requests make them, plus a history page read every few writes."""
+    from .history import write_history_rows
+    from .models import PredictionHistory
+
+    user_id, rows, read_every, reconnect, seed = args
+    rng = np.random.default_rng(seed)
+    latencies, locked = [], 0
+    for i in range(rows):
+        start = time.perf_counter()
+        try:
+            write_history_rows([PredictionHistory(
+                user_id=user_id, ph_input=round(float(rng.uniform(4, 10)), 2),
+                tds_input=round(float(rng.uniform(50, 2000)), 1), result="Safe", model_version="bench",
+            )])
+            if read_every and i % read_every == 0:
+                list(PredictionHistory.objects.filter(user_id=user_id)
+                     .order_by("-prediction_date", "-id")[:50].values_list("id", "result"))
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+        latencies.append(time.perf_counter() - start)
+        if reconnect:
+            connection.close()  # CONN_MAX_AGE=0: a new connection per request
+    connections.close_all()
+    return latencies, locked
+
+
+@suite("sqlite_concurrency")
+def bench_sqlite_concurrency(processes=4, rows=300, read_every=5):
+    """Concurrent history writes from ``processes`` forked workers, with
+    Django's default SQLite setup (one connection per request, rollback
+    journal) and with the tuned one (persistent connection, SQLITE_PRAGMAS).
+
+    Runs on a database file of its own: switching the journal mode needs the
+    file to itself, and threads of earlier suites (history writer, async
+    executors) keep their connections to the shared one open.
+    """
+    from .db import current_pragmas
+
+    results = {"processes": processes}
+    with throwaway_database():
+        users = [make_user(f"bench-sqlite-{i}") for i in range(processes)]
+        configs = {
+            "default": (DEFAULT_SQLITE_PRAGMAS, True),
+            "tuned": (settings.SQLITE_PRAGMAS, False),
+        }
+        for name, (pragmas, reconnect) in configs.items():
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                # Only this thread has the file open: close, then reconnect
+                # with the new PRAGMAs to switch its journal mode
+                connections.close_all()
+                in_effect = current_pragmas(connection)
+                connections.close_all()
+                work = [(user.pk, rows, read_every, reconnect, seed) for seed, user in enumerate(users)]
+                start = time.perf_counter()
+                with multiprocessing.get_context("fork").Pool(processes) as pool:
+                    outcomes = pool.map(_stress_worker, work)
+                wall = time.perf_counter() - start
+            latencies = [t for worker_latencies, _ in outcomes for t in worker_latencies]
+            summary = latency_summary(latencies, wall)
+            results[name] = {
+                "pragmas": in_effect,
+                "rows_per_s": summary.pop("req_per_s"),
+                **summary,
+                "locked_errors": sum(locked for _, locked in outcomes),
+            }
+    results["speedup"] = round(results["tuned"]["rows_per_s"] / results["default"]["rows_per_s"], 2)
+    return results
+
+
+# -------------------------
+# Saved results and baselines
+# -------------------------
+# Leaves compared against a baseline: latencies (lower is better) and
+# throughputs (higher is better). Setup figures (seed_s) and figures derived
+# from a compared one (total_s, per_s, per_row_us) are left out.
+LOWER_IS_BETTER = ("_ms",)
+HIGHER_IS_BETTER = ("rows_per_s", "req_per_s")
+
+
+def environment():
+    """What a run depends on, saved next to its results."""
+    import platform
+
+    import django
+    import sklearn
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "django": django.get_version(),
+        "database": connection.vendor,
+    }
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{path}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(results, baseline, threshold):
+    """(path, baseline, current, slowdown, regressed) for every compared leaf.
+
+    The slowdown is positive when the current run is worse, e.g. 0.25 for a
+    latency 25% higher or a throughput 20% lower; a row regresses when its
+    slowdown exceeds ``threshold``.
+    """
+    before = dict(flatten(baseline))
+    rows = []
+    for path, now in flatten(results):
+        old = before.get(path)
+        if old is None or old == 0 or now == 0:
+            continue
+        leaf = path.rsplit(".", 1)[-1]
+        if leaf.endswith(LOWER_IS_BETTER):
+            slowdown = now / old - 1
+        elif leaf.endswith(HIGHER_IS_BETTER):
+            slowdown = old / now - 1
+        else:
+            continue
+        rows.append((path, old, now, slowdown, slowdown > threshold))
+    return rows
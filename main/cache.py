@@ -0,0 +1,170 @@
+"""
+Memoizing cache for prediction payloads.
+
+Users keep submitting the same handful of readings, so the full analytics
+payload for a reading is cached under its (pH, TDS) and the model version
+that produced it. Only readings that are exact at ``PH_DECIMALS`` /
+``TDS_DECIMALS`` (what meters report) are cached. Finer readings bypass the
+cache and are scored as submitted, never rounded: at a limit, rounding changes
+the verdict (pH 8.504 is out of range, 8.50 is not). A cached payload is
+therefore always exactly what an uncached request would compute.
+
+Configured by ``settings.PREDICTION_CACHE``::
+
+    PREDICTION_CACHE = {
+        "BACKEND": "local",      # "local" (in-process LRU), "django" or "none"
+        "MAX_ENTRIES": 4096,     # local backend only
+        "ALIAS": "default",      # django backend only: which CACHES entry
+        "TIMEOUT": 3600,         # django backend only
+        "PH_DECIMALS": 2,
+        "TDS_DECIMALS": 1,
+    }
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import PREDICTION_CACHE_ENTRIES, PREDICTION_CACHE_REQUESTS, get_metrics
+
+
+class LocalLRUBackend:
+    """Bounded in-process dict with least-recently-used eviction."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """Store payloads in one of the project's CACHES (shared across workers)."""
+
+    def __init__(self, alias="default", timeout=3600):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, items):
+        self.cache.set_many(items, timeout=self.timeout)
+
+    def clear(self):
+        # Keys carry the model version, so stale entries are never read and
+        # age out through TIMEOUT; other users of this cache are left alone.
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class PredictionCache:
+    def __init__(self, backend, ph_decimals=2, tds_decimals=1):
+        self.backend = backend
+        self.ph_decimals = ph_decimals
+        self.tds_decimals = tds_decimals
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._version = None
+
+    def cacheable(self, ph, tds):
+        """Whether a reading is exact at the configured precision."""
+        return round(ph, self.ph_decimals) == ph and round(tds, self.tds_decimals) == tds
+
+    def key(self, version, ph, tds):
+        return f"prediction:{version}:{ph!r}:{tds!r}"
+
+    def _check_version(self, version):
+        if version != self._version:
+            # A new model was swapped in: nothing cached for the old one is valid
+            self.backend.clear()
+            self._version = version
+
+    def get_or_compute_many(self, version, readings, compute):
+        """Payloads for (ph, tds) ``readings``, calling ``compute`` on misses only.
+
+        ``compute(missing)`` receives the list of uncached (ph, tds) pairs and
+        must return their payloads in the same order. Readings finer than the
+        configured precision are always computed and never stored.
+        """
+        self._check_version(version)
+        keys = [self.key(version, ph, tds) if self.cacheable(ph, tds) else None for ph, tds in readings]
+        found = self.backend.get_many(list({k for k in keys if k is not None}))
+
+        n_bypassed = keys.count(None)
+        n_missed = sum(1 for k in keys if k is not None and k not in found)
+        self.bypassed += n_bypassed
+        self.misses += n_missed
+        self.hits += len(keys) - n_missed - n_bypassed
+
+        missing = list(dict.fromkeys(r for r, k in zip(readings, keys) if k not in found))
+        computed = dict(zip(missing, compute(missing))) if missing else {}
+        self.backend.set_many({k: computed[r] for r, k in zip(readings, keys) if k is not None and k not in found})
+        return [found[k] if k in found else computed[r] for r, k in zip(readings, keys)]
+
+    def collect(self):
+        """Series for main.metrics (read at scrape time, not per lookup)."""
+        return [
+            ("counter", PREDICTION_CACHE_REQUESTS, {"result": "hit"}, self.hits),
+            ("counter", PREDICTION_CACHE_REQUESTS, {"result": "miss"}, self.misses),
+            ("counter", PREDICTION_CACHE_REQUESTS, {"result": "bypass"}, self.bypassed),
+            ("gauge", PREDICTION_CACHE_ENTRIES, {}, len(self.backend)),
+        ]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.backend),
+        }
+
+
+_CACHE = None
+
+
+def get_prediction_cache():
+    """The configured PredictionCache, or None when caching is disabled."""
+    global _CACHE
+    if _CACHE is None:
+        conf = getattr(settings, "PREDICTION_CACHE", {})
+        backend_name = conf.get("BACKEND", "local")
+        if backend_name == "none":
+            _CACHE = False
+        else:
+            if backend_name == "django":
+                backend = DjangoCacheBackend(conf.get("ALIAS", "default"), conf.get("TIMEOUT", 3600))
+            else:
+                backend = LocalLRUBackend(conf.get("MAX_ENTRIES", 4096))
+            _CACHE = PredictionCache(backend, conf.get("PH_DECIMALS", 2), conf.get("TDS_DECIMALS", 1))
+            get_metrics().register_collector(_CACHE.collect)
+    return _CACHE or None
@@ -0,0 +1,294 @@
+"""
+Compressed forest: pruned, deduplicated and quantized, in a flat binary file.
+
+Built from a ``CompiledForest`` by ``manage.py compress_model``:
+
+* depth cap: subtrees below ``max_depth`` are replaced by a leaf holding the
+  class distribution of the node they hang from (the depth is chosen so that
+  no label changes on a validation grid);
+* float32 thresholds, rounded down to the nearest float32 so that float32
+  inputs take exactly the branch they took against the float64 threshold;
+* leaf distributions quantized to uint8 or uint16 (each row sums exactly to
+  the scale, so probabilities still sum to 1);
+* deduplication: identical leaves and subtrees are stored once, splits whose
+  two branches are identical are dropped, and identical trees become a single
+  root with a weight.
+
+The ``.forest`` file is a 64-byte header followed by every array at an 8-byte
+aligned offset; one ``np.frombuffer`` call with a structured dtype maps all of
+them without copying or unpickling.
+"""
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from .forest import CompiledForest
+
+MAGIC = b"WQRF"
+FORMAT_VERSION = 1
+# magic, version, n_features, n_classes, depth, leaf_bits, n_nodes, n_values,
+# n_roots, sha256 of the source artifact
+HEADER = struct.Struct("<4sHHHHHIII32s")
+HEADER_SIZE = 64
+LEAF_DTYPES = {8: np.uint8, 16: np.uint16}
+
+
+def _index_dtype(n):
+    return np.uint16 if n < 2 ** 16 else np.uint32
+
+
+def _layout(n_classes, leaf_bits, n_nodes, n_values, n_roots):
+    """Structured dtype describing the file body (everything after the header)."""
+    index = _index_dtype(n_nodes)
+    fields = [
+        ("classes", np.int64, (n_classes,)),
+        ("roots", np.uint32, (n_roots,)),
+        ("weights", np.uint32, (n_roots,)),
+        ("feature", np.uint8, (n_nodes,)),
+        ("threshold", np.float32, (n_nodes,)),
+        ("children", index, (2 * n_nodes,)),
+        ("value_index", _index_dtype(n_values), (n_nodes,)),
+        ("values", LEAF_DTYPES[leaf_bits], (n_values, n_classes)),
+    ]
+    names, formats, offsets = [], [], []
+    offset = 0
+    for name, dtype, shape in fields:
+        names.append(name)
+        formats.append((dtype, shape))
+        offsets.append(offset)
+        size = np.dtype((dtype, shape)).itemsize
+        offset += size + (-size % 8)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": offset})
+
+
+def round_down_float32(threshold):
+    """Largest float32 <= ``threshold`` (element-wise)."""
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+def quantize_distributions(proba, leaf_bits):
+    """Integer rows summing exactly to 2**bits - 1 (largest remainder rounding)."""
+    scale = (1 << leaf_bits) - 1
+    scaled = proba * scale
+    q = np.floor(scaled).astype(np.int64)
+    shortfall = scale - q.sum(axis=1)
+    order = np.argsort(-(scaled - q), axis=1, kind="stable")
+    for k in range(proba.shape[1]):
+        q[np.arange(len(q)), order[:, k]] += (shortfall > k)
+    return q.astype(LEAF_DTYPES[leaf_bits])
+
+
+def node_depths(compiled):
+    depth = np.full(len(compiled.feature), -1, dtype=np.intp)
+    frontier = np.unique(compiled.roots)
+    level = 0
+    while frontier.size:
+        depth[frontier] = level
+        kids = compiled.children.reshape(-1, 2)[frontier].ravel()
+        frontier = np.unique(kids[depth[kids] == -1])
+        level += 1
+    return depth
+
+
+class CompressedForest(CompiledForest):
+    """CompiledForest variant over the compressed arrays (see module docstring)."""
+
+    ARRAYS = ("feature", "threshold", "children", "value_index", "values", "roots", "weights", "classes_")
+
+    def __init__(self, feature, threshold, children, value_index, values, roots, weights,
+                 classes_, depth, n_features=2, leaf_bits=8, source_sha256=None):
+        super().__init__(feature, threshold, children, None, roots, classes_, depth)
+        self.n_features_in_ = n_features
+        self.value_index = value_index
+        self.values = values
+        self.weights = weights
+        self.leaf_bits = leaf_bits
+        self.source_sha256 = source_sha256
+        self.n_estimators = int(np.sum(weights))
+        # Dequantized once; there are only a few distinct leaf distributions
+        self.table = values.astype(np.float64) / ((1 << leaf_bits) - 1)
+        # Native-width working copies for the walk (a few KB, built in microseconds)
+        self._node_children = children.astype(np.intp)
+        self._node_feature = feature.astype(np.intp)
+        self._node_threshold = threshold.astype(np.float64)
+
+    # ---- building ----
+    @classmethod
+    def from_compiled(cls, compiled, max_depth=None, leaf_bits=8, source_sha256=None):
+        max_depth = compiled.depth if max_depth is None else min(max_depth, compiled.depth)
+        depth = node_depths(compiled)
+        pairs = compiled.children.reshape(-1, 2)
+        is_leaf = pairs[:, 0] == np.arange(len(pairs))
+        stops = is_leaf | (depth >= max_depth)
+
+        quantized = quantize_distributions(compiled.value, leaf_bits)
+        thresholds = round_down_float32(compiled.threshold)
+
+        value_ids, node_ids = {}, {}
+        feature, threshold, children, value_index, height = [], [], [], [], []
+
+        def emit(key, feat, thr, left, right, vid):
+            if key not in node_ids:
+                new = len(feature)
+                node_ids[key] = new
+                feature.append(feat)
+                threshold.append(thr)
+                if left is None:
+                    children.extend((new, new))
+                    height.append(0)
+                else:
+                    children.extend((left, right))
+                    height.append(1 + max(height[left], height[right]))
+                value_index.append(vid)
+            return node_ids[key]
+
+        memo = {}
+
+        def canonical(node):
+            # Bottom-up: a node's key is built from its children's new ids
+            stack = [(node, False)]
+            while stack:
+                i, expanded = stack.pop()
+                if i in memo:
+                    continue
+                if stops[i]:
+                    row = quantized[i].tobytes()
+                    vid = value_ids.setdefault(row, len(value_ids))
+                    memo[i] = emit(("leaf", vid), 0, np.float32(np.inf), None, None, vid)
+                    continue
+                left, right = int(pairs[i, 0]), int(pairs[i, 1])
+                if not expanded:
+                    stack.append((i, True))
+                    stack.extend(((right, False), (left, False)))
+                    continue
+                l_id, r_id = memo[left], memo[right]
+                if l_id == r_id:
+                    memo[i] = l_id  # both branches answer the same
+                else:
+                    memo[i] = emit(("split", int(compiled.feature[i]), thresholds[i].tobytes(), l_id, r_id),
+                                   int(compiled.feature[i]), thresholds[i], l_id, r_id, 0)
+            return memo[node]
+
+        tree_roots = [canonical(int(r)) for r in compiled.roots]
+        roots, weights = np.unique(np.asarray(tree_roots, dtype=np.uint32), return_counts=True)
+
+        n_nodes = len(feature)
+        values = np.frombuffer(b"".join(value_ids), dtype=LEAF_DTYPES[leaf_bits]).reshape(
+            len(value_ids), compiled.n_classes_
+        )
+        return cls(
+            feature=np.asarray(feature, dtype=np.uint8),
+            threshold=np.asarray(threshold, dtype=np.float32),
+            children=np.asarray(children, dtype=_index_dtype(n_nodes)),
+            value_index=np.asarray(value_index, dtype=_index_dtype(len(values))),
+            values=values,
+            roots=roots,
+            weights=weights.astype(np.uint32),
+            classes_=np.asarray(compiled.classes_),
+            # Shared subtrees sit at different depths, so walk the longest path
+            depth=max(height[r] for r in tree_roots),
+            n_features=int(compiled.feature.max()) + 1,
+            leaf_bits=leaf_bits,
+            source_sha256=source_sha256,
+        )
+
+    # ---- serialization ----
+    def to_bytes(self):
+        n_nodes, n_values = len(self.feature), len(self.values)
+        layout = _layout(self.n_classes_, self.leaf_bits, n_nodes, n_values, len(self.roots))
+        body = np.zeros(1, dtype=layout)
+        for name in layout.names:
+            body[name] = getattr(self, "classes_" if name == "classes" else name)
+        header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, self.n_features_in_, self.n_classes_, self.depth, self.leaf_bits,
+            n_nodes, n_values, len(self.roots),
+            bytes.fromhex(self.source_sha256) if self.source_sha256 else b"\0" * 32,
+        )
+        return header.ljust(HEADER_SIZE, b"\0") + body.tobytes()
+
+    def save(self, path):
+        Path(path).write_bytes(self.to_bytes())
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        magic, version, n_features, n_classes, depth, leaf_bits, n_nodes, n_values, n_roots, sha = (
+            HEADER.unpack_from(buffer)
+        )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a compressed forest file (or an unsupported format version)")
+        layout = _layout(n_classes, leaf_bits, n_nodes, n_values, n_roots)
+        body = np.frombuffer(buffer, dtype=layout, count=1, offset=HEADER_SIZE)[0]
+        return cls(
+            feature=body["feature"], threshold=body["threshold"], children=body["children"],
+            value_index=body["value_index"], values=body["values"], roots=body["roots"],
+            weights=body["weights"], classes_=body["classes"], depth=depth,
+            n_features=n_features, leaf_bits=leaf_bits,
+            source_sha256=sha.hex() if any(sha) else None,
+        )
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_bytes(Path(path).read_bytes())
+
+    @staticmethod
+    def path_for(model_path):
+        return Path(model_path).with_suffix(".forest")
+
+    # ---- inference ----
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def apply(self, X):
+        """Leaf reached under every distinct root, shape (n_roots, n_samples)."""
+        X = self._as_input(X)
+        n_samples, n_features = X.shape
+        flat = X.ravel()
+        row_offset = np.tile(np.arange(n_samples) * n_features, len(self.roots))
+        node = np.repeat(self.roots.astype(np.intp), n_samples)
+        for _ in range(self.depth):
+            go_right = flat[row_offset + self._node_feature[node]] > self._node_threshold[node]
+            node = self._node_children[2 * node + go_right]
+        return node.reshape(len(self.roots), n_samples)
+
+    def predict_proba(self, X, chunk_size=4096):
+        X = self._as_input(X)
+        proba = np.empty((X.shape[0], self.n_classes_), dtype=np.float64)
+        weights = self.weights.astype(np.float64)
+        for start in range(0, X.shape[0], chunk_size):
+            leaves = self.apply(X[start:start + chunk_size])
+            proba[start:start + chunk_size] = np.tensordot(weights, self.table[self.value_index[leaves]], axes=1)
+        proba /= self.n_estimators
+        return proba
+
+
+def validation_grid(ph_range=(0.0, 14.0), ph_step=0.05, tds_range=(0.0, 3000.0), tds_step=5.0):
+    ph = np.arange(ph_range[0], ph_range[1] + ph_step / 2, ph_step)
+    tds = np.arange(tds_range[0], tds_range[1] + tds_step / 2, tds_step)
+    return np.column_stack([np.repeat(ph, len(tds)), np.tile(tds, len(ph))])
+
+
+def choose_depth(compiled, X, max_label_changes=0, leaf_bits=8, log=None):
+    """Depth cap for ``compress``: scanning down from the full depth while at
+    most ``max_label_changes`` labels on ``X`` differ from the original, keep
+    the cap giving the fewest nodes (then the shallowest walk).
+
+    Truncated subtrees become leaves with mixed distributions, which
+    deduplicate worse than the pure leaves below them, so a lower cap is not
+    automatically a smaller file.
+    """
+    reference = compiled.predict(X)
+    best = (len(compiled.feature), compiled.depth)
+    for depth in range(compiled.depth, 0, -1):
+        candidate = CompressedForest.from_compiled(compiled, max_depth=depth, leaf_bits=leaf_bits)
+        changed = int(np.sum(candidate.predict(X) != reference))
+        if log:
+            log(f"  depth {depth:>2}: {len(candidate.feature):>5} nodes, {changed} label changes")
+        if changed > max_label_changes:
+            break
+        best = min(best, (len(candidate.feature), depth))
+    return best[1]
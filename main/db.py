@@ -0,0 +1,51 @@
+"""
+SQLite connection tuning, applied to every new connection.
+
+``configure_sqlite`` runs on Django's ``connection_created`` signal (wired up
+in ``MainConfig.ready``) and issues the PRAGMAs in ``settings.SQLITE_PRAGMAS``:
+
+* ``journal_mode=WAL``: readers no longer block the writer (or the other way
+  round), and a commit appends to the log instead of rewriting pages;
+* ``synchronous=NORMAL``: in WAL mode, fsync at checkpoints rather than on
+  every commit; a power loss can drop the last commits but not corrupt the file;
+* ``busy_timeout``: a writer waits this long (ms) for the lock instead of
+  failing with "database is locked";
+* ``mmap_size`` / ``cache_size``: read through a memory map and keep more
+  pages cached per connection.
+
+With ``CONN_MAX_AGE`` the connection, and so this setup, is reused across
+requests instead of being repeated on every one.
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_PRAGMA_NAME = re.compile(r"^[a-z_]+$")
+_PRAGMA_VALUE = re.compile(r"^-?\w+$")
+
+
+def pragma_statements(pragmas):
+    statements = []
+    for name, value in pragmas.items():
+        if not _PRAGMA_NAME.match(str(name)) or not _PRAGMA_VALUE.match(str(value)):
+            raise ImproperlyConfigured(f"Invalid SQLITE_PRAGMAS entry: {name}={value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    for statement in pragma_statements(getattr(settings, "SQLITE_PRAGMAS", {})):
+        connection.connection.execute(statement)
+
+
+def current_pragmas(connection, names=("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size")):
+    """The values in effect on ``connection`` (for checks and benchmarks)."""
+    with connection.cursor() as cursor:
+        values = {}
+        for name in names:
+            cursor.execute(f"PRAGMA {name}")
+            values[name] = cursor.fetchone()[0]
+    return values
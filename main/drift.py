@@ -0,0 +1,283 @@
+"""
+Input drift monitor: do production readings still look like the training data?
+
+Every reading answered by ``predict_one`` / ``predict_batch`` (cache hits
+included) is counted into fixed-bin histograms of pH and TDS plus predicted
+class counts, per model version. The bins never change, so each worker's
+sketch is a few hundred integers per version whatever the traffic, and
+sketches from several workers merge by adding counts. They travel in the
+worker snapshots of ``main.metrics`` (``METRICS_DIR``), so ``/api/drift``
+reports all live gunicorn workers, like ``/metrics`` does.
+
+``drift_report`` compares each version's sketch with the same histograms of
+the training data (``DRIFT_REFERENCE_DATA``, water_quality.csv by default)
+without reading PredictionHistory:
+
+* PSI (population stability index) over ten groups of bins holding about a
+  tenth of the training data each; below 0.1 is stable, above 0.25 a
+  significant shift;
+* the two-sample Kolmogorov-Smirnov statistic, exact at the bin edges, with
+  its asymptotic p-value;
+* quantiles interpolated within bins, and class shares with their own PSI.
+"""
+import os
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from scipy.special import kolmogorov
+
+from .metrics import get_metrics
+
+# Bin edges; a value lands in slot bisect_right(edges, value), so slot 0 is
+# below the first edge and the last slot at or above the last one
+PH_EDGES = np.round(np.arange(0, 14.01, 0.1), 1)
+TDS_EDGES = np.concatenate([np.arange(0, 2000, 20), np.arange(2000, 10001, 200)]).astype(float)
+FEATURES = {"ph": PH_EDGES, "tds": TDS_EDGES}
+
+PSI_GROUPS = 10
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+SECTION = "drift"
+
+
+class DriftSketch:
+    """Histograms of one model version's inputs and its class counts."""
+
+    __slots__ = ("count", "ph", "tds", "classes")
+
+    def __init__(self):
+        self.count = 0
+        self.ph = [0] * (len(PH_EDGES) + 1)
+        self.tds = [0] * (len(TDS_EDGES) + 1)
+        self.classes = {}
+
+    def to_dict(self):
+        return {"count": self.count, "ph": list(self.ph), "tds": list(self.tds), "classes": dict(self.classes)}
+
+
+class DriftMonitor:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._ph_edges = PH_EDGES.tolist()
+        self._tds_edges = TDS_EDGES.tolist()
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._sketches = {}
+
+    def _sketch(self, version):
+        sketch = self._sketches.get(version)
+        if sketch is None:
+            sketch = self._sketches[version] = DriftSketch()
+        return sketch
+
+    def observe(self, version, ph, tds, label):
+        """Count one reading (a couple of bisects under the lock)."""
+        if not self.enabled:
+            return
+        ph_slot = bisect_right(self._ph_edges, ph)
+        tds_slot = bisect_right(self._tds_edges, tds)
+        with self._lock:
+            sketch = self._sketch(version)
+            sketch.count += 1
+            sketch.ph[ph_slot] += 1
+            sketch.tds[tds_slot] += 1
+            sketch.classes[label] = sketch.classes.get(label, 0) + 1
+
+    def observe_many(self, version, ph, tds, labels):
+        if not self.enabled or len(labels) == 0:
+            return
+        ph_counts = bin_counts(np.asarray(ph, dtype=float), PH_EDGES).tolist()
+        tds_counts = bin_counts(np.asarray(tds, dtype=float), TDS_EDGES).tolist()
+        names, counts = np.unique(np.asarray(labels, dtype=object).astype(str), return_counts=True)
+        with self._lock:
+            sketch = self._sketch(version)
+            sketch.count += len(labels)
+            sketch.ph = [a + b for a, b in zip(sketch.ph, ph_counts)]
+            sketch.tds = [a + b for a, b in zip(sketch.tds, tds_counts)]
+            for name, n in zip(names.tolist(), counts.tolist()):
+                sketch.classes[name] = sketch.classes.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return {version: sketch.to_dict() for version, sketch in self._sketches.items()}
+
+    def _after_fork(self):
+        # Readings scored in the master before forking stay the master's
+        self._init_state()
+
+
+def bin_counts(values, edges):
+    return np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+
+
+def merge_sketches(snapshots):
+    """{version: sketch dict} summed over worker snapshots."""
+    merged = {}
+    for sections in snapshots:
+        for version, sketch in sections.items():
+            into = merged.setdefault(version, {
+                "count": 0, "ph": [0] * len(sketch["ph"]), "tds": [0] * len(sketch["tds"]), "classes": {},
+            })
+            into["count"] += sketch["count"]
+            into["ph"] = [a + b for a, b in zip(into["ph"], sketch["ph"])]
+            into["tds"] = [a + b for a, b in zip(into["tds"], sketch["tds"])]
+            for name, n in sketch["classes"].items():
+                into["classes"][name] = into["classes"].get(name, 0) + n
+    return merged
+
+
+def collect_sketches():
+    """Merged sketches of this process and, with METRICS_DIR, every worker."""
+    return merge_sketches(snap.get("sections", {}).get(SECTION, {}) for snap in get_metrics().snapshots())
+
+
+# ---- comparison ----
+def psi_groups(reference):
+    """Slot -> group index, grouping adjacent slots so that each group holds
+    about 1/PSI_GROUPS of the reference counts."""
+    shares = np.cumsum(reference) / max(reference.sum(), 1)
+    return np.minimum((shares * PSI_GROUPS - 1e-9).astype(int).clip(0), PSI_GROUPS - 1)
+
+
+def psi(reference, live, groups=None):
+    """Population stability index of ``live`` against ``reference`` counts."""
+    reference, live = np.asarray(reference, dtype=float), np.asarray(live, dtype=float)
+    if groups is not None:
+        reference = np.bincount(groups, weights=reference)
+        live = np.bincount(groups, weights=live, minlength=len(reference))
+    # A floor on the shares keeps empty groups finite
+    p = np.maximum(reference / max(reference.sum(), 1), 1e-4)
+    q = np.maximum(live / max(live.sum(), 1), 1e-4)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks(reference, live):
+    """(statistic, p-value) of the two-sample KS test on binned counts."""
+    reference, live = np.asarray(reference, dtype=float), np.asarray(live, dtype=float)
+    n, m = reference.sum(), live.sum()
+    statistic = float(np.max(np.abs(np.cumsum(reference) / n - np.cumsum(live) / m)))
+    effective = n * m / (n + m)
+    return statistic, float(kolmogorov(statistic * np.sqrt(effective)))
+
+
+def quantiles(counts, edges, qs=QUANTILES):
+    """Quantiles from binned counts, linear within a bin; values beyond the
+    outer edges are reported as the edge."""
+    counts = np.asarray(counts, dtype=float)
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    if total == 0:
+        return {f"p{round(q * 100):02d}": None for q in qs}
+    out = {}
+    for q in qs:
+        target = q * total
+        slot = int(np.searchsorted(cumulative, target, side="left"))
+        if slot == 0:
+            value = edges[0]
+        elif slot >= len(edges):
+            value = edges[-1]
+        else:
+            before = cumulative[slot - 1]
+            fraction = (target - before) / counts[slot] if counts[slot] else 0.0
+            value = edges[slot - 1] + fraction * (edges[slot] - edges[slot - 1])
+        out[f"p{round(q * 100):02d}"] = round(float(value), 2)
+    return out
+
+
+def psi_status(value):
+    if value >= PSI_SIGNIFICANT:
+        return "significant"
+    if value >= PSI_MODERATE:
+        return "moderate"
+    return "stable"
+
+
+@lru_cache(maxsize=4)
+def _reference(path, mtime_ns):
+    from .training import load_training_data
+    from .views import get_label_map
+
+    X, y = load_training_data(path)
+    label_map = get_label_map()
+    classes = {}
+    for code, n in zip(*np.unique(y.to_numpy(), return_counts=True)):
+        name = label_map.get(int(code), str(code))
+        classes[name] = int(n)
+    return {
+        "path": str(path),
+        "count": int(len(y)),
+        "ph": bin_counts(X["pH"].to_numpy(dtype=float), PH_EDGES),
+        "tds": bin_counts(X["TDS"].to_numpy(dtype=float), TDS_EDGES),
+        "classes": classes,
+    }
+
+
+def reference_distribution(path=None):
+    """Binned training data (cached until the file changes)."""
+    path = Path(path or getattr(settings, "DRIFT_REFERENCE_DATA", settings.BASE_DIR / "water_quality.csv"))
+    return _reference(path, path.stat().st_mtime_ns)
+
+
+def compare(reference, sketch, min_samples=100):
+    report = {"count": sketch["count"], "features": {}}
+    enough = sketch["count"] >= min_samples
+    for feature, edges in FEATURES.items():
+        ref, live = reference[feature], np.asarray(sketch[feature])
+        entry = {"quantiles": quantiles(live, edges), "reference_quantiles": quantiles(ref, edges)}
+        if enough:
+            value = psi(ref, live, psi_groups(ref))
+            statistic, p_value = ks(ref, live)
+            entry.update(psi=round(value, 4), status=psi_status(value), ks=round(statistic, 4),
+                         ks_p_value=round(p_value, 6))
+        else:
+            entry["status"] = "insufficient data"
+        report["features"][feature] = entry
+
+    names = sorted(set(reference["classes"]) | set(sketch["classes"]))
+    ref_counts = np.array([reference["classes"].get(name, 0) for name in names], dtype=float)
+    live_counts = np.array([sketch["classes"].get(name, 0) for name in names], dtype=float)
+    classes = {
+        "shares": {name: round(float(n / max(live_counts.sum(), 1)), 4) for name, n in zip(names, live_counts)},
+        "reference_shares": {name: round(float(n / ref_counts.sum()), 4) for name, n in zip(names, ref_counts)},
+    }
+    if enough:
+        value = psi(ref_counts, live_counts)
+        classes.update(psi=round(value, 4), status=psi_status(value))
+    else:
+        classes["status"] = "insufficient data"
+    report["classes"] = classes
+    return report
+
+
+def drift_report(version=None, min_samples=None):
+    """Every monitored version (or just ``version``) against the training data."""
+    reference = reference_distribution()
+    min_samples = min_samples if min_samples is not None else getattr(settings, "DRIFT_MIN_SAMPLES", 100)
+    sketches = collect_sketches()
+    if version is not None:
+        sketches = {version: sketches[version]} if version in sketches else {}
+    return {
+        "reference": {"path": reference["path"], "count": reference["count"]},
+        "thresholds": {"psi_moderate": PSI_MODERATE, "psi_significant": PSI_SIGNIFICANT,
+                       "min_samples": min_samples},
+        "versions": {v: compare(reference, sketch, min_samples) for v, sketch in sorted(sketches.items())},
+    }
+
+
+_MONITOR = None
+
+
+def get_drift_monitor():
+    global _MONITOR
+    if _MONITOR is None:
+        _MONITOR = DriftMonitor(enabled=getattr(settings, "DRIFT_MONITOR_ENABLED", True))
+        get_metrics().register_section(SECTION, _MONITOR.snapshot)
+        os.register_at_fork(after_in_child=_MONITOR._after_fork)
+    return _MONITOR
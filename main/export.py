@@ -0,0 +1,137 @@
+"""
+Streaming export of prediction history as CSV or NDJSON.
+
+Rows are read with ``.iterator(chunk_size=...)`` and written out in blocks of
+``EXPORT_CHUNK_SIZE`` rows, so memory stays flat however many rows match.
+The same generators back the HTML download (``/history/export/``), the API
+(``/api/history/export``) and ``manage.py export_history``.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import PredictionHistory
+
+EXPORT_COLUMNS = ("id", "username", "prediction_date", "ph", "tds", "result", "model_version")
+_FIELDS = ("id", "user__username", "prediction_date", "ph_input", "tds_input", "result", "model_version")
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# ``user`` value with which staff export every user's history
+ALL_USERS = "all"
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_export_filters(params):
+    """(start, end, result) from query params ``start``/``end`` (YYYY-MM-DD,
+    both inclusive) and ``result``; raises ValueError."""
+    days = []
+    for name in ("start", "end"):
+        raw = params.get(name)
+        day = parse_date(raw) if raw else None
+        if raw and day is None:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD).")
+        days.append(day)
+    return days[0], days[1], params.get("result") or None
+
+
+def export_owner(requester, params):
+    """Whose history ``requester`` may export (None: every user's).
+
+    Everyone gets their own by default. Staff may name another user with
+    ``user``, or ask for the whole table with ``user=all``.
+    """
+    username = params.get("user")
+    if not requester.is_staff or not username:
+        return requester
+    if username == ALL_USERS:
+        return None
+    owner = User.objects.filter(username=username).first()
+    if owner is None:
+        raise ValueError(f"No user named {username!r}.")
+    return owner
+
+
+def export_queryset(user=None, start=None, end=None, result=None):
+    rows = PredictionHistory.objects.all()
+    if user is not None:
+        rows = rows.filter(user=user)
+    if start is not None:
+        rows = rows.filter(prediction_date__gte=_day_start(start))
+    if end is not None:
+        rows = rows.filter(prediction_date__lt=_day_start(end + timedelta(days=1)))
+    if result:
+        rows = rows.filter(result=result)
+    # Per-user exports follow the (user, prediction_date, id) index; full
+    # exports walk the primary key
+    order = ("prediction_date", "id") if user is not None else ("id",)
+    return rows.order_by(*order).values_list(*_FIELDS)
+
+
+def _chunked(queryset, chunk_size):
+    block = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        block.append(row)
+        if len(block) >= chunk_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def iter_csv(queryset, chunk_size=None, header=True):
+    chunk_size = chunk_size or getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for block in _chunked(queryset, chunk_size):
+        writer.writerows(
+            (pk, username, date.isoformat(), ph, tds, result, version)
+            for pk, username, date, ph, tds, result, version in block
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(queryset, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    for block in _chunked(queryset, chunk_size):
+        yield "".join(
+            dumps({
+                "id": pk, "username": username, "prediction_date": date.isoformat(),
+                "ph": ph, "tds": tds, "result": result, "model_version": version,
+            }) + "\n"
+            for pk, username, date, ph, tds, result, version in block
+        )
+
+
+def iter_export(queryset, fmt, chunk_size=None):
+    if fmt == "csv":
+        return iter_csv(queryset, chunk_size)
+    if fmt == "ndjson":
+        return iter_ndjson(queryset, chunk_size)
+    raise ValueError("format must be 'csv' or 'ndjson'.")
+
+
+def streaming_export_response(queryset, fmt, filename="prediction-history"):
+    response = StreamingHttpResponse(iter_export(queryset, fmt), content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,116 @@
+"""
+Flat-array evaluator for the deployed RandomForestClassifier.
+
+sklearn's ``predict_proba`` validates its input and dispatches to every tree
+separately, which dominates the cost of scoring a single (pH, TDS) reading.
+``CompiledForest`` packs all trees into a handful of NumPy node arrays and
+walks them together, producing the same probabilities as the original model.
+"""
+import numpy as np
+
+
+class CompiledForest:
+    """All trees of a fitted forest packed into contiguous node arrays.
+
+    Node ``i`` of the packed forest splits on ``feature[i]`` at
+    ``threshold[i]`` and continues to ``children[2 * i]`` (left) or
+    ``children[2 * i + 1]`` (right). Leaves point back at themselves, so
+    walking ``depth`` steps always ends on a leaf, whose class distribution
+    is ``value[i]``.
+    """
+
+    ARRAYS = ("feature", "threshold", "children", "value", "roots", "classes_")
+
+    def __init__(self, feature, threshold, children, value, roots, classes_, depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes_
+        self.depth = int(depth)
+        self.n_estimators = len(roots)
+        self.n_classes_ = len(classes_)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compile a fitted sklearn forest (or a single decision tree)."""
+        estimators = getattr(model, "estimators_", None) or [model]
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        depth = 0
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n)
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            pairs = np.empty((n, 2), dtype=np.intp)
+            pairs[:, 0] = np.where(is_leaf, own, tree.children_left + offset)
+            pairs[:, 1] = np.where(is_leaf, own, tree.children_right + offset)
+            children.append(pairs.ravel())
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(proba / normalizer)
+
+            roots.append(offset)
+            depth = max(depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes_=np.asarray(model.classes_),
+            depth=depth,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def _as_input(self, X):
+        # sklearn evaluates trees on float32 input; cast the same way so that
+        # values sitting exactly on a threshold take the same branch.
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return X
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_trees, n_samples)."""
+        X = self._as_input(X)
+        n_samples, n_features = X.shape
+        flat = X.ravel()
+        # Walk every (tree, sample) pair at once as one flat vector of nodes.
+        row_offset = np.tile(np.arange(n_samples) * n_features, self.n_estimators)
+        node = np.repeat(self.roots, n_samples)
+        for _ in range(self.depth):
+            go_right = flat[row_offset + self.feature[node]] > self.threshold[node]
+            node = self.children[2 * node + go_right]
+        return node.reshape(self.n_estimators, n_samples)
+
+    def predict_proba(self, X, chunk_size=4096):
+        """Class probabilities, identical to the source forest's ``predict_proba``.
+
+        Rows are walked ``chunk_size`` at a time to bound the size of the
+        (n_trees, n_samples, n_classes) leaf-value gather.
+        """
+        X = self._as_input(X)
+        proba = np.empty((X.shape[0], self.n_classes_), dtype=np.float64)
+        for start in range(0, X.shape[0], chunk_size):
+            leaves = self.apply(X[start:start + chunk_size])
+            # Summing over the tree axis adds tree by tree, like sklearn does.
+            proba[start:start + chunk_size] = self.value[leaves].sum(axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -0,0 +1,143 @@
+"""
+Precomputed (pH, TDS) decision grid.
+
+The model only ever sees two bounded, meter-quantized inputs, so its whole
+decision surface fits in a small 2D table. ``DecisionGrid`` stores the class
+probabilities at every grid point in a ``.npy`` file (memory-mapped on load,
+so every worker shares the same pages) plus a JSON sidecar describing the
+axes. Readings are answered by rounding to the nearest grid point; anything
+outside the grid falls back to the exact model.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .inference import model_input
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _axis(start, stop, step):
+    return start + step * np.arange(int(round((stop - start) / step)) + 1)
+
+
+class DecisionGrid:
+    """Class-probability table over evenly spaced pH and TDS axes."""
+
+    def __init__(self, proba, ph_min, ph_step, tds_min, tds_step, classes_, model_sha256=None):
+        self.proba = proba
+        self.ph_min = float(ph_min)
+        self.ph_step = float(ph_step)
+        self.tds_min = float(tds_min)
+        self.tds_step = float(tds_step)
+        self.classes_ = np.asarray(classes_)
+        self.model_sha256 = model_sha256
+
+    @classmethod
+    def build(cls, model, ph_range=(0.0, 14.0), ph_step=0.01, tds_range=(0.0, 3000.0),
+              tds_step=1.0, chunk_size=65536, model_sha256=None):
+        """Evaluate ``model`` at every grid point, one pH row block at a time."""
+        ph_axis = _axis(ph_range[0], ph_range[1], ph_step)
+        tds_axis = _axis(tds_range[0], tds_range[1], tds_step)
+        n_classes = len(model.classes_)
+        proba = np.empty((len(ph_axis), len(tds_axis), n_classes), dtype=np.float32)
+
+        rows_per_chunk = max(1, chunk_size // len(tds_axis))
+        for start in range(0, len(ph_axis), rows_per_chunk):
+            ph_block = ph_axis[start:start + rows_per_chunk]
+            X = np.column_stack([
+                np.repeat(ph_block, len(tds_axis)),
+                np.tile(tds_axis, len(ph_block)),
+            ])
+            proba[start:start + len(ph_block)] = model.predict_proba(model_input(model, X)).reshape(
+                len(ph_block), len(tds_axis), n_classes
+            )
+
+        return cls(proba, ph_range[0], ph_step, tds_range[0], tds_step,
+                   model.classes_, model_sha256=model_sha256)
+
+    @staticmethod
+    def meta_path(path):
+        return Path(path).with_suffix(".json")
+
+    def save(self, path):
+        np.save(path, self.proba)
+        meta = {
+            "ph_min": self.ph_min,
+            "ph_step": self.ph_step,
+            "tds_min": self.tds_min,
+            "tds_step": self.tds_step,
+            "shape": list(self.proba.shape),
+            "classes": self.classes_.tolist(),
+            "model_sha256": self.model_sha256,
+        }
+        self.meta_path(path).write_text(json.dumps(meta, indent=2))
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        meta = json.loads(cls.meta_path(path).read_text())
+        proba = np.load(path, mmap_mode=mmap_mode)
+        return cls(proba, meta["ph_min"], meta["ph_step"], meta["tds_min"], meta["tds_step"],
+                   meta["classes"], model_sha256=meta.get("model_sha256"))
+
+    @property
+    def ph_max(self):
+        return self.ph_min + self.ph_step * (self.proba.shape[0] - 1)
+
+    @property
+    def tds_max(self):
+        return self.tds_min + self.tds_step * (self.proba.shape[1] - 1)
+
+    def lookup(self, ph, tds):
+        """Grid probabilities for each reading, plus a mask of in-range rows."""
+        ph = np.asarray(ph, dtype=float)
+        tds = np.asarray(tds, dtype=float)
+        i = np.rint((ph - self.ph_min) / self.ph_step)
+        j = np.rint((tds - self.tds_min) / self.tds_step)
+        inside = (i >= 0) & (i < self.proba.shape[0]) & (j >= 0) & (j < self.proba.shape[1])
+        proba = np.zeros((ph.size, self.proba.shape[2]), dtype=np.float64)
+        if inside.any():
+            proba[inside] = self.proba[i[inside].astype(np.intp), j[inside].astype(np.intp)]
+        return proba, inside
+
+
+class GridPredictor:
+    """Answer from the decision grid, falling back to ``model`` off-grid."""
+
+    def __init__(self, grid, model):
+        self.grid = grid
+        self.model = model
+        self.classes_ = model.classes_
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=float).reshape(-1, 2)
+        proba, inside = self.grid.lookup(X[:, 0], X[:, 1])
+        if not inside.all():
+            proba[~inside] = self.model.predict_proba(model_input(self.model, X[~inside]))
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def measure_disagreement(grid, model, X):
+    """Compare grid lookups with the exact model on the in-range rows of ``X``."""
+    X = np.asarray(X, dtype=float).reshape(-1, 2)
+    approx, inside = grid.lookup(X[:, 0], X[:, 1])
+    X, approx = X[inside], approx[inside]
+    if not len(X):
+        return {"rows": 0, "max_abs_diff": 0.0, "label_mismatch": 0.0}
+    exact = model.predict_proba(model_input(model, X))
+    return {
+        "rows": int(len(X)),
+        "max_abs_diff": float(np.max(np.abs(approx - exact))),
+        "label_mismatch": float(np.mean(np.argmax(approx, axis=1) != np.argmax(exact, axis=1))),
+    }
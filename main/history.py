@@ -0,0 +1,182 @@
+"""
+Write-behind buffer for PredictionHistory rows.
+
+Views hand finished rows to ``get_history_writer().submit(...)`` and return
+immediately. A daemon thread flushes the buffer with one ``bulk_create`` in a
+single transaction once ``HISTORY_FLUSH_ROWS`` rows are waiting or the oldest
+row has waited ``HISTORY_FLUSH_MS``, so SQLite sees one fsync'd write per batch
+instead of one per prediction. The buffer is flushed at interpreter exit and
+from gunicorn's ``worker_exit`` hook; a hard kill loses at most one interval.
+
+``HISTORY_WRITE_MODE`` selects how the sync views store history: "sync"
+writes on the request (durable once the response is sent), "buffered" goes
+through this writer. The async endpoint always uses the writer.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .metrics import HISTORY_QUEUE_DEPTH, HISTORY_ROWS, HISTORY_WRITE_SECONDS, get_metrics
+from .models import PredictionHistory
+from .summary import apply_to_summaries
+
+logger = logging.getLogger(__name__)
+
+
+def write_history_rows(rows):
+    """Insert history rows and fold them into the daily summaries atomically."""
+    metrics = get_metrics()
+    with metrics.timer(HISTORY_WRITE_SECONDS), transaction.atomic():
+        PredictionHistory.objects.bulk_create(rows)
+        apply_to_summaries(rows)
+    metrics.inc(HISTORY_ROWS, len(rows), status="written")
+
+
+class HistoryWriter:
+    def __init__(self, flush_rows=200, flush_ms=250, max_buffer=20000):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_ms / 1000.0
+        self.max_buffer = max_buffer
+        self._init_state()
+
+    def _init_state(self):
+        self._buffer = []
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, daemon=True, name="history-writer")
+            self._thread.start()
+
+    def submit(self, rows):
+        """Buffer unsaved PredictionHistory instances for insertion."""
+        if not rows:
+            return
+        overflow = None
+        with self._cond:
+            self._ensure_started()
+            self._buffer.extend(rows)
+            if len(self._buffer) > self.max_buffer:
+                # Writer cannot keep up: the caller writes this batch itself
+                # (so async callers must submit from a sync thread)
+                overflow, self._buffer = self._buffer, []
+            elif len(self._buffer) >= self.flush_rows:
+                self._cond.notify()
+        if overflow:
+            self._write(overflow)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._buffer) >= self.flush_rows or self._stopping,
+                    timeout=self.flush_interval,
+                )
+                rows, self._buffer = self._buffer, []
+                self._inflight += len(rows)
+                stopping = self._stopping
+            if rows:
+                self._write(rows)
+                with self._cond:
+                    self._inflight -= len(rows)
+                    self._cond.notify_all()
+            if stopping:
+                return
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        try:
+            close_old_connections()
+            write_history_rows(rows)
+            self.rows_written += len(rows)
+        except Exception:
+            # Do not break prediction if history save fails
+            self.rows_failed += len(rows)
+            get_metrics().inc(HISTORY_ROWS, len(rows), status="failed")
+            logger.exception("Failed to save %d history rows", len(rows))
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+        self.last_flush_seconds = elapsed
+
+    def flush(self, timeout=10.0):
+        """Write everything buffered so far before returning."""
+        with self._cond:
+            rows, self._buffer = self._buffer, []
+        if rows:
+            self._write(rows)
+        with self._cond:
+            self._cond.wait_for(lambda: self._inflight == 0, timeout=timeout)
+
+    def close(self, timeout=10.0):
+        """Stop the writer thread, flushing what is left (shutdown path)."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            thread.join(timeout)
+        self.flush(timeout)
+
+    @property
+    def queue_depth(self):
+        return len(self._buffer) + self._inflight
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "flushes": self.flushes,
+            "flush_seconds_avg": self.flush_seconds_total / self.flushes if self.flushes else 0.0,
+            "flush_seconds_max": self.flush_seconds_max,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+    def _after_fork(self):
+        # Rows buffered in the parent belong to the parent
+        self._init_state()
+
+
+_WRITER = None
+
+
+def get_history_writer():
+    global _WRITER
+    if _WRITER is None:
+        _WRITER = HistoryWriter(
+            flush_rows=getattr(settings, "HISTORY_FLUSH_ROWS", 200),
+            flush_ms=getattr(settings, "HISTORY_FLUSH_MS", 250),
+            max_buffer=getattr(settings, "HISTORY_MAX_BUFFER", 20000),
+        )
+        os.register_at_fork(after_in_child=_WRITER._after_fork)
+        atexit.register(shutdown_history_writer)
+        get_metrics().register_collector(
+            lambda: [("gauge", HISTORY_QUEUE_DEPTH, {}, _WRITER.queue_depth)]
+        )
+    return _WRITER
+
+
+def shutdown_history_writer():
+    if _WRITER is not None:
+        _WRITER.close()
+
+
+def history_is_buffered():
+    return getattr(settings, "HISTORY_WRITE_MODE", "sync") == "buffered"
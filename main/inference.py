@@ -0,0 +1,58 @@
+"""
+One model evaluation per reading.
+
+Every scoring path (predict_view, the JSON API, batch scoring, history rows,
+score_csv) goes through ``infer``: a single ``predict_proba`` call whose
+result carries the label (argmax over ``classes_``, as sklearn's own
+``predict`` computes it), the class probabilities and the confidence.
+Calling ``predict`` and then ``predict_proba`` would walk every tree twice.
+"""
+import numpy as np
+import pandas as pd
+
+
+class InferenceResult:
+    """Outcome of one model pass over ``n`` readings."""
+
+    def __init__(self, classes, proba=None, predictions=None):
+        self.classes = np.asarray(classes)
+        self.proba = proba
+        if predictions is None:
+            predictions = self.classes[np.argmax(proba, axis=1)]
+        self.predictions = np.asarray(predictions)
+
+    def __len__(self):
+        return len(self.predictions)
+
+    def labels(self, label_map):
+        """Display labels ("Safe", ...) for each reading."""
+        return [label_map.get(int(p), str(p)) for p in self.predictions.tolist()]
+
+    def probabilities(self):
+        """Per-reading probability lists, or None for each reading without them."""
+        if self.proba is None:
+            return [None] * len(self)
+        return self.proba.tolist()
+
+    def confidence(self):
+        """Probability of the predicted class in percent (2 decimals), or "N/A"."""
+        if self.proba is None:
+            return ["N/A"] * len(self)
+        return np.round(np.max(self.proba, axis=1) * 100, 2).tolist()
+
+
+def model_input(model, X):
+    """``X`` as the model expects it (sklearn warns when a model fitted on
+    named columns is given a bare array)."""
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None:
+        return pd.DataFrame(np.asarray(X, dtype=float).reshape(-1, len(names)), columns=names)
+    return X
+
+
+def infer(model, X):
+    """Evaluate ``model`` once on readings ``X`` (rows of pH, TDS)."""
+    X = model_input(model, X)
+    if hasattr(model, "predict_proba"):
+        return InferenceResult(model.classes_, proba=model.predict_proba(X))
+    return InferenceResult(getattr(model, "classes_", ()), predictions=model.predict(X))
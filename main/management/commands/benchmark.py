@@ -0,0 +1,81 @@
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import SUITES, compare, environment, throwaway_database
+
+
+class Command(BaseCommand):
+    help = "Run performance benchmarks against a throwaway test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("suites", nargs="*", help=f"Suites to run (default: all): {', '.join(SUITES)}")
+        parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                            help="Override a suite parameter, e.g. --set rows=100000")
+        parser.add_argument("--output", "-o", default=None, help="Save the run as JSON to this file")
+        parser.add_argument("--baseline", default=None,
+                            help="Saved run to compare against; regressions fail the command")
+        parser.add_argument("--threshold", type=float, default=20.0,
+                            help="Allowed slowdown against the baseline, in percent (default 20)")
+
+    def handle(self, *args, **options):
+        names = options["suites"] or list(SUITES)
+        unknown = [n for n in names if n not in SUITES]
+        if unknown:
+            raise CommandError(f"Unknown suite(s): {', '.join(unknown)}")
+
+        params = {}
+        for item in options["set"]:
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"--set expects KEY=VALUE, got {item!r}")
+            params[key] = int(value) if value.lstrip("-").isdigit() else value
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                baseline = json.loads(Path(options["baseline"]).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        results = {}
+        with throwaway_database():
+            run = {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "environment": environment(),
+                "params": params,
+            }
+            for name in names:
+                self.stderr.write(f"Running {name}...")
+                accepted = SUITES[name].__code__.co_varnames[:SUITES[name].__code__.co_argcount]
+                results[name] = SUITES[name](**{k: v for k, v in params.items() if k in accepted})
+        run["results"] = results
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(run, indent=2) + "\n")
+            self.stderr.write(f"Saved results to {options['output']}")
+        self.stdout.write(json.dumps(results, indent=2))
+
+        if baseline is not None:
+            self.check_baseline(results, baseline, options["threshold"])
+
+    def check_baseline(self, results, baseline, threshold):
+        if baseline.get("environment") and baseline["environment"] != environment():
+            self.stderr.write(self.style.WARNING(
+                "Baseline was recorded in a different environment; differences may not be regressions"
+            ))
+        rows = compare(results, baseline.get("results", baseline), threshold / 100)
+        if not rows:
+            raise CommandError("No measurements in common with the baseline")
+        self.stderr.write(f"\n{'measurement':60}{'baseline':>12}{'current':>12}{'change':>9}")
+        for path, old, now, slowdown, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            self.stderr.write(f"{path:60}{old:>12g}{now:>12g}{slowdown:>+9.1%}{flag}")
+        regressions = [row for row in rows if row[4]]
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} of {len(rows)} measurements regressed by more than {threshold:g}%"
+            )
+        self.stderr.write(self.style.SUCCESS(f"{len(rows)} measurements within {threshold:g}% of the baseline"))
@@ -0,0 +1,103 @@
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.compress import CompressedForest, choose_depth, validation_grid
+from main.forest import CompiledForest
+from main.grid import file_sha256
+from main.registry import MODEL_FILENAME, get_registry
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def single_row_us(model, X):
+    readings = [row.reshape(1, -1) for row in X]
+    return best_of(lambda: [model.predict_proba(r) for r in readings], repeat=3) / len(readings) * 1e6
+
+
+class Command(BaseCommand):
+    help = "Write a pruned, deduplicated, quantized .forest file next to a model artifact"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-version", default=None,
+                            help="Registry version to compress (default: the promoted model)")
+        parser.add_argument("--leaf-bits", type=int, choices=(8, 16), default=8)
+        parser.add_argument("--max-depth", type=int, default=None,
+                            help="Fixed depth cap (default: chosen on the validation grid)")
+        parser.add_argument("--max-label-changes", type=int, default=0,
+                            help="Label changes on the validation grid allowed when choosing the depth")
+        parser.add_argument("--ph-step", type=float, default=0.05, help="Validation grid pH spacing")
+        parser.add_argument("--tds-step", type=float, default=5.0, help="Validation grid TDS spacing")
+        parser.add_argument("--output", default=None, help="Defaults to <artifact>.forest")
+
+    def handle(self, *args, **options):
+        registry = get_registry()
+        if options["model_version"]:
+            path = registry.root / options["model_version"] / MODEL_FILENAME
+        else:
+            path = registry.resolve_current()[1]
+        output = Path(options["output"]) if options["output"] else CompressedForest.path_for(path)
+
+        model = joblib.load(path)
+        compiled = CompiledForest.from_sklearn(model)
+        data = pd.read_csv(settings.BASE_DIR / "water_quality.csv")
+        X_data, y_data = data[["pH", "TDS"]].to_numpy(), data["label"].to_numpy()
+        X_val = np.vstack([validation_grid(ph_step=options["ph_step"], tds_step=options["tds_step"]), X_data])
+
+        depth = options["max_depth"]
+        if depth is None:
+            self.stdout.write(f"Choosing depth cap on {len(X_val)} validation readings:")
+            depth = choose_depth(compiled, X_val, options["max_label_changes"], options["leaf_bits"],
+                                 log=self.stdout.write)
+
+        forest = CompressedForest.from_compiled(
+            compiled, max_depth=depth, leaf_bits=options["leaf_bits"], source_sha256=file_sha256(path),
+        )
+        forest.save(output)
+
+        # ---- report ----
+        loaded = CompressedForest.load(output)
+        reference = compiled.predict_proba(X_val)
+        proba = loaded.predict_proba(X_val)
+        original_accuracy = float(np.mean(model.predict(data[["pH", "TDS"]]) == y_data))
+        compressed_accuracy = float(np.mean(loaded.predict(X_data) == y_data))
+        sample = X_data[:300]
+        batch = X_val[:10000]
+
+        rows = [
+            ("nodes", len(compiled.feature), len(loaded.feature)),
+            ("trees (distinct roots)", compiled.n_estimators, len(loaded.roots)),
+            ("leaf distributions", "-", len(loaded.values)),
+            ("depth", compiled.depth, loaded.depth),
+            ("file size (KB)", round(path.stat().st_size / 1024, 1), round(output.stat().st_size / 1024, 1)),
+            # What ModelBundle.load does in each format
+            ("load time (ms)", round(best_of(lambda: CompiledForest.from_sklearn(joblib.load(path))) * 1000, 2),
+             round(best_of(lambda: CompressedForest.load(output)) * 1000, 3)),
+            ("1-row latency (us)", round(single_row_us(compiled, sample), 1), round(single_row_us(loaded, sample), 1)),
+            ("10k batch (ms)", round(best_of(lambda: compiled.predict_proba(batch), 3) * 1000, 1),
+             round(best_of(lambda: loaded.predict_proba(batch), 3) * 1000, 1)),
+            ("accuracy (water_quality.csv)", round(original_accuracy, 4), round(compressed_accuracy, 4)),
+        ]
+        self.stdout.write(f"\n{'':30}{'original':>12}{'compressed':>12}")
+        for name, before, after in rows:
+            self.stdout.write(f"{name:30}{before!s:>12}{after!s:>12}")
+        self.stdout.write(
+            f"\nValidation grid: {int(np.sum(proba.argmax(1) != reference.argmax(1)))} label changes, "
+            f"max |p - p_original| = {np.max(np.abs(proba - reference)):.4f}, "
+            f"accuracy delta {compressed_accuracy - original_accuracy:+.4f}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output} (serve it with ML_MODEL_FORMAT=compressed)"
+        ))
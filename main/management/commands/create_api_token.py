@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = "Issue a JSON API token for a user (the key is printed once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--name", default="", help="Label, e.g. the station or gateway id")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User not found: {options['username']}")
+        key = ApiToken.issue(user, name=options["name"])
+        self.stdout.write(key)
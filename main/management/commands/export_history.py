@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.export import export_queryset, iter_export, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = "Stream prediction history to a CSV or NDJSON file (or stdout)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout)")
+        parser.add_argument("--user", help="Only this username's history")
+        parser.add_argument("--start", help="First day to include (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last day to include (YYYY-MM-DD)")
+        parser.add_argument("--result", help="Only rows with this result, e.g. Contaminated")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Rows per database fetch (default: EXPORT_CHUNK_SIZE)")
+
+    def handle(self, *args, **options):
+        try:
+            start, end, result = parse_export_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        user = None
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        queryset = export_queryset(user, start, end, result)
+        out = open(options["output"], "w", newline="", encoding="utf-8") if options["output"] else sys.stdout
+        began = time.perf_counter()
+        lines = 0
+        try:
+            for chunk in iter_export(queryset, options["format"], options["chunk_size"]):
+                out.write(chunk)
+                lines += chunk.count("\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        if options["output"]:
+            rows = lines - 1 if options["format"] == "csv" else lines
+            self.stderr.write(f"Wrote {rows} rows to {options['output']} "
+                              f"in {time.perf_counter() - began:.2f}s")
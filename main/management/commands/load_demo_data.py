@@ -1,17 +1,81 @@
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
 from main.models import PredictionHistory
+from main.summary import rebuild_summaries
+
 
 class Command(BaseCommand):
-    help = "Load demo users and prediction history"
+    help = "Load demo users and prediction history (--rows for a large synthetic data set)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1, help="Synthetic users to spread the rows over")
+        parser.add_argument("--rows", type=int, default=0,
+                            help="Synthetic history rows to generate (default: just the demo user's two)")
+        parser.add_argument("--days", type=int, default=365, help="Period the timestamps are spread over")
+        parser.add_argument("--labels", choices=("rule", "model"), default="rule",
+                            help="Label with the training data's rule (fast) or the deployed model")
+        parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per insert transaction")
+        parser.add_argument("--model-batch-size", type=int, default=100000)
+        parser.add_argument("--user-prefix", default="loadtest")
+        parser.add_argument("--password", default="demo1234")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--no-summaries", action="store_true",
+                            help="Skip rebuilding the daily summaries of the generated users")
+
+    def handle(self, *args, **options):
+        if options["rows"] < 0:
+            raise CommandError("--rows must not be negative")
+        if options["rows"]:
+            return self.generate(options)
 
-    def handle(self, *args, **kwargs):
         if not User.objects.filter(username="demo").exists():
             demo = User.objects.create_user(username="demo", password="demo1234")
 
             PredictionHistory.objects.create(user=demo, ph_input=7.1, tds_input=310, result="Safe")
             PredictionHistory.objects.create(user=demo, ph_input=9.0, tds_input=1200, result="Contaminated")
+            rebuild_summaries(demo)
 
             self.stdout.write("Demo data loaded")
         else:
             self.stdout.write("Demo data already exists")
+
+    def generate(self, options):
+        from main.registry import get_model_bundle
+        from main.synthetic import generate_history
+
+        if options["users"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--users and --chunk-size must be positive")
+        users = self.ensure_users(options["users"], options["user_prefix"], options["password"])
+        bundle = get_model_bundle() if options["labels"] == "model" else None
+
+        def progress(done, total, elapsed):
+            rate = done / elapsed if elapsed else 0
+            eta = (total - done) / rate if rate else 0
+            self.stdout.write(f"  {done:>12,} / {total:,} rows  {rate:>9,.0f} rows/s  eta {eta:6.0f}s")
+
+        self.stdout.write(f"Generating {options['rows']:,} rows for {len(users)} users over {options['days']} days "
+                          f"({options['labels']} labels)")
+        generate_history(
+            [u.pk for u in users], options["rows"], days=options["days"], chunk_size=options["chunk_size"],
+            labels=options["labels"], bundle=bundle, model_batch_size=options["model_batch_size"],
+            seed=options["seed"], progress=progress,
+        )
+        if not options["no_summaries"]:
+            self.stdout.write("Rebuilding daily summaries...")
+            for user in users:
+                rebuild_summaries(user)
+        self.stdout.write(self.style.SUCCESS(f"Loaded {options['rows']:,} history rows"))
+
+    def ensure_users(self, count, prefix, password):
+        names = [f"{prefix}{i:06d}" for i in range(count)]
+        hashed = make_password(password)  # hashing once, not per user
+        # Existing users are skipped by the database; selecting them back by
+        # prefix avoids an IN list past SQLite's bound-variable limit
+        User.objects.bulk_create(
+            [User(username=name, password=hashed) for name in names], batch_size=1000, ignore_conflicts=True
+        )
+        wanted = set(names)
+        return [user for user in User.objects.filter(username__startswith=prefix).order_by("username")
+                if user.username in wanted]
@@ -0,0 +1,50 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from main.benchmarks import latency_summary
+
+
+class Command(BaseCommand):
+    help = "Load-test running prediction endpoints over HTTP (e.g. gunicorn vs uvicorn)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="Prediction endpoint URLs to compare")
+        parser.add_argument("--token", required=True, help="API token (manage.py create_api_token)")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        n = options["requests"]
+        bodies = [
+            json.dumps({"ph": round(float(p), 2), "tds": round(float(t), 1)}).encode()
+            for p, t in zip(rng.uniform(4, 10, n), rng.uniform(50, 2000, n))
+        ]
+        headers = {"Authorization": f"Token {options['token']}", "Content-Type": "application/json"}
+
+        results = {}
+        for url in options["urls"]:
+            errors = 0
+
+            def call(body):
+                nonlocal errors
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(urllib.request.Request(url, body, headers)) as resp:
+                        resp.read()
+                except (urllib.error.URLError, OSError):
+                    errors += 1
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                latencies = list(pool.map(call, bodies))
+            results[url] = dict(latency_summary(latencies, time.perf_counter() - start), errors=errors)
+
+        self.stdout.write(json.dumps(results, indent=2))
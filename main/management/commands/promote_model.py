@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.registry import get_registry
+
+
+class Command(BaseCommand):
+    help = "Promote a registered model version; running workers pick it up on their next poll"
+
+    def add_arguments(self, parser):
+        parser.add_argument("version", nargs="?", help="Version to promote (omit to list versions)")
+
+    def handle(self, *args, **options):
+        registry = get_registry()
+        if not options["version"]:
+            current = registry.resolve_current()[0] if registry.manifest_path.exists() else None
+            for version in registry.versions():
+                meta = registry.read_metadata(version)
+                marker = "*" if version == current else " "
+                self.stdout.write(f"{marker} {version}  accuracy={meta.get('accuracy')}  "
+                                  f"created={meta.get('created_at')}")
+            return
+
+        try:
+            registry.promote(options["version"])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Promoted {options['version']}: "
+            + json.dumps(registry.read_metadata(options["version"]), default=str)
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user daily history summaries from PredictionHistory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this username's summaries")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        start = time.perf_counter()
+        count = rebuild_summaries(user)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {count} summary rows in {time.perf_counter() - start:.2f}s"
+        ))
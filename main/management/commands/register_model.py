@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.grid import file_sha256
+from main.registry import get_registry
+
+
+class Command(BaseCommand):
+    help = "Add a trained joblib model to the model registry as a new version"
+
+    def add_arguments(self, parser):
+        parser.add_argument("artifact", help="Path to the .joblib model file")
+        parser.add_argument("--model-version", default=None, help="Version name (default: timestamp)")
+        parser.add_argument("--accuracy", type=float, default=None)
+        parser.add_argument("--training-data", default=None,
+                            help="Training CSV; its sha256 is recorded as the training hash")
+        parser.add_argument("--promote", action="store_true", help="Make this the served version")
+
+    def handle(self, *args, **options):
+        metadata = {"accuracy": options["accuracy"]}
+        if options["training_data"]:
+            metadata["training_data"] = options["training_data"]
+            metadata["training_hash"] = file_sha256(options["training_data"])
+
+        try:
+            version = get_registry().register(
+                options["artifact"], version=options["model_version"],
+                metadata=metadata, promote=options["promote"],
+            )
+        except (FileExistsError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+
+        state = "registered and promoted" if options["promote"] else "registered"
+        self.stdout.write(self.style.SUCCESS(f"Model version {version} {state}"))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import RescoreJob
+from main.registry import get_registry
+from main.rescoring import JobBusy, claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = ("Score stored history with a model version in resumable primary-key chunks "
+            "(results in HistoryScore, checkpoint in RescoreJob)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-version", default=None, help="Version to score with (default: the promoted one)")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Rows per chunk (default: RESCORE_CHUNK_SIZE)")
+        parser.add_argument("--pause", type=float, default=None,
+                            help="Seconds to sleep between chunks (default: RESCORE_PAUSE_SECONDS)")
+        parser.add_argument("--max-chunks", type=int, default=None, help="Stop after this many chunks")
+        parser.add_argument("--restart", action="store_true", help="Drop this version's scores and start over")
+        parser.add_argument("--force", action="store_true",
+                            help="Take over a job another process still appears to be running")
+        parser.add_argument("--status", action="store_true", help="List jobs and exit")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            for job in RescoreJob.objects.all():
+                self.stdout.write(f"{job.model_version:24} {job.status:8} {job.progress:6.1%}  "
+                                  f"scored={job.rows_scored} changed={job.rows_changed} "
+                                  f"last_id={job.last_id}/{job.target_id} updated={job.updated_at:%Y-%m-%d %H:%M:%S}"
+                                  + (f"  error={job.error}" if job.error else ""))
+            return
+
+        registry = get_registry()
+        try:
+            version = options["model_version"] or registry.resolve_current()[0]
+            bundle = registry.load_version(version)
+            job = claim_job(version, restart=options["restart"], force=options["force"])
+        except (FileNotFoundError, JobBusy) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Scoring history ids {job.last_id + 1}..{job.target_id} with {version}")
+        started = time.perf_counter()
+        first = job.rows_scored
+
+        def progress(job):
+            done = job.rows_scored - first
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {job.progress:6.1%}  last_id={job.last_id}  "
+                              f"{done / elapsed if elapsed else 0:,.0f} rows/s  changed={job.rows_changed}")
+
+        try:
+            job = run_job(job, bundle, chunk_size=options["chunk_size"], pause=options["pause"],
+                          max_chunks=options["max_chunks"], progress=progress)
+        except JobBusy as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        message = (f"{version}: {job.rows_scored - first} row(s) scored in {elapsed:.1f}s, "
+                   f"{job.rows_changed} of {job.rows_scored} differ from the stored result")
+        if job.status == RescoreJob.DONE:
+            self.stdout.write(self.style.SUCCESS(f"Done. {message}"))
+        else:
+            self.stdout.write(f"Paused at id {job.last_id} ({message}); run again to resume")
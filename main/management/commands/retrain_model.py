@@ -0,0 +1,203 @@
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import sklearn
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.base import clone
+
+from main.inference import model_input
+from main.registry import MODEL_FILENAME, get_registry
+from main.retraining import (
+    SOURCES, TrainingSnapshot, accuracy, base_snapshot_info, get_snapshot_dir, grow_forest, label_codes,
+    labelled_history, replay_indices,
+)
+from main.training import load_training_data, nodes_per_reading, serialized_size, single_row_latency_us
+from main.views import get_label_map
+
+
+class Command(BaseCommand):
+    help = ("Grow the promoted forest with trees fit on lab-verified history rows added since the last "
+            "retrain (warm start), keeping an appendable .npy training snapshot per label source")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", choices=SOURCES, default="lab",
+                            help="lab: rows with a lab-verified result only; history: every row, labelled "
+                                 "with the model's own result (self-training: it cannot correct the model)")
+        parser.add_argument("--data", default=None,
+                            help="CSV the snapshot starts from on the first run (default: water_quality.csv)")
+        parser.add_argument("--extra-trees", type=int, default=25, help="Trees to add to the forest")
+        parser.add_argument("--replay", type=float, default=1.0,
+                            help="Snapshot rows sampled per new row into the fit set")
+        parser.add_argument("--holdout", type=float, default=0.1,
+                            help="Share of the new rows kept out of the fit to compare old and new model")
+        parser.add_argument("--min-rows", type=int, default=100,
+                            help="Leave the watermark alone until at least this many new rows exist")
+        parser.add_argument("--max-trees", type=int, default=600,
+                            help="Refuse to grow past this many trees (use --full)")
+        parser.add_argument("--full", action="store_true",
+                            help="Refit from scratch on the whole snapshot instead of adding trees")
+        parser.add_argument("--n-estimators", type=int, default=None,
+                            help="Tree count for --full (default: the current model's)")
+        parser.add_argument("--chunk-size", type=int, default=50000, help="History rows read per query")
+        parser.add_argument("--n-jobs", type=int, default=-1, help="Tree-building threads (-1 = all cores)")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--base-version", default=None,
+                            help="Registry version to grow (default: the last retrained version, else the promoted one)")
+        parser.add_argument("--model-version", default=None, help="Registry version name (default: timestamp)")
+        parser.add_argument("--promote", action="store_true", help="Serve the new version immediately")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["source"] == "history":
+            self.stderr.write(self.style.WARNING(
+                "--source history labels each row with the model's own prediction: the new trees learn "
+                "the current model's outputs, mistakes included. Prefer --source lab."
+            ))
+        snapshot = TrainingSnapshot(get_snapshot_dir(options["source"]))
+        try:
+            with snapshot.lock():
+                self._retrain(snapshot, options, started)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+    def _ensure_snapshot(self, snapshot, data):
+        if snapshot.exists():
+            snapshot.discard()
+            return
+        data_path = Path(data or settings.BASE_DIR / "water_quality.csv")
+        try:
+            X, y = load_training_data(data_path)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        snapshot.create(X.to_numpy(), y.to_numpy(), base_snapshot_info(data_path, len(y)))
+        self.stdout.write(f"Started training snapshot {snapshot.root} with {len(y)} rows from {data_path}")
+
+    def _retrain(self, snapshot, options, started):
+        source = options["source"]
+        self._ensure_snapshot(snapshot, options["data"])
+        watermark = snapshot.watermark(source)
+
+        read_start = time.perf_counter()
+        skipped = 0
+        for X, y, mark, unlabelled in labelled_history(source, watermark, label_codes(get_label_map()),
+                                                       options["chunk_size"]):
+            snapshot.append(X, y)
+            watermark, skipped = mark, skipped + unlabelled
+        read_seconds = time.perf_counter() - read_start
+        delta = snapshot.pending
+        self.stdout.write(f"Read {delta} new {source} row(s) past watermark {snapshot.watermark(source)} "
+                          f"in {read_seconds:.2f}s" + (f" ({skipped} with unknown labels skipped)" if skipped else ""))
+        if delta < options["min_rows"]:
+            snapshot.discard()
+            self.stdout.write(f"Fewer than {options['min_rows']} new rows; nothing retrained")
+            return
+
+        registry = get_registry()
+        # Continue from the previous retrain even if it was never promoted, so
+        # the rows behind the watermark are always in the forest being grown
+        base_version = options["base_version"] or snapshot.state.get("last_version")
+        if base_version in registry.versions():
+            model_path = registry.root / base_version / MODEL_FILENAME
+            base_metadata = registry.read_metadata(base_version)
+        elif options["base_version"]:
+            raise CommandError(f"Unknown model version: {base_version}")
+        else:
+            try:
+                base_version, model_path, base_metadata = registry.resolve_current()
+            except (FileNotFoundError, KeyError) as e:
+                raise CommandError(str(e))
+        model = joblib.load(model_path)
+        if not hasattr(model, "estimators_"):
+            raise CommandError(f"Model {base_version} is a {type(model).__name__}, not a fitted forest")
+
+        rng = np.random.default_rng(options["seed"])
+        X_all, y_all = snapshot.arrays(include_pending=True)
+        new = snapshot.rows + rng.permutation(delta)
+        n_holdout = int(delta * options["holdout"])
+        holdout, fit_new = np.sort(new[:n_holdout]), np.sort(new[n_holdout:])
+        X_holdout, y_holdout = X_all[holdout], y_all[holdout]
+        base_accuracy = accuracy(model, X_holdout, y_holdout)
+
+        base_trees = len(model.estimators_)
+        if options["full"]:
+            fit_rows = np.setdiff1d(np.arange(len(y_all)), holdout, assume_unique=True)
+            replay = np.empty(0, dtype=np.int64)
+            model = clone(model).set_params(
+                n_estimators=options["n_estimators"] or base_trees, warm_start=False, n_jobs=options["n_jobs"],
+            )
+            fit_start = time.perf_counter()
+            model.fit(model_input(model, X_all[fit_rows]), y_all[fit_rows])
+            fit_seconds = time.perf_counter() - fit_start
+            model.set_params(n_jobs=None)
+        else:
+            if base_trees + options["extra_trees"] > options["max_trees"]:
+                raise CommandError(
+                    f"{base_version} has {base_trees} trees; adding {options['extra_trees']} would pass "
+                    f"--max-trees {options['max_trees']}. Refit with --full or manage.py train_model."
+                )
+            replay = replay_indices(snapshot.rows, int(len(fit_new) * options["replay"]), rng)
+            fit_rows = np.concatenate([replay, fit_new])
+            try:
+                fit_seconds = grow_forest(model, X_all[fit_rows], y_all[fit_rows],
+                                          options["extra_trees"], n_jobs=options["n_jobs"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        new_accuracy = accuracy(model, X_holdout, y_holdout)
+        self.stdout.write(
+            f"{'Refit' if options['full'] else 'Grew'} {base_version}: {base_trees} -> {len(model.estimators_)} trees "
+            f"on {len(fit_rows)} rows ({len(fit_new)} new, {len(replay)} replayed) in {fit_seconds:.2f}s; "
+            f"holdout accuracy {base_accuracy} -> {new_accuracy} ({n_holdout} rows)"
+        )
+
+        sample = np.asarray(X_all[fit_rows[:: max(1, len(fit_rows) // 2000)]])
+        metadata = {
+            "accuracy": new_accuracy,
+            "params": {"n_estimators": len(model.estimators_), "max_depth": model.max_depth},
+            "nodes_per_reading": round(nodes_per_reading(model, model_input(model, sample)), 1),
+            "single_row_us": round(single_row_latency_us(model, sample), 1),
+            "size_bytes": serialized_size(model),
+            "classes": [int(c) for c in model.classes_],
+            "training_data": str(snapshot.root),
+            "retrain": {
+                "mode": "full" if options["full"] else "warm_start",
+                "source": source,
+                "base_version": base_version,
+                "base_accuracy": base_accuracy,
+                "base_trees": base_trees,
+                "extra_trees": len(model.estimators_) - base_trees if not options["full"] else None,
+                "new_rows": int(delta),
+                "fit_rows": int(len(fit_rows)),
+                "replay_rows": int(len(replay)),
+                "holdout_rows": int(n_holdout),
+                "snapshot_rows": int(snapshot.rows + delta),
+                "watermark": watermark,
+                "read_seconds": round(read_seconds, 3),
+                "fit_seconds": round(fit_seconds, 3),
+                "base_training_data": base_metadata.get("training_data"),
+            },
+            "training_seconds": round(time.perf_counter() - started, 2),
+            "python": platform.python_version(),
+            "sklearn": sklearn.__version__,
+            "numpy": np.__version__,
+        }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            artifact = Path(tmp) / "model.joblib"
+            joblib.dump(model, artifact)
+            try:
+                version = registry.register(
+                    artifact, version=options["model_version"], metadata=metadata, promote=options["promote"],
+                )
+            except FileExistsError as e:
+                raise CommandError(str(e))
+        # The watermark only moves once the model trained on these rows is registered
+        snapshot.commit(source, watermark, last_version=version)
+        state = "registered and promoted" if options["promote"] else "registered (promote with manage.py promote_model)"
+        self.stdout.write(self.style.SUCCESS(
+            f"Model version {version} {state}; snapshot now {snapshot.rows} rows, {source} watermark {watermark}"
+        ))
@@ -0,0 +1,142 @@
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from main.inference import infer
+from main.registry import MODEL_FILENAME, ModelBundle, get_model_bundle, get_registry
+from main.views import calculate_quality_index_array, get_label_map
+
+_BUNDLE = None
+
+
+def load_bundle(version=None):
+    if version:
+        return ModelBundle.load(version, get_registry().root / version / MODEL_FILENAME)
+    return get_model_bundle()
+
+
+def _init_worker(version):
+    # Forked workers inherit the parent's bundle; spawned ones load their own
+    global _BUNDLE
+    if _BUNDLE is None:
+        _BUNDLE = load_bundle(version)
+
+
+def score_chunk(ph, tds):
+    """(labels, confidence %, WQI) for one chunk; missing, non-numeric and
+    infinite readings come back blank."""
+    valid = np.isfinite(ph) & np.isfinite(tds)
+    n = ph.size
+    labels = np.full(n, "", dtype=object)
+    confidence = np.full(n, np.nan)
+    wqi = np.full(n, np.nan)
+    if valid.any():
+        ph_ok, tds_ok = ph[valid], tds[valid]
+        inference = infer(_BUNDLE.predictor(ph_ok.size), np.column_stack([ph_ok, tds_ok]))
+        labels[valid] = inference.labels(get_label_map())
+        if inference.proba is not None:
+            # Otherwise confidence() is "N/A" for every reading: left blank
+            confidence[valid] = inference.confidence()
+        wqi[valid] = calculate_quality_index_array(ph_ok, tds_ok)
+    return labels, confidence, wqi
+
+
+def peak_memory_mb():
+    # ru_maxrss is in KiB on Linux; children covers pool workers
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return self_kb / 1024, children_kb / 1024
+
+
+class Command(BaseCommand):
+    help = "Score a (large) pH/TDS CSV file in chunks and write labels, confidence and WQI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="CSV file with pH and TDS columns")
+        parser.add_argument("--output", "-o", default=None,
+                            help="Defaults to <input>.scored.csv next to the input")
+        parser.add_argument("--chunk-size", type=int, default=100000, help="Rows per chunk")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Score chunks in this many processes (0 = in this process)")
+        parser.add_argument("--ph-column", default="pH")
+        parser.add_argument("--tds-column", default="TDS")
+        parser.add_argument("--model-version", default=None,
+                            help="Registry version to score with (default: the promoted model)")
+
+    def handle(self, *args, **options):
+        global _BUNDLE
+        source = Path(options["input"])
+        if not source.exists():
+            raise CommandError(f"No such file: {source}")
+        output = Path(options["output"] or source.with_suffix(".scored.csv"))
+        ph_col, tds_col = options["ph_column"], options["tds_column"]
+
+        try:
+            _BUNDLE = load_bundle(options["model_version"])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+
+        reader = pd.read_csv(source, chunksize=options["chunk_size"])
+        pool = None
+        if options["workers"] > 0:
+            pool = ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=_init_worker,
+                initargs=(options["model_version"],),
+            )
+
+        start = time.perf_counter()
+        rows = 0
+        pending = deque()
+        try:
+            with open(output, "w", newline="", encoding="utf-8") as out:
+                for i, chunk in enumerate(reader):
+                    if i == 0:
+                        missing = {ph_col, tds_col} - set(chunk.columns)
+                        if missing:
+                            raise CommandError(f"Missing column(s): {', '.join(sorted(missing))}")
+                    ph = pd.to_numeric(chunk[ph_col], errors="coerce").to_numpy(dtype=float)
+                    tds = pd.to_numeric(chunk[tds_col], errors="coerce").to_numpy(dtype=float)
+                    if pool is None:
+                        pending.append((chunk, score_chunk(ph, tds)))
+                    else:
+                        pending.append((chunk, pool.submit(score_chunk, ph, tds)))
+                    # Bound the chunks held in memory to what the workers can use
+                    while len(pending) > options["workers"] * 2:
+                        rows += self._write(out, *pending.popleft(), header=rows == 0)
+                        self._progress(rows, start)
+                while pending:
+                    rows += self._write(out, *pending.popleft(), header=rows == 0)
+                    self._progress(rows, start)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - start
+        own_mb, workers_mb = peak_memory_mb()
+        self.stderr.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {rows} rows with model {_BUNDLE.version} in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else 0:,.0f} rows/s) -> {output}\n"
+            f"Peak RSS: {own_mb:.0f} MB" + (f", largest worker {workers_mb:.0f} MB" if pool else "")
+        ))
+
+    def _write(self, out, chunk, scored, header):
+        labels, confidence, wqi = scored.result() if hasattr(scored, "result") else scored
+        chunk = chunk.assign(
+            prediction_result=labels,
+            confidence=confidence,
+            quality_index=pd.Series(wqi, index=chunk.index).astype("Int64"),
+        )
+        chunk.to_csv(out, header=header, index=False)
+        return len(chunk)
+
+    def _progress(self, rows, start):
+        elapsed = time.perf_counter() - start
+        self.stderr.write(f"\r{rows:,} rows  {rows / elapsed if elapsed else 0:,.0f} rows/s", ending="")
+        self.stderr.flush()
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.registry import get_registry
+from main.training import (
+    DEFAULT_SEARCH, load_training_data, parse_search_values, run_search, training_metadata,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the random forest with a parallel hyperparameter search and publish it. "
+        "Candidates are scored on an 80/20 split; the chosen parameters are then refit "
+        "on every row, so the reported test accuracy is that of the same parameters "
+        "trained without the test rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data", default=None, help="Training CSV (default: water_quality.csv)")
+        parser.add_argument("--n-estimators", default=",".join(map(str, DEFAULT_SEARCH["n_estimators"])),
+                            help="Comma-separated tree counts to search")
+        parser.add_argument("--max-depth", default=",".join(str(d).lower() for d in DEFAULT_SEARCH["max_depth"]),
+                            help="Comma-separated depths to search ('none' = unlimited)")
+        parser.add_argument("--cv", type=int, default=5, help="Cross-validation folds")
+        parser.add_argument("--n-jobs", type=int, default=-1, help="Processes/threads to use (-1 = all cores)")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--tolerance", type=float, default=0.005,
+                            help="Accept the fastest model within this much of the best CV accuracy")
+        parser.add_argument("--model-version", default=None, help="Registry version name (default: timestamp)")
+        parser.add_argument("--promote", action="store_true", help="Serve the new version immediately")
+        parser.add_argument("--output", default=None,
+                            help="Write <output> and <output>.json instead of registering, "
+                                 "e.g. the legacy ML_MODEL_PATH")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        data_path = Path(options["data"] or settings.BASE_DIR / "water_quality.csv")
+        try:
+            X, y = load_training_data(data_path)
+            search = {
+                "n_estimators": parse_search_values(options["n_estimators"]),
+                "max_depth": parse_search_values(options["max_depth"]),
+            }
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Training on {len(X)} rows from {data_path} (n_jobs={options['n_jobs']})")
+
+        model, report = run_search(
+            X, y, search=search, cv=options["cv"], n_jobs=options["n_jobs"],
+            seed=options["seed"], tolerance=options["tolerance"], log=self.stdout.write,
+        )
+        metadata = training_metadata(model, report, data_path, options["n_jobs"], started)
+        chosen = report["chosen"]
+        self.stdout.write(
+            f"Chosen {chosen['params']}: cv={chosen['cv_accuracy']:.4f} "
+            f"(best {report['best_cv_accuracy']:.4f}), test={chosen['test_accuracy']:.4f}, "
+            f"{chosen['single_row_us']:.0f}us/reading, {report['refit_size_bytes'] / 1e6:.2f} MB "
+            f"refit on {report['refit_rows']} rows"
+        )
+
+        if options["output"]:
+            output = Path(options["output"])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            tmp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+            joblib.dump(model, tmp)
+            # Replace atomically: the registry polls this file's mtime
+            os.replace(tmp, output)
+            # <output>.json alongside, extension kept: model.joblib -> model.joblib.json
+            metadata_path = output.with_name(f"{output.name}.json")
+            metadata_path.write_text(json.dumps(metadata, indent=2, default=str))
+            self.stdout.write(self.style.SUCCESS(f"Wrote {output} and {metadata_path}"))
+            return
+
+        with tempfile.TemporaryDirectory() as tmp:
+            artifact = Path(tmp) / "model.joblib"
+            joblib.dump(model, artifact)
+            try:
+                version = get_registry().register(
+                    artifact, version=options["model_version"], metadata=metadata, promote=options["promote"],
+                )
+            except FileExistsError as e:
+                raise CommandError(str(e))
+        state = "registered and promoted" if options["promote"] else "registered (promote with manage.py promote_model)"
+        self.stdout.write(self.style.SUCCESS(f"Model version {version} {state}"))
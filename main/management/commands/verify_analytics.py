@@ -0,0 +1,160 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from main import views
+from main.rules import DEFAULT_RULES, get_rule_engine
+
+
+# Golden reference: the analytics helpers as they were before the rule engine,
+# kept verbatim so the engine can be checked against them.
+def legacy_quality_index(pH, TDS):
+    if 6.5 <= pH <= 8.5:
+        ph_score = 100
+    else:
+        deviation = abs(pH - 7.5)
+        ph_score = max(0, 100 - deviation * 20)
+    if TDS <= 300:
+        tds_score = 100
+    elif TDS <= 600:
+        tds_score = 80
+    elif TDS <= 900:
+        tds_score = 60
+    elif TDS <= 1200:
+        tds_score = 40
+    else:
+        tds_score = 20
+    return int((ph_score * 0.5) + (tds_score * 0.5))
+
+
+def legacy_parameter_contribution(pH, TDS):
+    ph_deviation = abs(pH - 7.5)
+    ph_weight = ph_deviation * 10
+    if TDS <= 300:
+        tds_weight = 1
+    elif TDS <= 600:
+        tds_weight = 2
+    elif TDS <= 900:
+        tds_weight = 3
+    elif TDS <= 1200:
+        tds_weight = 4
+    else:
+        tds_weight = 5
+    total = ph_weight + (tds_weight * 10)
+    if total == 0:
+        return {"pH": 50, "TDS": 50}
+    return {"pH": round((ph_weight / total) * 100), "TDS": round(((tds_weight * 10) / total) * 100)}
+
+
+def legacy_compliance(pH, TDS):
+    return {
+        "ph_status": "Compliant" if 6.5 <= pH <= 8.5 else "Not Compliant",
+        "tds_status": "Compliant" if TDS <= 500 else "Not Compliant",
+        "who_limit_ph": "6.5–8.5",
+        "who_limit_tds": "<= 500 mg/L",
+    }
+
+
+def legacy_health_risk_profile(pH, TDS):
+    profile = []
+    if pH < 6.5:
+        profile.append("Acidic water may cause stomach irritation & corrosion.")
+    elif pH > 8.5:
+        profile.append("Alkaline water may cause skin dryness & mineral imbalance.")
+    if TDS > 900:
+        profile.append("High TDS can cause kidney stress & unpleasant taste.")
+    if len(profile) == 0:
+        profile.append("No major health risks detected.")
+    return profile
+
+
+def legacy_action_cards(result, pH, TDS):
+    cards = []
+    if result == "Safe":
+        cards.append("Water is safe. No action required.")
+    elif result == "Moderate":
+        cards.append("Consider filtration (RO/UF) before drinking.")
+    else:
+        cards.append("Avoid drinking immediately. Use RO and chemical disinfection.")
+    if pH < 6.5:
+        cards.append("Add alkaline minerals or buffering agents to balance pH.")
+    elif pH > 8.5:
+        cards.append("Use carbon filters to reduce alkalinity.")
+    if TDS > 900:
+        cards.append("Install RO purifier to remove excess dissolved solids.")
+    return cards
+
+
+def golden_inputs(random_samples):
+    """Dense pH sweep against every TDS band edge (and its neighbours), plus random readings."""
+    edges = [0.0, DEFAULT_RULES["tds_who_limit"], DEFAULT_RULES["tds_high"], *DEFAULT_RULES["tds_band_edges"]]
+    tds_points = sorted({v for e in edges for v in (np.nextafter(e, -np.inf), e, np.nextafter(e, np.inf), e + 0.01)})
+    ph_points = np.round(np.arange(-1.0, 15.0001, 0.01), 2)
+    ph_points = np.concatenate([ph_points, [np.nextafter(6.5, 0), np.nextafter(8.5, 99), 7.5]])
+    ph = np.repeat(ph_points, len(tds_points))
+    tds = np.tile(tds_points, len(ph_points))
+    rng = np.random.default_rng(0)
+    ph = np.concatenate([ph, np.round(rng.uniform(0, 14, random_samples), 2)])
+    tds = np.concatenate([tds, np.round(rng.uniform(0, 3000, random_samples), 1)])
+    results = np.array(["Safe", "Moderate", "Contaminated"])[np.arange(len(ph)) % 3]
+    return ph, tds, results.tolist()
+
+
+class Command(BaseCommand):
+    help = "Check the rule-engine analytics against the original scalar helpers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--random-samples", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        if get_rule_engine().rules != DEFAULT_RULES:
+            self.stdout.write(self.style.WARNING(
+                "WATER_QUALITY_RULES overrides the defaults; differences from the original helpers are expected"
+            ))
+        ph, tds, results = golden_inputs(options["random_samples"])
+        n = len(ph)
+
+        start = time.perf_counter()
+        expected = {
+            "quality_index": [legacy_quality_index(p, t) for p, t in zip(ph, tds)],
+            "contribution": [legacy_parameter_contribution(p, t) for p, t in zip(ph, tds)],
+            "compliance": [legacy_compliance(p, t) for p, t in zip(ph, tds)],
+            "health_risks": [legacy_health_risk_profile(p, t) for p, t in zip(ph, tds)],
+            "actions": [legacy_action_cards(r, p, t) for r, p, t in zip(results, ph, tds)],
+        }
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorized = get_rule_engine().analyze(ph, tds, results)
+        engine_s = time.perf_counter() - start
+
+        scalar = {
+            "quality_index": (views.calculate_quality_index, lambda i: (ph[i], tds[i])),
+            "contribution": (views.calculate_parameter_contribution, lambda i: (ph[i], tds[i])),
+            "compliance": (views.check_compliance, lambda i: (ph[i], tds[i])),
+            "health_risks": (views.get_health_risk_profile, lambda i: (ph[i], tds[i])),
+            "actions": (views.get_action_cards, lambda i: (results[i], ph[i], tds[i])),
+        }
+
+        failures = 0
+        for field, want in expected.items():
+            got = vectorized[field]
+            bad = [i for i in range(n) if got[i] != want[i]]
+            fn, args = scalar[field]
+            bad_scalar = [i for i in range(n) if fn(*args(i)) != want[i]]
+            failures += len(bad) + len(bad_scalar)
+            status = "ok" if not (bad or bad_scalar) else "MISMATCH"
+            self.stdout.write(f"{field:15} {status:9} array {n - len(bad)}/{n}, scalar {n - len(bad_scalar)}/{n}")
+            for i in bad[:3]:
+                self.stdout.write(f"    array  pH={ph[i]!r} TDS={tds[i]!r} result={results[i]}: "
+                                  f"expected {want[i]!r}, got {got[i]!r}")
+            for i in bad_scalar[:3]:
+                self.stdout.write(f"    scalar pH={ph[i]!r} TDS={tds[i]!r} result={results[i]}: "
+                                  f"expected {want[i]!r}, got {fn(*args(i))!r}")
+
+        self.stdout.write(f"{n} readings: original helpers {legacy_s * 1000:.0f} ms, "
+                          f"rule engine {engine_s * 1000:.0f} ms ({legacy_s / engine_s:.1f}x)")
+        if failures:
+            raise CommandError(f"{failures} analytics results differ from the original helpers")
+        self.stdout.write(self.style.SUCCESS("Rule engine matches the original analytics"))
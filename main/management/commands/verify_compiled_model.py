@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.views import get_compiled_model, get_model
+
+
+class Command(BaseCommand):
+    help = "Check that the compiled forest reproduces the model's predict_proba"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--csv",
+            default=str(settings.BASE_DIR / "water_quality.csv"),
+            help="CSV with pH and TDS columns to compare on",
+        )
+
+    def handle(self, *args, **options):
+        df = pd.read_csv(options["csv"])
+        X = df[["pH", "TDS"]]
+
+        expected = get_model().predict_proba(X)
+        actual = get_compiled_model().predict_proba(X.to_numpy())
+
+        mismatched = int(np.sum(np.any(expected != actual, axis=1)))
+        max_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+        self.stdout.write(f"Compared {len(X)} rows, max abs difference {max_diff:g}")
+        if mismatched:
+            raise CommandError(f"{mismatched} rows differ from predict_proba")
+        self.stdout.write(self.style.SUCCESS("Compiled forest matches predict_proba"))
@@ -0,0 +1,123 @@
+import asyncio
+import json
+from unittest import mock
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from main import views
+from main.benchmarks import async_client, make_client, make_user, throwaway_database
+from main.history import get_history_writer
+from main.management.commands import score_csv
+from main.models import ApiToken, PredictionHistory
+from main.registry import ModelBundle
+
+
+class CountingModel:
+    """Predictor wrapper counting how many readings the model is evaluated on."""
+
+    def __init__(self, model, tally):
+        self._model = model
+        self._tally = tally
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def _count(self, X):
+        self._tally["calls"] += 1
+        self._tally["rows"] += len(X)
+
+    def predict_proba(self, X):
+        self._count(X)
+        return self._model.predict_proba(X)
+
+    def predict(self, X):
+        self._count(X)
+        return self._model.predict(X)
+
+
+class Command(BaseCommand):
+    help = "Check that every scoring path evaluates the model exactly once per reading"
+
+    def handle(self, *args, **options):
+        tally = {"calls": 0, "rows": 0}
+        real_predictor = ModelBundle.predictor
+
+        def counting_predictor(bundle, n_rows=1):
+            return CountingModel(real_predictor(bundle, n_rows), tally)
+
+        # Fresh readings for every scenario, so the prediction cache never answers
+        rng = np.random.default_rng(0)
+        fresh = iter(zip(np.round(rng.uniform(0, 14, 10000), 2).tolist(),
+                         np.round(rng.uniform(0, 3000, 10000), 1).tolist()))
+
+        def readings(n):
+            return [next(fresh) for _ in range(n)]
+
+        with throwaway_database(), mock.patch.object(ModelBundle, "predictor", counting_predictor):
+            user = make_user("verify-inference")
+            key = ApiToken.issue(user, name="verify")
+            token = {"HTTP_AUTHORIZATION": f"Token {key}"}
+            anonymous, logged_in, api = make_client(), make_client(user), make_client()
+
+            def post_predict(client):
+                (ph, tds), = readings(1)
+                response = client.post("/predict/", {"ph": ph, "tds": tds})
+                # Every error, the view's own catch-all included, redirects
+                # back to the form with a message instead of rendering a result
+                assert response.status_code == 200, (
+                    f"status {response.status_code}, redirected to {response.get('Location')}"
+                )
+
+            def post_json(client, url, samples, **extra):
+                body = [{"ph": ph, "tds": tds} for ph, tds in samples]
+                client.post(url, json.dumps(body), content_type="application/json", **extra)
+
+            def async_predict():
+                (ph, tds), = readings(1)
+                with async_client() as client:
+                    response = asyncio.run(client.post(
+                        "/api/async/predict", {"ph": ph, "tds": tds}, content_type="application/json",
+                        headers={"Authorization": f"Token {key}"},
+                    ))
+                assert response.status_code == 200, response.content
+
+            def score_chunk():
+                ph, tds = np.array(readings(500)).T
+                score_csv._BUNDLE = views.get_model_bundle()
+                score_csv.score_chunk(ph, tds)
+
+            scenarios = [
+                ("predict_view (anonymous)", 1, lambda: post_predict(anonymous)),
+                ("predict_view (with history)", 1, lambda: post_predict(logged_in)),
+                ("api_predict", 1, lambda: api.post("/api/predict", dict(zip(("ph", "tds"), readings(1)[0])),
+                                                    content_type="application/json", **token)),
+                ("api_predict_batch, 50 readings", 50,
+                 lambda: post_json(api, "/api/predict/batch", readings(50), **token)),
+                ("api_predict_async", 1, async_predict),
+                ("predict_one", 1, lambda: views.predict_one(*readings(1)[0])),
+                ("predict_batch, 300 readings", 300, lambda: views.predict_batch(*np.array(readings(300)).T)),
+                ("score_csv chunk, 500 readings", 500, score_chunk),
+            ]
+
+            failures = 0
+            for name, expected_rows, run in scenarios:
+                tally.update(calls=0, rows=0)
+                try:
+                    run()
+                    error = None
+                except AssertionError as e:
+                    error = str(e) or "assertion failed"
+                ok = error is None and tally["rows"] == expected_rows and tally["calls"] == 1
+                failures += not ok
+                self.stdout.write(f"{name:34} {'ok' if ok else 'FAIL':5} "
+                                  f"{tally['calls']} model call(s), {tally['rows']} reading(s) evaluated "
+                                  f"for {expected_rows}" + (f"  error: {error}" if error else ""))
+
+            get_history_writer().flush()
+            saved = PredictionHistory.objects.filter(user=user).count()
+            self.stdout.write(f"history rows saved: {saved}")
+
+        if failures:
+            raise CommandError(f"{failures} scoring path(s) failed or evaluate the model more than once per reading")
+        self.stdout.write(self.style.SUCCESS("Every scoring path evaluates the model once per reading"))
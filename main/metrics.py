@@ -0,0 +1,364 @@
+"""
+Latency histograms and counters, served at ``/metrics`` in Prometheus text format.
+
+Each process keeps its own series in memory: recording one observation is a
+bucket lookup and two additions under a lock (a few microseconds), so the
+instrumentation stays on in production. Series are recorded by
+
+* ``main.middleware.request_metrics_middleware``: every request, by view,
+  method and status class;
+* ``ModelBundle.load``: model load time;
+* ``score_reading`` / ``score_readings``: model calls and analytics;
+* ``write_history_rows``: the history insert transaction;
+* ``InstrumentedDjangoTemplates`` (the TEMPLATES backend): template renders.
+
+Collectors registered by other modules (prediction cache, history writer)
+are read when a snapshot is taken, so their hot paths pay nothing. Snapshots
+also carry sections that are not Prometheus series, such as the input drift
+sketches of ``main.drift``, so they share the per-worker files below.
+
+gunicorn runs several worker processes and a scrape reaches only one of them.
+With ``METRICS_DIR`` set, every worker writes its snapshot to
+``<METRICS_DIR>/<pid>.json`` at most every ``METRICS_FLUSH_SECONDS``, and
+``/metrics`` sums the snapshots of the live workers. A worker removes its file
+on exit. A file whose process is gone (killed, or left by an earlier server
+run) is skipped and deleted. When a worker is replaced, the totals drop by its
+series; Prometheus reads that as a counter reset, which rate() and increase()
+allow for. Without ``METRICS_DIR`` the endpoint reports the process that
+answers it.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# Upper bounds (seconds); a single-reading prediction sits in the tens of
+# microseconds, a history page render in the milliseconds
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+REQUEST_SECONDS = "waterquality_http_request_duration_seconds"
+MODEL_LOAD_SECONDS = "waterquality_model_load_seconds"
+PREDICT_SECONDS = "waterquality_predict_seconds"
+ANALYTICS_SECONDS = "waterquality_analytics_seconds"
+HISTORY_WRITE_SECONDS = "waterquality_history_write_seconds"
+TEMPLATE_RENDER_SECONDS = "waterquality_template_render_seconds"
+HISTORY_ROWS = "waterquality_history_rows_total"
+HISTORY_QUEUE_DEPTH = "waterquality_history_queue_depth"
+PREDICTION_CACHE_REQUESTS = "waterquality_prediction_cache_requests_total"
+PREDICTION_CACHE_ENTRIES = "waterquality_prediction_cache_entries"
+API_TOKEN_CACHE_REQUESTS = "waterquality_api_token_cache_requests_total"
+PAGE_CACHE_REQUESTS = "waterquality_page_cache_requests_total"
+
+HELP = {
+    REQUEST_SECONDS: "Time from the first middleware to the response, by view, method and status class.",
+    MODEL_LOAD_SECONDS: "Time to load a model version and build its request-path forms.",
+    PREDICT_SECONDS: "Time spent in the model's predict/predict_proba calls, per scoring call.",
+    ANALYTICS_SECONDS: "Time spent computing the rule-engine analytics, per scoring call.",
+    HISTORY_WRITE_SECONDS: "Time of one history insert and summary update transaction.",
+    TEMPLATE_RENDER_SECONDS: "Time to render a template, by template name.",
+    HISTORY_ROWS: "PredictionHistory rows written or lost, by status.",
+    HISTORY_QUEUE_DEPTH: "History rows buffered or being written by the write-behind writer.",
+    PREDICTION_CACHE_REQUESTS: "Prediction cache requests, by result (bypass: reading finer than the cached precision).",
+    PREDICTION_CACHE_ENTRIES: "Payloads held by in-process prediction caches.",
+    API_TOKEN_CACHE_REQUESTS: "API token lookups, by result (a miss queries the database).",
+    PAGE_CACHE_REQUESTS: "Anonymous page cache lookups, by result (a miss renders the template).",
+    "waterquality_prediction_cache_hit_ratio": "Share of prediction cache lookups answered from the cache.",
+    "waterquality_api_token_cache_hit_ratio": "Share of API token lookups answered from the cache.",
+    "waterquality_page_cache_hit_ratio": "Share of anonymous page requests answered from the cache.",
+    "waterquality_metrics_workers": "Processes whose snapshot is included in this scrape.",
+}
+
+# Derived gauges: hit ratio over a counter with result="hit"/"miss"
+HIT_RATIOS = {
+    "waterquality_prediction_cache_hit_ratio": PREDICTION_CACHE_REQUESTS,
+    "waterquality_api_token_cache_hit_ratio": API_TOKEN_CACHE_REQUESTS,
+    "waterquality_page_cache_hit_ratio": PAGE_CACHE_REQUESTS,
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def _fast_key(name, labels):
+    # Recording path: keyword order is fixed per call site, so skip the sort
+    # (snapshots go through dicts and are re-keyed with _key when merged)
+    return (name, tuple(labels.items()))
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above every bucket
+        self.sum = 0.0
+
+    def observe(self, value):
+        # bisect_left: a value equal to a bound belongs to that bucket (le=)
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True, directory=None, flush_seconds=5.0):
+        self.enabled = enabled
+        self.directory = Path(directory) if directory else None
+        self.flush_seconds = flush_seconds
+        self._collectors = []
+        self._sections = {}
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._next_flush = time.monotonic() + self.flush_seconds
+
+    # ---- recording ----
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = _fast_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name, **labels):
+        """Context manager observing the time spent inside it."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = _fast_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, collect):
+        """``collect()`` returns (kind, name, labels, value) tuples, kind being
+        "counter" or "gauge"; called for every snapshot."""
+        self._collectors.append(collect)
+
+    def register_section(self, name, collect):
+        """Carry ``collect()`` (JSON-serializable) in every snapshot under
+        ``sections[name]``; not rendered, but merged by the registering module
+        from ``snapshots()`` (see main.drift)."""
+        self._sections[name] = collect
+
+    # ---- snapshots ----
+    def snapshot(self):
+        with self._lock:
+            histograms = [[name, dict(labels), list(h.counts), h.sum]
+                          for (name, labels), h in self._histograms.items()]
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+        gauges = []
+        for collect in self._collectors:
+            for kind, name, labels, value in collect():
+                (counters if kind == "counter" else gauges).append([name, labels, value])
+        return {"pid": os.getpid(), "buckets": list(DEFAULT_BUCKETS),
+                "histograms": histograms, "counters": counters, "gauges": gauges,
+                "sections": {name: collect() for name, collect in self._sections.items()}}
+
+    def flush(self):
+        """Write this process's snapshot to METRICS_DIR (no-op without one)."""
+        self._next_flush = time.monotonic() + self.flush_seconds
+        if not (self.enabled and self.directory):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def clear_directory(self):
+        """Drop snapshots left by a previous server run (gunicorn on_starting)."""
+        if self.directory and self.directory.is_dir():
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def remove_snapshot(self):
+        """Delete this process's snapshot file (gunicorn worker_exit)."""
+        if self.directory:
+            (self.directory / f"{os.getpid()}.json").unlink(missing_ok=True)
+
+    def snapshots(self):
+        """This process's snapshot plus, with METRICS_DIR, every other live worker's."""
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        found = []
+        for path in sorted(self.directory.glob("*.json")):
+            if path.stem.isdigit() and int(path.stem) != os.getpid() and not _pid_alive(int(path.stem)):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                found.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # being replaced or removed right now
+        return found
+
+    # ---- exposition ----
+    def render(self):
+        """All workers' series merged, in Prometheus text format (0.0.4)."""
+        histograms, counters, gauges = {}, {}, {}
+        snapshots = self.snapshots()
+        for snap in snapshots:
+            for name, labels, counts, total in snap["histograms"]:
+                key = _key(name, labels)
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+            for name, labels, value in snap["counters"]:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snap["gauges"]:
+                key = _key(name, labels)
+                gauges[key] = gauges.get(key, 0) + value
+
+        for ratio, counter in HIT_RATIOS.items():
+            hits = counters.get((counter, (("result", "hit"),)), 0)
+            misses = counters.get((counter, (("result", "miss"),)), 0)
+            if hits + misses:
+                gauges[(ratio, ())] = hits / (hits + misses)
+        gauges[("waterquality_metrics_workers", ())] = len(snapshots)
+
+        lines = []
+        for name, series in _by_name(histograms):
+            _header(lines, name, "histogram")
+            for labels, (counts, total) in series:
+                cumulative = 0
+                for bound, count in zip((*DEFAULT_BUCKETS, "+Inf"), counts):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else repr(float(bound))
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total!r}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name, series in _by_name(values):
+                _header(lines, name, kind)
+                for labels, value in series:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _after_fork(self):
+        # Series recorded in the master (the preload) are reported by the master
+        self._init_state()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _by_name(series):
+    grouped = {}
+    for (name, labels), value in sorted(series.items()):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped.items()
+
+
+def _header(lines, name, kind):
+    if name in HELP:
+        lines.append(f"# HELP {name} {HELP[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+_METRICS = None
+
+
+def get_metrics():
+    global _METRICS
+    if _METRICS is None:
+        _METRICS = MetricsRegistry(
+            enabled=getattr(settings, "METRICS_ENABLED", True),
+            directory=getattr(settings, "METRICS_DIR", None),
+            flush_seconds=getattr(settings, "METRICS_FLUSH_SECONDS", 5.0),
+        )
+        os.register_at_fork(after_in_child=_METRICS._after_fork)
+    return _METRICS
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with get_metrics().timer(TEMPLATE_RENDER_SECONDS, template=self.template.name or "<string>"):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates record their render time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,43 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import REQUEST_SECONDS, get_metrics
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+def _record(request, response, start):
+    metrics = get_metrics()
+    match = getattr(request, "resolver_match", None)
+    metrics.observe(
+        REQUEST_SECONDS,
+        time.perf_counter() - start,
+        # Bounded label values: the URL pattern name, never the raw path
+        view=match.view_name if match is not None else "unmatched",
+        method=request.method if request.method in KNOWN_METHODS else "other",
+        status=f"{response.status_code // 100}xx",
+    )
+    metrics.maybe_flush()
+
+
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    """Time every request (first in MIDDLEWARE, so it covers the whole stack).
+
+    Streaming responses are timed up to the point the body starts streaming.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            response = await get_response(request)
+            _record(request, response, start)
+            return response
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            response = get_response(request)
+            _record(request, response, start)
+            return response
+    return middleware
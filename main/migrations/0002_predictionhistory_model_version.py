@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionhistory',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_apitoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='predictionhistory',
+            index=models.Index(fields=['user', 'prediction_date', 'id'], name='history_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0004_predictionhistory_user_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('result', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('ph_min', models.FloatField()),
+                ('ph_max', models.FloatField()),
+                ('ph_sum', models.FloatField(default=0)),
+                ('tds_min', models.FloatField()),
+                ('tds_max', models.FloatField()),
+                ('tds_sum', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'History Daily Summary',
+                'verbose_name_plural': 'History Daily Summaries',
+                'ordering': ['-day', 'result'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='historydailysummary',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'result'), name='history_summary_user_day_result'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_historydailysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionhistory',
+            name='lab_result',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='predictionhistory',
+            name='lab_verified_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_predictionhistory_lab_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RescoreJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_version', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('target_id', models.BigIntegerField(default=0)),
+                ('rows_scored', models.PositiveBigIntegerField(default=0)),
+                ('rows_changed', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Re-scoring Job',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoryScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_version', models.CharField(max_length=64)),
+                ('result', models.CharField(max_length=50)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='main.predictionhistory')),
+            ],
+            options={
+                'verbose_name': 'History Score',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='historyscore',
+            constraint=models.UniqueConstraint(fields=('model_version', 'history'), name='history_score_version_history'),
+        ),
+    ]
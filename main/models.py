@@ -1,4 +1,10 @@
+import hashlib
+import secrets
+
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 
 class PredictionHistory(models.Model):
@@ -12,9 +18,17 @@ class PredictionHistory(models.Model):
     # Store only the ML prediction result: Safe / Moderate / Contaminated
     result = models.CharField(max_length=50)
 
+    # Registry version of the model that produced the result
+    model_version = models.CharField(max_length=64, blank=True, default="")
+
     # Timestamp of prediction
     prediction_date = models.DateTimeField(auto_now_add=True)
 
+    # Result confirmed by a lab test of the same sample (set in the admin);
+    # `manage.py retrain_model --source lab` learns from these rows only
+    lab_result = models.CharField(max_length=50, blank=True, default="")
+    lab_verified_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     def __str__(self):
         return f"{self.user.username} - {self.result} ({self.prediction_date.strftime('%Y-%m-%d %H:%M')})"
 
@@ -22,3 +36,120 @@ class PredictionHistory(models.Model):
         verbose_name = "Prediction History"
         verbose_name_plural = "Prediction History"
         ordering = ['-prediction_date']
+        indexes = [
+            # Per-user history pages: WHERE user = ? ORDER BY prediction_date, id
+            models.Index(fields=['user', 'prediction_date', 'id'], name='history_user_date_idx'),
+        ]
+
+
+class HistoryDailySummary(models.Model):
+    # Per user/day/result roll-up of PredictionHistory, kept current by
+    # main/summary.py on every history write (rebuild: rebuild_history_summary)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    result = models.CharField(max_length=50)
+
+    count = models.PositiveIntegerField(default=0)
+    ph_min = models.FloatField()
+    ph_max = models.FloatField()
+    ph_sum = models.FloatField(default=0)
+    tds_min = models.FloatField()
+    tds_max = models.FloatField()
+    tds_sum = models.FloatField(default=0)
+
+    @property
+    def ph_mean(self):
+        return self.ph_sum / self.count if self.count else None
+
+    @property
+    def tds_mean(self):
+        return self.tds_sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.user.username} - {self.day} {self.result}: {self.count}"
+
+    class Meta:
+        verbose_name = "History Daily Summary"
+        verbose_name_plural = "History Daily Summaries"
+        ordering = ['-day', 'result']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'result'], name='history_summary_user_day_result'),
+        ]
+
+
+class HistoryScore(models.Model):
+    # How a stored reading scores under a given model version, written by
+    # main/rescoring.py (`manage.py rescore_history` or the admin button)
+    history = models.ForeignKey(PredictionHistory, on_delete=models.CASCADE, related_name="scores")
+    model_version = models.CharField(max_length=64)
+    result = models.CharField(max_length=50)
+    confidence = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.history_id} @ {self.model_version}: {self.result}"
+
+    class Meta:
+        verbose_name = "History Score"
+        constraints = [
+            models.UniqueConstraint(fields=['model_version', 'history'], name='history_score_version_history'),
+        ]
+
+
+class RescoreJob(models.Model):
+    # Checkpoint of a re-scoring run: rows with id <= last_id are scored.
+    # Advanced in the same transaction as each chunk's HistoryScore rows.
+    PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+    STATUS_CHOICES = [(s, s) for s in (PENDING, RUNNING, DONE, FAILED)]
+
+    model_version = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    last_id = models.BigIntegerField(default=0)
+    target_id = models.BigIntegerField(default=0)
+    rows_scored = models.PositiveBigIntegerField(default=0)
+    rows_changed = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def progress(self):
+        return min(self.last_id / self.target_id, 1.0) if self.target_id else 1.0
+
+    def __str__(self):
+        return f"{self.model_version}: {self.status} ({self.progress:.0%})"
+
+    class Meta:
+        verbose_name = "Re-scoring Job"
+        ordering = ['-updated_at']
+
+
+class ApiToken(models.Model):
+    # Token for the JSON API (main/api.py); only a hash of the key is stored
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="api_tokens")
+    name = models.CharField(max_length=100, blank=True)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.name or 'API token'}"
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name=""):
+        """Create a token for ``user`` and return the plain key (shown once)."""
+        key = secrets.token_hex(20)
+        cls.objects.create(user=user, name=name, key_hash=cls.hash_key(key))
+        return key
+
+    class Meta:
+        verbose_name = "API Token"
+
+
+@receiver(post_delete, sender=ApiToken)
+def evict_api_token(sender, instance, **kwargs):
+    # main.api caches token lookups; a revoked token must stop working now
+    cache.delete(f"apitoken:{instance.key_hash}")
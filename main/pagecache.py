@@ -0,0 +1,81 @@
+"""
+Whole-page cache for anonymous GETs of the mostly static pages (home, login,
+register and the empty predict form).
+
+Django's ``cache_page`` does not help here. Every form on these pages embeds
+a CSRF token, so CsrfViewMiddleware adds ``Vary: Cookie``, and each visitor's
+cookie gets its own cache entry. Instead the rendered page is stored with its
+CSRF token replaced by a placeholder. Each hit puts a token for the current
+visitor back in: a string replace in place of a template render.
+
+Responses carry an ETag built from the cached page and the visitor's CSRF
+secret, plus ``Cache-Control: private, no-cache``. Browsers revalidate, and
+ConditionalGetMiddleware answers 304 while both are unchanged, so a
+revalidated copy always holds a token that matches its cookie. Requests from
+logged-in users, requests with pending messages and non-200 responses
+bypass the cache. ``PAGE_CACHE_SECONDS = 0`` turns it off.
+"""
+import hashlib
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+
+from .metrics import PAGE_CACHE_REQUESTS, get_metrics
+
+# What {% csrf_token %} renders
+CSRF_INPUT = re.compile(rb'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(")')
+PLACEHOLDER = b"__csrf_token__"
+
+
+def page_cache_key(request):
+    return "page:" + hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def _cacheable(request):
+    if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+        return False
+    # Messages are rendered into the page (and consumed by rendering it)
+    return len(get_messages(request)) == 0
+
+
+def cache_anonymous_page(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        timeout = getattr(settings, "PAGE_CACHE_SECONDS", 600)
+        if not timeout or not _cacheable(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        page = cache.get(key)
+        get_metrics().inc(PAGE_CACHE_REQUESTS, result="miss" if page is None else "hit")
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            content = CSRF_INPUT.sub(rb"\g<1>" + PLACEHOLDER + rb"\g<2>", response.content)
+            page = {
+                "content": content,
+                "content_type": response["Content-Type"],
+                "digest": hashlib.md5(content).hexdigest(),
+            }
+            cache.set(key, page, timeout)
+        else:
+            response = HttpResponse(content_type=page["content_type"])
+
+        content = page["content"]
+        if PLACEHOLDER in content:
+            # Only pages with a form get a CSRF cookie, as when rendered
+            content = content.replace(PLACEHOLDER, get_token(request).encode())
+        response.content = content
+        secret = request.META.get("CSRF_COOKIE", "")
+        response["ETag"] = quote_etag(hashlib.md5(f"{page['digest']}:{secret}".encode()).hexdigest())
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
@@ -0,0 +1,307 @@
+"""
+Versioned model registry with hot reload.
+
+Layout of ``settings.ML_REGISTRY_DIR``::
+
+    registry/
+        manifest.json          {"current": "<version>"}
+        <version>/
+            model.joblib
+            metadata.json      accuracy, training hash, feature names, ...
+            model.grid.npy     optional decision grid (build_decision_grid)
+            model.forest       optional compressed forest (compress_model)
+
+Without a manifest the registry serves the single legacy file at
+``settings.ML_MODEL_PATH``, versioned by its content hash.
+
+Workers look at the manifest (or legacy file) mtime at most every
+``ML_REGISTRY_POLL_SECONDS``. A newly promoted version is loaded on a
+background thread while requests keep using the old one, then swapped in with
+a single reference assignment. Requests take one ``ModelBundle`` up front and
+use it throughout, so a swap never mixes two models within a request.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+from django.conf import settings
+
+from .compress import CompressedForest
+from .forest import CompiledForest
+from .grid import DecisionGrid, GridPredictor, file_sha256
+from .metrics import MODEL_LOAD_SECONDS, get_metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILENAME = "model.joblib"
+METADATA_FILENAME = "metadata.json"
+MANIFEST_FILENAME = "manifest.json"
+
+
+def get_legacy_model_path():
+    # priority: settings.ML_MODEL_PATH -> waterproj/ml_models -> ml_models/
+    model_path = getattr(settings, "ML_MODEL_PATH", None)
+    if not model_path:
+        base = getattr(settings, "BASE_DIR", None)
+        if not base:
+            base = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+        candidate = os.path.join(base, "waterproj", "ml_models", "random_forest_model.joblib")
+        fallback = os.path.join(base, "ml_models", "random_forest_model.joblib")
+        model_path = candidate if os.path.exists(candidate) else (fallback if os.path.exists(fallback) else candidate)
+    return Path(model_path)
+
+
+def _write_json_atomic(path, data):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+
+class ModelBundle:
+    """One loaded model version plus the request-path forms derived from it."""
+
+    def __init__(self, version, path, model, metadata=None, compiled=None, grid=None):
+        self.version = version
+        self.path = Path(path)
+        self.model = model
+        self.metadata = metadata or {}
+        self.compiled = compiled
+        self.grid = grid
+
+    @classmethod
+    def load(cls, version, path, metadata=None):
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"ML model file not found at: {path}")
+
+        start = time.perf_counter()
+        model = compiled = None
+        if getattr(settings, "ML_MODEL_FORMAT", "joblib") == "compressed":
+            model = compiled = cls._load_compressed(path)
+        if model is None:
+            model = joblib.load(path)
+            compiled = CompiledForest.from_sklearn(model) if hasattr(model, "estimators_") else None
+
+        grid = None
+        if getattr(settings, "ML_GRID_MODE", False):
+            grid_path = cls.grid_path_for(path)
+            if not grid_path.exists():
+                logger.warning("ML_GRID_MODE is on but no grid exists at %s", grid_path)
+            else:
+                candidate = DecisionGrid.load(grid_path)
+                if candidate.model_sha256 != file_sha256(path):
+                    logger.warning("Decision grid was built for a different model, ignoring %s", grid_path)
+                else:
+                    grid = candidate
+
+        get_metrics().observe(
+            MODEL_LOAD_SECONDS, time.perf_counter() - start,
+            format="compressed" if isinstance(model, CompressedForest) else "joblib",
+        )
+        return cls(version, path, model, metadata=metadata, compiled=compiled, grid=grid)
+
+    @staticmethod
+    def _load_compressed(path):
+        """The artifact's compressed forest (manage.py compress_model), or None."""
+        compressed_path = CompressedForest.path_for(path)
+        if not compressed_path.exists():
+            logger.warning("ML_MODEL_FORMAT is 'compressed' but no file exists at %s", compressed_path)
+            return None
+        forest = CompressedForest.load(compressed_path)
+        if forest.source_sha256 != file_sha256(path):
+            logger.warning("Compressed forest was built from a different model, ignoring %s", compressed_path)
+            return None
+        return forest
+
+    @staticmethod
+    def grid_path_for(model_path):
+        return Path(model_path).with_suffix(".grid.npy")
+
+    @property
+    def grid_path(self):
+        return self.grid_path_for(self.path)
+
+    def predictor(self, n_rows=1):
+        """Model used on the request path for a batch of ``n_rows`` readings.
+
+        Grid lookups when ML_GRID_MODE is on and a matching grid exists, else
+        the compiled forest when ML_FAST_PATH is on and the batch is small
+        enough for it to beat sklearn, else the sklearn model itself.
+        """
+        model = self.model
+        fast_max_rows = getattr(settings, "ML_FAST_PATH_MAX_ROWS", 256)
+        if getattr(settings, "ML_FAST_PATH", True) and self.compiled is not None and n_rows <= fast_max_rows:
+            model = self.compiled
+        if self.grid is not None:
+            return GridPredictor(self.grid, model)
+        return model
+
+
+class ModelRegistry:
+    def __init__(self, root, legacy_path, poll_seconds=30):
+        self.root = Path(root)
+        self.legacy_path = Path(legacy_path)
+        self.poll_seconds = poll_seconds
+        self._active = None
+        self._lock = threading.Lock()
+        self._loading = False
+        self._last_check = 0.0
+        self._signature = None
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST_FILENAME
+
+    # ---- reading ----
+    def versions(self):
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if (p / MODEL_FILENAME).exists())
+
+    def read_metadata(self, version):
+        path = self.root / version / METADATA_FILENAME
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def _watched_path(self):
+        return self.manifest_path if self.manifest_path.exists() else self.legacy_path
+
+    def _signature_of(self, path):
+        try:
+            return (str(path), path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            return (str(path), None)
+
+    def resolve_current(self):
+        """Return (version, model_path, metadata) of the promoted model."""
+        if self.manifest_path.exists():
+            version = json.loads(self.manifest_path.read_text())["current"]
+            return version, self.root / version / MODEL_FILENAME, self.read_metadata(version)
+        if not self.legacy_path.exists():
+            raise FileNotFoundError(f"ML model file not found at: {self.legacy_path}")
+        version = f"legacy-{file_sha256(self.legacy_path)[:12]}"
+        return version, self.legacy_path, {}
+
+    def load_version(self, version):
+        """Bundle for any registered ``version`` (or the legacy file's), reusing
+        the active bundle when it is that version."""
+        active = self._active
+        if active is not None and active.version == version:
+            return active
+        if version in self.versions():
+            return ModelBundle.load(version, self.root / version / MODEL_FILENAME, self.read_metadata(version))
+        current, path, metadata = self.resolve_current()
+        if version != current:
+            raise FileNotFoundError(f"Unknown model version: {version}")
+        return ModelBundle.load(version, path, metadata)
+
+    # ---- serving ----
+    def active(self):
+        """Bundle to use for the current request; loads synchronously only once."""
+        bundle = self._active
+        if bundle is None:
+            with self._lock:
+                if self._active is None:
+                    self._signature = self._signature_of(self._watched_path())
+                    self._last_check = time.monotonic()
+                    version, path, metadata = self.resolve_current()
+                    self._active = ModelBundle.load(version, path, metadata)
+                bundle = self._active
+        elif time.monotonic() - self._last_check >= self.poll_seconds:
+            self.check_for_update()
+        return bundle
+
+    def check_for_update(self, block=False):
+        """Start loading the promoted version if it differs from the active one."""
+        self._last_check = time.monotonic()
+        signature = self._signature_of(self._watched_path())
+        if signature == self._signature:
+            return
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        if block:
+            self._reload(signature)
+        else:
+            threading.Thread(target=self._reload, args=(signature,), daemon=True,
+                             name="model-registry-reload").start()
+
+    def _reload(self, signature):
+        try:
+            version, path, metadata = self.resolve_current()
+            if self._active is None or version != self._active.version:
+                start = time.perf_counter()
+                bundle = ModelBundle.load(version, path, metadata)
+                self._active = bundle
+                logger.info("Model version %s loaded in %.3fs", version, time.perf_counter() - start)
+            self._signature = signature
+        except Exception:
+            # Keep serving the current version; the next poll retries
+            logger.exception("Failed to load promoted model")
+        finally:
+            self._loading = False
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._loading = False
+
+    # ---- publishing ----
+    def register(self, artifact, version=None, metadata=None, promote=False):
+        """Copy a joblib artifact into the registry as a new version."""
+        artifact = Path(artifact)
+        model = joblib.load(artifact)
+        version = version or datetime.now(timezone.utc).strftime("v%Y%m%d%H%M%S")
+        target = self.root / version
+        if target.exists():
+            raise FileExistsError(f"Model version {version} already exists")
+
+        target.mkdir(parents=True)
+        shutil.copy2(artifact, target / MODEL_FILENAME)
+        feature_names = getattr(model, "feature_names_in_", None)
+        meta = {
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "model_sha256": file_sha256(target / MODEL_FILENAME),
+            "model_class": type(model).__name__,
+            "feature_names": list(feature_names) if feature_names is not None else None,
+            "n_estimators": getattr(model, "n_estimators", None),
+        }
+        meta.update(metadata or {})
+        _write_json_atomic(target / METADATA_FILENAME, meta)
+        if promote:
+            self.promote(version)
+        return version
+
+    def promote(self, version):
+        if not (self.root / version / MODEL_FILENAME).exists():
+            raise FileNotFoundError(f"Unknown model version: {version}")
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(self.manifest_path, {
+            "current": version,
+            "promoted_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+
+_REGISTRY = None
+
+
+def get_registry():
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = ModelRegistry(
+            root=getattr(settings, "ML_REGISTRY_DIR", get_legacy_model_path().parent / "registry"),
+            legacy_path=get_legacy_model_path(),
+            poll_seconds=getattr(settings, "ML_REGISTRY_POLL_SECONDS", 30),
+        )
+        os.register_at_fork(after_in_child=_REGISTRY._after_fork)
+    return _REGISTRY
+
+
+def get_model_bundle():
+    return get_registry().active()
@@ -0,0 +1,172 @@
+"""
+Re-score stored history with another model version (manage.py rescore_history,
+or the "Re-score history" button of the PredictionHistory admin).
+
+``PredictionHistory.result`` keeps the label of whichever model was live when
+the reading came in. A re-scoring run walks history in primary-key order,
+``chunk_size`` rows at a time. Each chunk is scored with one ``predict_proba``
+call, and its ``HistoryScore`` rows are written in a single short transaction.
+That transaction also advances the version's ``RescoreJob`` checkpoint
+(``last_id``), so an interrupted run resumes exactly after the last committed
+chunk. Other writers wait for at most one chunk.
+
+A run scores rows up to the highest id present when it starts
+(``target_id``). Running it again for the same version later scores only the
+rows added since. A job stays "running" while its checkpoint keeps moving.
+Another run may take it over once the checkpoint has not moved for
+``RESCORE_STALE_SECONDS``, for example after its process was killed.
+
+Every write to the job row is a conditional UPDATE on ``status`` plus the
+``updated_at`` its writer last saw. A takeover moves ``updated_at``, so a
+run that was only slow finds its next checkpoint refused. It then rolls
+back that chunk and stops, and never writes alongside the new owner.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .inference import infer
+from .models import HistoryScore, PredictionHistory, RescoreJob
+from .registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+class JobBusy(RuntimeError):
+    """Another process is re-scoring for this model version."""
+
+
+def _write(job, expected_status, **fields):
+    """Update ``job`` unless another process wrote it since it was read.
+
+    Refreshes ``job`` and returns it; raises JobBusy if the row's status or
+    updated_at no longer match.
+    """
+    if not RescoreJob.objects.filter(pk=job.pk, status=expected_status, updated_at=job.updated_at).update(
+        updated_at=timezone.now(), **fields
+    ):
+        raise JobBusy(f"Re-scoring for {job.model_version} was taken over by another run")
+    job.refresh_from_db()
+    return job
+
+
+def claim_job(version, restart=False, force=False):
+    """Mark ``version``'s job as running (creating it) and return it.
+
+    Raises JobBusy if it is running elsewhere and has made progress within
+    ``RESCORE_STALE_SECONDS`` (unless ``force``), or if another run claims
+    it first.
+    """
+    job, _ = RescoreJob.objects.get_or_create(model_version=version)
+    stale = timezone.now() - timedelta(seconds=getattr(settings, "RESCORE_STALE_SECONDS", 300))
+    if job.status == RescoreJob.RUNNING and job.updated_at >= stale and not force:
+        raise JobBusy(f"Re-scoring for {version} is already running")
+    target = PredictionHistory.objects.aggregate(top=Max("id"))["top"] or 0
+    job = _write(job, job.status, status=RescoreJob.RUNNING, target_id=target, error="",
+                 started_at=timezone.now(), finished_at=None)
+    if restart:
+        delete_scores(version)
+        return _write(job, RescoreJob.RUNNING, last_id=0, rows_scored=0, rows_changed=0)
+    return job
+
+
+def delete_scores(version, chunk_size=20000):
+    """Drop a version's scores in id-range chunks (short transactions)."""
+    scores = HistoryScore.objects.filter(model_version=version)
+    while True:
+        ids = list(scores.order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return
+        HistoryScore.objects.filter(id__in=ids).delete()
+
+
+def _insert_scores(version, ids, labels, confidences):
+    table = HistoryScore._meta.db_table
+    sql = f"INSERT INTO {table} (history_id, model_version, result, confidence) VALUES (%s, %s, %s, %s)"
+    params = [(pk, version, label, None if conf == "N/A" else conf)
+              for pk, label, conf in zip(ids, labels, confidences)]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def rescore_chunk(bundle, rows, label_map):
+    """(labels, confidences) for history rows (id, ph, tds, result) from one model pass."""
+    X = np.array([(ph, tds) for _, ph, tds, _ in rows], dtype=float)
+    inference = infer(bundle.predictor(len(X)), X)
+    return inference.labels(label_map), inference.confidence()
+
+
+def run_job(job, bundle, chunk_size=None, pause=None, max_chunks=None, progress=None):
+    """Score ``job``'s remaining rows with ``bundle``; returns the updated job.
+
+    Stops early (status back to "pending") after ``max_chunks`` chunks.
+    ``progress(job)`` is called after every chunk.
+    """
+    from .views import get_label_map
+
+    chunk_size = chunk_size or getattr(settings, "RESCORE_CHUNK_SIZE", 5000)
+    pause = getattr(settings, "RESCORE_PAUSE_SECONDS", 0) if pause is None else pause
+    label_map = get_label_map()
+    chunks = 0
+    try:
+        while True:
+            if max_chunks is not None and chunks >= max_chunks:
+                return _write(job, RescoreJob.RUNNING, status=RescoreJob.PENDING)
+            rows = list(
+                PredictionHistory.objects.filter(id__gt=job.last_id, id__lte=job.target_id)
+                .order_by("id").values_list("id", "ph_input", "tds_input", "result")[:chunk_size]
+            )
+            if not rows:
+                return _write(job, RescoreJob.RUNNING, status=RescoreJob.DONE, finished_at=timezone.now())
+            labels, confidences = rescore_chunk(bundle, rows, label_map)
+            ids = [row[0] for row in rows]
+            changed = sum(label != row[3] for label, row in zip(labels, rows))
+            # Refused (JobBusy) once another run has taken over; the chunk's
+            # scores roll back with it
+            with transaction.atomic():
+                _insert_scores(job.model_version, ids, labels, confidences)
+                _write(job, RescoreJob.RUNNING, last_id=ids[-1], rows_scored=F("rows_scored") + len(rows),
+                       rows_changed=F("rows_changed") + changed)
+            chunks += 1
+            if progress:
+                progress(job)
+            if pause:
+                time.sleep(pause)
+    except JobBusy:
+        raise
+    except Exception as e:
+        try:
+            _write(job, RescoreJob.RUNNING, status=RescoreJob.FAILED, error=repr(e))
+        except JobBusy:
+            pass
+        raise
+
+
+def start_background_rescore(version, **kwargs):
+    """Claim ``version``'s job and run it on a daemon thread; returns the job.
+
+    If the process exits first, the job is resumed by the next run
+    (``manage.py rescore_history``) once it is stale.
+    """
+    bundle = get_registry().load_version(version)
+    job = claim_job(version)
+
+    def run():
+        try:
+            run_job(job, bundle, **kwargs)
+        except JobBusy as e:
+            logger.warning("%s", e)
+        except Exception:
+            logger.exception("Re-scoring history with %s failed", version)
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, daemon=True, name=f"rescore-{version}").start()
+    return job
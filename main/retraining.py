@@ -0,0 +1,277 @@
+"""
+Incremental retraining from prediction history (manage.py retrain_model).
+
+The training set lives on disk as an appendable NumPy snapshot next to the
+registry (``settings.ML_TRAINING_SNAPSHOT_DIR``), one per label source::
+
+    training/
+        lab/             rows with a lab-verified ``lab_result``
+            X.npy        float64 (rows, 2): pH, TDS
+            y.npy        int64 (rows,): class
+            state.json   committed row count, watermark, base data
+            .lock        held while a retrain runs
+        history/         rows labelled with the model's own ``result``
+
+Self-labelled history only teaches a model its own predictions, so it is
+never mixed into the lab-verified training set. Each snapshot starts as
+water_quality.csv. Each retrain streams only the history rows past the
+source's watermark (history id for model-labelled rows, lab verification
+time for ``lab_result`` rows), appends them to the snapshot and
+grows the promoted forest by ``extra_trees`` with ``warm_start``: the existing
+trees are kept and the new ones are fit on the new rows plus a random replay
+sample of the snapshot, so that every class is present and the new trees do
+not learn the latest rows alone. Cost follows the size of the delta, not of
+the whole history.
+
+The ``.npy`` headers are written with a fixed length so rows can be appended
+in place. ``state.json`` is authoritative: rows past its count (an append
+that was never committed) are truncated on the next run, so a failed or
+interrupted retrain leaves both the snapshot and the watermark as they were.
+"""
+import fcntl
+import json
+import os
+import struct
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .grid import file_sha256
+from .inference import model_input
+from .models import PredictionHistory
+
+X_FILENAME = "X.npy"
+Y_FILENAME = "y.npy"
+STATE_FILENAME = "state.json"
+LOCK_FILENAME = ".lock"
+
+# Fixed .npy header size (magic, version, length, padded dict): the data
+# never moves when the shape in the header grows
+HEADER_BYTES = 128
+N_FEATURES = 2
+X_DTYPE = np.dtype("<f8")
+Y_DTYPE = np.dtype("<i8")
+
+SOURCES = ("lab", "history")
+
+
+def get_snapshot_dir(source):
+    root = Path(getattr(settings, "ML_TRAINING_SNAPSHOT_DIR", Path(settings.ML_REGISTRY_DIR).parent / "training"))
+    return root / source
+
+
+def _write_header(f, dtype, shape):
+    header = repr({
+        "descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": tuple(shape),
+    }).encode("latin1")
+    size = HEADER_BYTES - 10
+    if len(header) + 1 > size:
+        raise ValueError(f"Shape {shape} does not fit the fixed .npy header")
+    f.seek(0)
+    f.write(np.lib.format.magic(1, 0) + struct.pack("<H", size) + header.ljust(size - 1) + b"\n")
+
+
+def _write_json_atomic(path, data):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+
+class TrainingSnapshot:
+    """X.npy / y.npy that grow by appending, plus the watermark state."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.pending = 0
+        self._state = None
+
+    @property
+    def x_path(self):
+        return self.root / X_FILENAME
+
+    @property
+    def y_path(self):
+        return self.root / Y_FILENAME
+
+    @property
+    def state_path(self):
+        return self.root / STATE_FILENAME
+
+    def exists(self):
+        return self.state_path.exists()
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = json.loads(self.state_path.read_text())
+        return self._state
+
+    @property
+    def rows(self):
+        """Committed rows."""
+        return self.state["rows"]
+
+    def watermark(self, source):
+        return self.state["watermarks"].get(source)
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock for a whole retrain; a second run fails instead of waiting."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / LOCK_FILENAME, "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError(f"Another retrain holds {self.root / LOCK_FILENAME}") from None
+            try:
+                yield self
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _files(self, rows):
+        """(path, dtype, shape, bytes per row) of X.npy and y.npy holding ``rows`` rows."""
+        return (
+            (self.x_path, X_DTYPE, (rows, N_FEATURES), X_DTYPE.itemsize * N_FEATURES),
+            (self.y_path, Y_DTYPE, (rows,), Y_DTYPE.itemsize),
+        )
+
+    def create(self, X, y, base):
+        """Start a snapshot from the base training set (``base`` is recorded in state)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        for (path, dtype, shape, _), data in zip(self._files(len(y)), (X, y)):
+            with open(path, "wb") as f:
+                _write_header(f, dtype, shape)
+                f.write(np.ascontiguousarray(data, dtype=dtype).reshape(shape).tobytes())
+        now = datetime.now(dt_timezone.utc).isoformat()
+        self._state = {
+            "rows": int(len(y)), "watermarks": {}, "base": base, "sources": {"base": int(len(y))},
+            "created_at": now, "updated_at": now,
+        }
+        _write_json_atomic(self.state_path, self._state)
+
+    def discard(self):
+        """Drop appended rows that were never committed."""
+        for path, dtype, shape, row_bytes in self._files(self.rows):
+            with open(path, "r+b") as f:
+                f.truncate(HEADER_BYTES + self.rows * row_bytes)
+                _write_header(f, dtype, shape)
+        self.pending = 0
+
+    def append(self, X, y):
+        """Write rows after the committed ones; they count once ``commit`` runs."""
+        offset = self.rows + self.pending
+        for (path, dtype, shape, row_bytes), data in zip(self._files(len(y)), (X, y)):
+            with open(path, "r+b") as f:
+                f.seek(HEADER_BYTES + offset * row_bytes)
+                f.write(np.ascontiguousarray(data, dtype=dtype).reshape(shape).tobytes())
+        self.pending += len(y)
+
+    def arrays(self, include_pending=False):
+        """Read-only memory maps of the committed (and optionally pending) rows."""
+        rows = self.rows + (self.pending if include_pending else 0)
+        return tuple(
+            np.memmap(path, dtype=dtype, mode="r", offset=HEADER_BYTES, shape=shape) if rows
+            else np.empty(shape, dtype)
+            for path, dtype, shape, _ in self._files(rows)
+        )
+
+    def commit(self, source, watermark, **extra):
+        """Make the pending rows part of the snapshot and advance ``source``'s watermark."""
+        rows = self.rows + self.pending
+        for path, dtype, shape, _ in self._files(rows):
+            with open(path, "r+b") as f:
+                _write_header(f, dtype, shape)
+                f.flush()
+                os.fsync(f.fileno())
+        state = dict(self.state, rows=rows, updated_at=datetime.now(dt_timezone.utc).isoformat(), **extra)
+        state["sources"] = dict(state["sources"], **{source: state["sources"].get(source, 0) + self.pending})
+        state["watermarks"] = dict(state["watermarks"], **{source: watermark})
+        _write_json_atomic(self.state_path, state)
+        self._state = state
+        self.pending = 0
+
+
+def base_snapshot_info(data_path, rows):
+    return {"path": str(data_path), "sha256": file_sha256(data_path), "rows": int(rows)}
+
+
+def label_codes(label_map):
+    """{"Safe": 0, ...} from the display label map."""
+    return {name: code for code, name in label_map.items()}
+
+
+def labelled_history(source, watermark, codes, chunk_size=50000):
+    """Yield (X, y, watermark) chunks of history rows past ``watermark``.
+
+    "history" rows are labelled with the model's own ``result`` and ordered by
+    id; "lab" rows are those with a ``lab_result``, ordered by the time they
+    were verified (a lab result can arrive long after the prediction).
+    Rows whose label is not in ``codes`` are skipped.
+    """
+    label_field = "result" if source == "history" else "lab_result"
+    rows = PredictionHistory.objects.order_by()
+    if source == "lab":
+        rows = rows.exclude(lab_result="").filter(lab_verified_at__isnull=False)
+    last_id = (watermark or {}).get("id", 0)
+    last_at = parse_datetime(watermark["verified_at"]) if watermark and watermark.get("verified_at") else None
+
+    while True:
+        if source == "history":
+            page = rows.filter(id__gt=last_id).order_by("id")
+            fields = ("id", "ph_input", "tds_input", label_field)
+        else:
+            page = rows
+            if last_at is not None:
+                page = page.filter(Q(lab_verified_at__gt=last_at) | Q(lab_verified_at=last_at, id__gt=last_id))
+            page = page.order_by("lab_verified_at", "id")
+            fields = ("id", "ph_input", "tds_input", label_field, "lab_verified_at")
+        chunk = list(page.values_list(*fields)[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1]
+        last_id = last[0]
+        if source == "lab":
+            last_at = last[4]
+        keep = [(ph, tds, codes[label]) for _, ph, tds, label, *_ in chunk if label in codes]
+        arr = np.array(keep, dtype=float).reshape(-1, 3)
+        mark = {"id": last_id}
+        if source == "lab":
+            mark["verified_at"] = last_at.isoformat()
+        yield arr[:, :2], arr[:, 2].astype(Y_DTYPE), mark, len(chunk) - len(keep)
+        if len(chunk) < chunk_size:
+            return
+
+
+def replay_indices(n_rows, size, rng):
+    """Sorted random row indices into the committed snapshot (sequential reads)."""
+    size = min(size, n_rows)
+    return np.sort(rng.choice(n_rows, size=size, replace=False)) if size else np.empty(0, dtype=np.int64)
+
+
+def grow_forest(model, X, y, extra_trees, n_jobs=-1):
+    """Add ``extra_trees`` trees fit on (X, y) to ``model``, keeping its existing trees."""
+    missing = set(model.classes_.tolist()) - set(np.unique(y).tolist())
+    if missing:
+        raise ValueError(f"Class(es) {sorted(missing)} missing from the rows to fit; "
+                         "increase --replay so the sample covers every class")
+    unknown = set(np.unique(y).tolist()) - set(model.classes_.tolist())
+    if unknown:
+        raise ValueError(f"Labels {sorted(unknown)} are not classes of the current model")
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + extra_trees, n_jobs=n_jobs)
+    start = time.perf_counter()
+    model.fit(model_input(model, X), y)
+    seconds = time.perf_counter() - start
+    model.set_params(warm_start=False, n_jobs=None)
+    return seconds
+
+
+def accuracy(model, X, y):
+    if len(y) == 0:
+        return None
+    return round(float(np.mean(model.predict(model_input(model, X)) == y)), 4)
@@ -0,0 +1,210 @@
+"""
+Threshold table and rule engine behind the water-quality analytics.
+
+Every threshold the analytics use lives in one table (``DEFAULT_RULES``,
+overridable per key through ``settings.WATER_QUALITY_RULES``), and every
+helper is evaluated for a whole array of readings at once: TDS bands with
+``np.digitize``, scores with ``np.where``, and the advice texts by turning
+the per-reading rule matches into a small bit code and building each distinct
+message list once. ``analyze_one`` walks the same table in plain Python for
+the single-reading request path, where NumPy's per-call overhead would cost
+more than the rules themselves.
+
+The helpers in ``views`` (``calculate_quality_index``, ``check_compliance``,
+...) are thin wrappers over ``get_rule_engine()``; ``manage.py
+verify_analytics`` checks them against the original if/elif implementations.
+"""
+from bisect import bisect_left
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_RULES = {
+    # WHO drinking-water pH range, and the ideal used for the WQI penalty
+    "ph_min": 6.5,
+    "ph_max": 8.5,
+    "ph_ideal": 7.5,
+    "ph_penalty_per_unit": 20,
+    # TDS bands (mg/L), upper edges inclusive; one score and weight per band
+    "tds_band_edges": [300, 600, 900, 1200],
+    "tds_band_scores": [100, 80, 60, 40, 20],
+    "tds_band_weights": [1, 2, 3, 4, 5],
+    "tds_who_limit": 500,
+    "tds_high": 900,
+    # WQI = ph_share * pH score + (1 - ph_share) * TDS score
+    "wqi_ph_share": 0.5,
+    # Contribution heuristic: pH weight per unit of deviation, TDS weight scale
+    "contribution_ph_scale": 10,
+    "contribution_tds_scale": 10,
+}
+
+HEALTH_RULES = (
+    ("acidic", "Acidic water may cause stomach irritation & corrosion."),
+    ("alkaline", "Alkaline water may cause skin dryness & mineral imbalance."),
+    ("high_tds", "High TDS can cause kidney stress & unpleasant taste."),
+)
+HEALTH_DEFAULT = "No major health risks detected."
+
+RESULT_ACTIONS = {
+    "Safe": "Water is safe. No action required.",
+    "Moderate": "Consider filtration (RO/UF) before drinking.",
+}
+RESULT_ACTION_DEFAULT = "Avoid drinking immediately. Use RO and chemical disinfection."
+ACTION_RULES = (
+    ("acidic", "Add alkaline minerals or buffering agents to balance pH."),
+    ("alkaline", "Use carbon filters to reduce alkalinity."),
+    ("high_tds", "Install RO purifier to remove excess dissolved solids."),
+)
+
+
+class RuleEngine:
+    def __init__(self, rules=None):
+        self.rules = {**DEFAULT_RULES, **(rules or {})}
+        r = self.rules
+        self.tds_edges = np.asarray(r["tds_band_edges"], dtype=float)
+        self.tds_scores = np.asarray(r["tds_band_scores"], dtype=float)
+        self.tds_weights = np.asarray(r["tds_band_weights"], dtype=float)
+        if not (len(self.tds_scores) == len(self.tds_weights) == len(self.tds_edges) + 1):
+            raise ValueError("WATER_QUALITY_RULES needs one TDS score and weight per band (edges + 1)")
+        self.compliance_limits = {
+            "who_limit_ph": f"{r['ph_min']:g}–{r['ph_max']:g}",
+            "who_limit_tds": f"<= {r['tds_who_limit']:g} mg/L",
+        }
+        self._message_cache = {}
+        # Plain lists for analyze_one
+        self._edges = self.tds_edges.tolist()
+        self._scores = self.tds_scores.tolist()
+        self._weights = self.tds_weights.tolist()
+
+    # ---- rule evaluation ----
+    @staticmethod
+    def _arrays(ph, tds):
+        return np.asarray(ph, dtype=float).ravel(), np.asarray(tds, dtype=float).ravel()
+
+    def tds_band(self, tds):
+        # right=True: a reading equal to an edge belongs to the lower band
+        return np.digitize(tds, self.tds_edges, right=True)
+
+    def conditions(self, ph, tds):
+        r = self.rules
+        acidic = ph < r["ph_min"]
+        return {
+            "acidic": acidic,
+            "alkaline": (ph > r["ph_max"]) & ~acidic,
+            "high_tds": tds > r["tds_high"],
+            "ph_ok": (ph >= r["ph_min"]) & (ph <= r["ph_max"]),
+            "tds_ok": tds <= r["tds_who_limit"],
+        }
+
+    def _messages(self, matched, rules):
+        """Per-reading lists of the texts of every matching rule."""
+        code = np.zeros(len(next(iter(matched.values()))), dtype=np.int64)
+        for bit, (name, _) in enumerate(rules):
+            code |= matched[name].astype(np.int64) << bit
+        codes = code.tolist()
+        for c in set(codes):
+            key = (rules, c)
+            if key not in self._message_cache:
+                self._message_cache[key] = [text for bit, (_, text) in enumerate(rules) if c >> bit & 1]
+        return [list(self._message_cache[(rules, c)]) for c in codes]
+
+    # ---- analytics ----
+    def quality_index(self, ph, tds):
+        ph, tds = self._arrays(ph, tds)
+        r = self.rules
+        ph_ok = (ph >= r["ph_min"]) & (ph <= r["ph_max"])
+        ph_score = np.where(ph_ok, 100.0, np.maximum(0, 100 - np.abs(ph - r["ph_ideal"]) * r["ph_penalty_per_unit"]))
+        tds_score = self.tds_scores[self.tds_band(tds)]
+        share = r["wqi_ph_share"]
+        return (ph_score * share + tds_score * (1 - share)).astype(int)
+
+    def contribution(self, ph, tds):
+        ph, tds = self._arrays(ph, tds)
+        r = self.rules
+        ph_weight = np.abs(ph - r["ph_ideal"]) * r["contribution_ph_scale"]
+        tds_weight = self.tds_weights[self.tds_band(tds)] * r["contribution_tds_scale"]
+        total = ph_weight + tds_weight
+        safe_total = np.where(total == 0, 1, total)
+        ph_pct = np.where(total == 0, 50, np.round(ph_weight / safe_total * 100)).astype(int)
+        tds_pct = np.where(total == 0, 50, np.round(tds_weight / safe_total * 100)).astype(int)
+        return [{"pH": p, "TDS": t} for p, t in zip(ph_pct.tolist(), tds_pct.tolist())]
+
+    def compliance(self, ph, tds, matched=None):
+        ph, tds = self._arrays(ph, tds)
+        matched = matched or self.conditions(ph, tds)
+        status = ("Not Compliant", "Compliant")
+        return [
+            {"ph_status": status[p], "tds_status": status[t], **self.compliance_limits}
+            for p, t in zip(matched["ph_ok"].tolist(), matched["tds_ok"].tolist())
+        ]
+
+    def health_risks(self, ph, tds, matched=None):
+        ph, tds = self._arrays(ph, tds)
+        matched = matched or self.conditions(ph, tds)
+        profiles = self._messages(matched, HEALTH_RULES)
+        for profile in profiles:
+            if not profile:
+                profile.append(HEALTH_DEFAULT)
+        return profiles
+
+    def actions(self, results, ph, tds, matched=None):
+        ph, tds = self._arrays(ph, tds)
+        matched = matched or self.conditions(ph, tds)
+        headline = [RESULT_ACTIONS.get(result, RESULT_ACTION_DEFAULT) for result in results]
+        cards = self._messages(matched, ACTION_RULES)
+        for first, rest in zip(headline, cards):
+            rest.insert(0, first)
+        return cards
+
+    def analyze_one(self, ph, tds, result=None):
+        """``analyze`` for one reading; ``actions`` is omitted without a result."""
+        r = self.rules
+        band = bisect_left(self._edges, tds)  # same bands as tds_band()
+        acidic = ph < r["ph_min"]
+        matched = {"acidic": acidic, "alkaline": ph > r["ph_max"] and not acidic, "high_tds": tds > r["tds_high"]}
+        ph_ok = r["ph_min"] <= ph <= r["ph_max"]
+
+        ph_score = 100 if ph_ok else max(0, 100 - abs(ph - r["ph_ideal"]) * r["ph_penalty_per_unit"])
+        share = r["wqi_ph_share"]
+        ph_weight = abs(ph - r["ph_ideal"]) * r["contribution_ph_scale"]
+        tds_weight = self._weights[band] * r["contribution_tds_scale"]
+        total = ph_weight + tds_weight
+        status = ("Not Compliant", "Compliant")
+
+        analytics = {
+            "quality_index": int(ph_score * share + self._scores[band] * (1 - share)),
+            "contribution": {"pH": 50, "TDS": 50} if total == 0 else {
+                "pH": round(ph_weight / total * 100), "TDS": round(tds_weight / total * 100),
+            },
+            "compliance": {
+                "ph_status": status[ph_ok], "tds_status": status[tds <= r["tds_who_limit"]], **self.compliance_limits,
+            },
+            "health_risks": [text for name, text in HEALTH_RULES if matched[name]] or [HEALTH_DEFAULT],
+        }
+        if result is not None:
+            analytics["actions"] = [RESULT_ACTIONS.get(result, RESULT_ACTION_DEFAULT)] + [
+                text for name, text in ACTION_RULES if matched[name]
+            ]
+        return analytics
+
+    def analyze(self, ph, tds, results):
+        """Every analytics field for each reading, from one pass over the rules."""
+        ph, tds = self._arrays(ph, tds)
+        matched = self.conditions(ph, tds)
+        return {
+            "quality_index": self.quality_index(ph, tds).tolist(),
+            "contribution": self.contribution(ph, tds),
+            "compliance": self.compliance(ph, tds, matched),
+            "health_risks": self.health_risks(ph, tds, matched),
+            "actions": self.actions(results, ph, tds, matched),
+        }
+
+
+_ENGINE = None
+
+
+def get_rule_engine():
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = RuleEngine(getattr(settings, "WATER_QUALITY_RULES", None))
+    return _ENGINE
@@ -0,0 +1,128 @@
+"""
+Per-user daily history aggregates.
+
+``HistoryDailySummary`` holds one row per (user, local day, result) with the
+count and running min/max/sum of the inputs. ``apply_to_summaries`` folds a
+batch of freshly inserted history rows into it inside the same transaction as
+the insert, so "how many Contaminated results this month" reads O(days) rows
+instead of scanning PredictionHistory.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least, TruncDate
+from django.utils import timezone
+
+from .models import HistoryDailySummary, PredictionHistory
+
+
+def _group(rows):
+    groups = defaultdict(lambda: {"count": 0, "ph": [], "tds": []})
+    for row in rows:
+        key = (row.user_id, timezone.localdate(row.prediction_date), row.result)
+        groups[key]["count"] += 1
+        groups[key]["ph"].append(row.ph_input)
+        groups[key]["tds"].append(row.tds_input)
+    return groups
+
+
+def apply_to_summaries(rows):
+    """Fold saved PredictionHistory rows into their daily summaries.
+
+    Call inside the transaction that inserted ``rows``.
+    """
+    for (user_id, day, result), g in _group(rows).items():
+        ph_min, ph_max, ph_sum = min(g["ph"]), max(g["ph"]), sum(g["ph"])
+        tds_min, tds_max, tds_sum = min(g["tds"]), max(g["tds"]), sum(g["tds"])
+        match = HistoryDailySummary.objects.filter(user_id=user_id, day=day, result=result)
+        updated = match.update(
+            count=F("count") + g["count"],
+            ph_min=Least(F("ph_min"), ph_min), ph_max=Greatest(F("ph_max"), ph_max),
+            ph_sum=F("ph_sum") + ph_sum,
+            tds_min=Least(F("tds_min"), tds_min), tds_max=Greatest(F("tds_max"), tds_max),
+            tds_sum=F("tds_sum") + tds_sum,
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                HistoryDailySummary.objects.create(
+                    user_id=user_id, day=day, result=result, count=g["count"],
+                    ph_min=ph_min, ph_max=ph_max, ph_sum=ph_sum,
+                    tds_min=tds_min, tds_max=tds_max, tds_sum=tds_sum,
+                )
+        except IntegrityError:
+            # Another writer created the row first; add to it instead
+            match.update(
+                count=F("count") + g["count"],
+                ph_min=Least(F("ph_min"), ph_min), ph_max=Greatest(F("ph_max"), ph_max),
+                ph_sum=F("ph_sum") + ph_sum,
+                tds_min=Least(F("tds_min"), tds_min), tds_max=Greatest(F("tds_max"), tds_max),
+                tds_sum=F("tds_sum") + tds_sum,
+            )
+
+
+def rebuild_summaries(user=None):
+    """Recompute summaries from raw history (all users, or just ``user``)."""
+    history = PredictionHistory.objects.all()
+    summaries = HistoryDailySummary.objects.all()
+    if user is not None:
+        history = history.filter(user=user)
+        summaries = summaries.filter(user=user)
+
+    grouped = (
+        history.order_by()
+        .annotate(day=TruncDate("prediction_date"))
+        .values("user_id", "day", "result")
+        .annotate(
+            n=Count("id"),
+            ph_lo=Min("ph_input"), ph_hi=Max("ph_input"), ph_total=Sum("ph_input"),
+            tds_lo=Min("tds_input"), tds_hi=Max("tds_input"), tds_total=Sum("tds_input"),
+        )
+    )
+    with transaction.atomic():
+        summaries.delete()
+        created = HistoryDailySummary.objects.bulk_create(
+            (
+                HistoryDailySummary(
+                    user_id=g["user_id"], day=g["day"], result=g["result"], count=g["n"],
+                    ph_min=g["ph_lo"], ph_max=g["ph_hi"], ph_sum=g["ph_total"],
+                    tds_min=g["tds_lo"], tds_max=g["tds_hi"], tds_sum=g["tds_total"],
+                )
+                for g in grouped.iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def summarize(user, days=30):
+    """Per-result totals and per-day rows for ``user`` over the last ``days`` days."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    daily = list(HistoryDailySummary.objects.filter(user=user, day__gte=since).order_by("-day", "result"))
+
+    totals = {}
+    for s in daily:
+        t = totals.setdefault(s.result, {
+            "count": 0, "ph_min": s.ph_min, "ph_max": s.ph_max, "ph_sum": 0.0,
+            "tds_min": s.tds_min, "tds_max": s.tds_max, "tds_sum": 0.0,
+        })
+        t["count"] += s.count
+        t["ph_min"], t["ph_max"] = min(t["ph_min"], s.ph_min), max(t["ph_max"], s.ph_max)
+        t["tds_min"], t["tds_max"] = min(t["tds_min"], s.tds_min), max(t["tds_max"], s.tds_max)
+        t["ph_sum"] += s.ph_sum
+        t["tds_sum"] += s.tds_sum
+
+    for t in totals.values():
+        t["ph_mean"] = round(t.pop("ph_sum") / t["count"], 2)
+        t["tds_mean"] = round(t.pop("tds_sum") / t["count"], 2)
+
+    return {
+        "since": since,
+        "days": days,
+        "total": sum(t["count"] for t in totals.values()),
+        "by_result": totals,
+        "daily": daily,
+    }
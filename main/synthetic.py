@@ -0,0 +1,113 @@
+"""
+Synthetic prediction history at production scale (manage.py load_demo_data
+--users N --rows M).
+
+Readings are drawn in NumPy per chunk: pH mostly near neutral with a
+uniform share of acidic/alkaline outliers, TDS log-normal (most supplies a
+few hundred mg/L, a long tail of brackish ones). Users get a heavy-tailed
+share of the rows, as real usage does, and timestamps rise through the
+requested period chunk by chunk, so ids and dates grow together like they
+would in production. Labels come from the labelling rule of the training data
+(``rule_labels``) or from the deployed model in batches.
+
+Rows go in with one ``executemany`` per chunk inside a transaction. The ORM's
+``bulk_create`` would build a model instance per row and stamp every
+``prediction_date`` with ``auto_now_add``.
+"""
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PredictionHistory
+
+LABEL_NAMES = np.array(["Safe", "Moderate", "Contaminated"], dtype=object)
+
+
+def rule_labels(ph, tds):
+    """Class (0 Safe, 1 Moderate, 2 Contaminated) by the rule water_quality.csv
+    was labelled with (see model_training.py)."""
+    safe = (ph >= 6.5) & (ph <= 8.5) & (tds < 500)
+    moderate = (ph >= 6.0) & (ph <= 9.0) & (tds < 1000)
+    return np.where(safe, 0, np.where(moderate, 1, 2))
+
+
+def synthetic_readings(n, rng, outlier_share=0.15):
+    """(pH, TDS) arrays, rounded like the prediction cache keys."""
+    ph = rng.normal(7.2, 0.55, n)
+    outliers = rng.random(n) < outlier_share
+    ph[outliers] = rng.uniform(4.0, 10.5, int(outliers.sum()))
+    tds = rng.lognormal(mean=np.log(380), sigma=0.65, size=n)
+    return np.round(np.clip(ph, 0, 14), 2), np.round(np.clip(tds, 5, 5000), 1)
+
+
+def user_weights(n_users, rng):
+    """Share of the rows each user gets: a few heavy users, many light ones."""
+    weights = rng.pareto(1.2, n_users) + 1
+    return weights / weights.sum()
+
+
+def model_labels(bundle, ph, tds, batch_size=100000):
+    """Display labels from the deployed model, ``batch_size`` readings per call."""
+    from .inference import infer
+    from .views import get_label_map
+
+    label_map = get_label_map()
+    labels = np.empty(ph.size, dtype=object)
+    for start in range(0, ph.size, batch_size):
+        stop = start + batch_size
+        X = np.column_stack([ph[start:stop], tds[start:stop]])
+        labels[start:stop] = infer(bundle.predictor(len(X)), X).labels(label_map)
+    return labels
+
+
+def _timestamps(n, start, end, rng):
+    """``n`` sorted naive-UTC timestamps in [start, end), as SQL strings."""
+    span_us = max(int((end - start).total_seconds() * 1e6), 1)
+    offsets = np.sort(rng.integers(0, span_us, n))
+    base = np.datetime64(start.astimezone(dt_timezone.utc).replace(tzinfo=None), "us")
+    return np.char.replace(np.datetime_as_string(base + offsets.astype("timedelta64[us]"), unit="us"), "T", " ")
+
+
+def insert_history(user_ids, ph, tds, results, dates, model_version):
+    table = PredictionHistory._meta.db_table
+    sql = (f"INSERT INTO {table} (user_id, ph_input, tds_input, result, model_version, prediction_date, lab_result) "
+           f"VALUES (%s, %s, %s, %s, %s, %s, '')")
+    params = zip(user_ids.tolist(), ph.tolist(), tds.tolist(), results.tolist(),
+                 [model_version] * len(ph), dates.tolist())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, list(params))
+
+
+def generate_history(user_ids, rows, days=365, chunk_size=50000, labels="rule", bundle=None,
+                     model_batch_size=100000, seed=0, end=None, progress=None):
+    """Insert ``rows`` synthetic history rows spread over ``user_ids`` and the
+    last ``days`` days. ``labels`` is "rule" or "model" (needs ``bundle``).
+    ``progress(done, rows, elapsed_s)`` is called after every chunk."""
+    rng = np.random.default_rng(seed)
+    user_ids = np.asarray(user_ids)
+    weights = user_weights(len(user_ids), rng)
+    end = end or timezone.now()
+    start = end - timedelta(days=days)
+    n_chunks = max(1, -(-rows // chunk_size))
+    slice_span = (end - start) / n_chunks
+    model_version = bundle.version if labels == "model" else "synthetic"
+
+    began = time.perf_counter()
+    done = 0
+    for k in range(n_chunks):
+        n = min(chunk_size, rows - done)
+        ph, tds = synthetic_readings(n, rng)
+        if labels == "model":
+            results = model_labels(bundle, ph, tds, model_batch_size)
+        else:
+            results = LABEL_NAMES[rule_labels(ph, tds)]
+        owners = user_ids[rng.choice(len(user_ids), size=n, p=weights)]
+        dates = _timestamps(n, start + slice_span * k, start + slice_span * (k + 1), rng)
+        insert_history(owners, ph, tds, results, dates, model_version)
+        done += n
+        if progress:
+            progress(done, rows, time.perf_counter() - began)
+    return done
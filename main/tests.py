@@ -0,0 +1,52 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from main import history
+from main.history import HistoryWriter
+from main.models import ApiToken, PredictionHistory
+
+
+class AsyncHistoryOverflowTests(TransactionTestCase):
+    """/api/async/predict with a history writer that cannot keep up."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("station", password="pw")
+        self.key = ApiToken.issue(self.user, name="test")
+        # The thread never flushes on its own, so every third row overflows
+        self.writer = HistoryWriter(flush_rows=10**6, flush_ms=60 * 60 * 1000, max_buffer=2)
+        patcher = mock.patch.object(history, "_WRITER", self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_overflow_batches_are_written(self):
+        for i in range(7):
+            response = await self.async_client.post(
+                "/api/async/predict", json.dumps({"ph": 7.0, "tds": 100.0 + i}),
+                content_type="application/json", headers={"Authorization": f"Token {self.key}"},
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+        await sync_to_async(self.writer.close)()
+
+        self.assertEqual(self.writer.rows_failed, 0)
+        self.assertEqual(await PredictionHistory.objects.filter(user=self.user).acount(), 7)
+
+
+class VerifyCommandTests(TransactionTestCase):
+    """The verify_* commands compare fast paths with their references and
+    raise CommandError on a mismatch; run them here so a regression fails
+    the test suite rather than waiting for someone to run them by hand."""
+
+    def test_compiled_forest_matches_predict_proba(self):
+        call_command("verify_compiled_model", stdout=StringIO())
+
+    def test_rule_engine_matches_original_analytics(self):
+        call_command("verify_analytics", "--random-samples", "2000", stdout=StringIO())
+
+    def test_every_scoring_path_evaluates_the_model_once(self):
+        call_command("verify_inference", stdout=StringIO())
@@ -0,0 +1,188 @@
+"""
+Training pipeline behind ``manage.py train_model``.
+
+A grid search over forest size (``n_estimators``) and depth (``max_depth``)
+scores every candidate on cross-validated accuracy, inference cost and
+serialized size. The chosen model is the cheapest one whose CV accuracy is
+within ``tolerance`` of the best, so a small shallow forest wins whenever it is
+as good as a large one. Cost is ranked by nodes visited per reading (summed
+over trees), which is what the compiled forest's latency scales with and,
+unlike a timing, gives the same choice on every run; measured latencies are
+recorded alongside it.
+
+CV folds run in parallel across ``n_jobs`` processes; each candidate is then
+refit on the full training split with ``n_jobs`` tree-building threads and
+scored on the held-out test split. Once chosen, the winning parameters are
+fit once more on every row (training and test), so the saved model has seen
+all of the data; its reported test accuracy is that of the same parameters
+fit without the test rows. The saved model has ``n_jobs`` reset so that
+serving stays single-threaded.
+"""
+import io
+import platform
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, train_test_split
+
+from .forest import CompiledForest
+from .grid import file_sha256
+
+FEATURES = ["pH", "TDS"]
+TARGET = "label"
+
+DEFAULT_SEARCH = {
+    "n_estimators": [25, 40, 80, 150],
+    "max_depth": [6, 10, 14, None],
+}
+
+
+def load_training_data(path):
+    df = pd.read_csv(path)
+    missing = set(FEATURES + [TARGET]) - set(df.columns)
+    if missing:
+        raise ValueError(f"{path} is missing column(s): {', '.join(sorted(missing))}")
+    df = df.dropna(subset=FEATURES + [TARGET])
+    return df[FEATURES], df[TARGET].astype(int)
+
+
+def serialized_size(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def nodes_per_reading(model, X):
+    """Mean number of tree nodes evaluated for one reading, over all trees."""
+    return float(model.decision_path(X)[0].nnz / len(X))
+
+
+def single_row_latency_us(model, X, rows=200, rounds=3):
+    """Microseconds per one-reading predict_proba through the compiled forest
+    (best of ``rounds`` passes over ``rows`` readings)."""
+    compiled = CompiledForest.from_sklearn(model)
+    readings = [row.reshape(1, -1) for row in np.asarray(X, dtype=float)[:rows]]
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for reading in readings:
+            compiled.predict_proba(reading)
+        best = min(best, (time.perf_counter() - start) / len(readings))
+    return best * 1e6
+
+
+def batch_latency_us(model, X):
+    """Microseconds per row for one sklearn predict_proba over all of ``X``."""
+    start = time.perf_counter()
+    model.predict_proba(X)
+    return (time.perf_counter() - start) / len(X) * 1e6
+
+
+def run_search(X, y, search=None, cv=5, n_jobs=-1, seed=42, test_size=0.2, tolerance=0.005, log=print):
+    """Search, pick and refit on all of ``X``/``y``; returns (model, report)."""
+    search = search or DEFAULT_SEARCH
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=seed, stratify=y
+    )
+
+    start = time.perf_counter()
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    grid = GridSearchCV(
+        RandomForestClassifier(random_state=seed, n_jobs=1),
+        param_grid=search, cv=folds, n_jobs=n_jobs, refit=False, scoring="accuracy",
+    )
+    grid.fit(X_train, y_train)
+    cv_seconds = time.perf_counter() - start
+    log(f"Cross-validated {len(grid.cv_results_['params'])} candidates x {cv} folds in {cv_seconds:.1f}s")
+
+    candidates = []
+    for i, params in enumerate(grid.cv_results_["params"]):
+        model = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, **params)
+        fit_start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - fit_start
+        model.set_params(n_jobs=None)
+        candidate = {
+            "params": params,
+            "cv_accuracy": round(float(grid.cv_results_["mean_test_score"][i]), 4),
+            "cv_accuracy_std": round(float(grid.cv_results_["std_test_score"][i]), 4),
+            "test_accuracy": round(float(model.score(X_test, y_test)), 4),
+            "fit_seconds": round(fit_seconds, 3),
+            "nodes_per_reading": round(nodes_per_reading(model, X_test), 1),
+            "single_row_us": round(single_row_latency_us(model, X_test), 1),
+            "batch_row_us": round(batch_latency_us(model, X_test), 2),
+            "size_bytes": serialized_size(model),
+            "n_nodes": int(sum(e.tree_.node_count for e in model.estimators_)),
+        }
+        candidates.append((candidate, model))
+        log(
+            "  n_estimators={n_estimators:<4} max_depth={max_depth!s:<5}".format(**params)
+            + f" cv={candidate['cv_accuracy']:.4f} test={candidate['test_accuracy']:.4f}"
+            f" nodes={candidate['nodes_per_reading']:.0f} 1-row={candidate['single_row_us']:.0f}us size={candidate['size_bytes'] / 1e6:.2f}MB"
+        )
+
+    best_cv = max(c["cv_accuracy"] for c, _ in candidates)
+    eligible = [(c, m) for c, m in candidates if c["cv_accuracy"] >= best_cv - tolerance]
+    chosen, _ = min(eligible, key=lambda cm: (cm[0]["nodes_per_reading"], cm[0]["size_bytes"]))
+
+    # The held-out metrics above are settled; the test rows go into the final fit
+    model = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, **chosen["params"])
+    fit_start = time.perf_counter()
+    model.fit(X, y)
+    refit_seconds = time.perf_counter() - fit_start
+    model.set_params(n_jobs=None)
+    log(f"Refit {chosen['params']} on all {len(X)} rows in {refit_seconds:.1f}s")
+
+    report = {
+        "chosen": chosen,
+        "best_cv_accuracy": best_cv,
+        "tolerance": tolerance,
+        "cv_folds": cv,
+        "cv_seconds": round(cv_seconds, 2),
+        "search_space": {k: list(v) for k, v in search.items()},
+        "candidates": [c for c, _ in candidates],
+        "train_rows": int(len(X_train)),
+        "test_rows": int(len(X_test)),
+        "refit_rows": int(len(X)),
+        "refit_seconds": round(refit_seconds, 3),
+        "refit_size_bytes": serialized_size(model),
+        "seed": seed,
+    }
+    return model, report
+
+
+def parse_search_values(raw, cast=int):
+    """'40,80,none' -> [40, 80, None]"""
+    values = []
+    for item in raw.split(","):
+        item = item.strip()
+        if item:
+            values.append(None if item.lower() == "none" else cast(item))
+    return values
+
+
+def training_metadata(model, report, data_path, n_jobs, started):
+    return {
+        "accuracy": report["chosen"]["test_accuracy"],
+        "cv_accuracy": report["chosen"]["cv_accuracy"],
+        "params": report["chosen"]["params"],
+        "nodes_per_reading": report["chosen"]["nodes_per_reading"],
+        "single_row_us": report["chosen"]["single_row_us"],
+        "size_bytes": report["refit_size_bytes"],
+        "accuracy_note": "test/cv accuracy of the chosen params fit on the training split; "
+                         "the saved model is refit on all rows",
+        "trained_rows": report["refit_rows"],
+        "classes": [int(c) for c in model.classes_],
+        "training_data": str(data_path),
+        "training_hash": file_sha256(data_path),
+        "search": report,
+        "n_jobs": n_jobs,
+        "training_seconds": round(time.perf_counter() - started, 2),
+        "python": platform.python_version(),
+        "sklearn": sklearn.__version__,
+        "numpy": np.__version__,
+    }
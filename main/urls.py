@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = "main"
 
@@ -15,4 +15,17 @@ urlpatterns = [
 
     path('predict/', views.predict_view, name="predict"),
     path('history/', views.history_view, name="history"),
+    path('history/export/', views.history_export_view, name="history_export"),
+
+    # Prometheus scrape endpoint (see main/metrics.py)
+    path('metrics', views.metrics_view, name="metrics"),
+
+    # JSON API (token auth, see main/api.py)
+    path('api/predict', api.api_predict, name="api_predict"),
+    path('api/predict/batch', api.api_predict_batch, name="api_predict_batch"),
+    path('api/history', api.api_history, name="api_history"),
+    path('api/history/export', api.api_history_export, name="api_history_export"),
+    path('api/history/summary', api.api_history_summary, name="api_history_summary"),
+    path('api/drift', api.api_drift, name="api_drift"),
+    path('api/async/predict', api.api_predict_async, name="api_predict_async"),
 ]
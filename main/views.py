@@ -1,152 +1,292 @@
-import os
-import traceback
+import base64
+import binascii
+import csv
+import io
+import json
+import logging
+import math
+import time
 import re
 
-from pathlib import Path
+from datetime import datetime
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect
+from django.views.decorators.http import require_GET
 
-import joblib
 import numpy as np
 
+from .cache import get_prediction_cache
+from .drift import get_drift_monitor
+from .export import export_owner, export_queryset, parse_export_filters, streaming_export_response
+from .forest import CompiledForest
+from .history import get_history_writer, history_is_buffered, write_history_rows
+from .inference import infer
+from .metrics import ANALYTICS_SECONDS, CONTENT_TYPE, HISTORY_ROWS, PREDICT_SECONDS, get_metrics
 from .models import PredictionHistory
+from .pagecache import cache_anonymous_page
+from .registry import get_model_bundle
+from .rules import get_rule_engine
+from .summary import summarize
+
+logger = logging.getLogger(__name__)
 
 # -------------------------
-# Model loader (lazy)
+# Model loader (see main.registry)
 # -------------------------
-_MODEL = None
+DEFAULT_LABEL_MAP = {0: "Safe", 1: "Moderate", 2: "Contaminated"}
+
+
+def get_label_map():
+    return getattr(settings, "LABEL_MAP", DEFAULT_LABEL_MAP)
 
 
 def get_model():
-    global _MODEL
-    if _MODEL is None:
-        # priority: settings.ML_MODEL_PATH -> waterproj/ml_models -> ml_models/
-        model_path = getattr(settings, "ML_MODEL_PATH", None)
-        if not model_path:
-            base = getattr(settings, "BASE_DIR", None)
-            if not base:
-                base = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-            candidate = os.path.join(base, "waterproj", "ml_models", "random_forest_model.joblib")
-            fallback = os.path.join(base, "ml_models", "random_forest_model.joblib")
-            model_path = candidate if os.path.exists(candidate) else (fallback if os.path.exists(fallback) else candidate)
+    return get_model_bundle().model
+
+
+def get_compiled_model():
+    """Flat-array copy of the active forest (see main.forest)."""
+    bundle = get_model_bundle()
+    return bundle.compiled or CompiledForest.from_sklearn(bundle.model)
 
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"ML model file not found at: {model_path}")
 
-        _MODEL = joblib.load(model_path)
-    return _MODEL
+def get_predictor(n_rows=1):
+    return get_model_bundle().predictor(n_rows)
+
+
+def preload_model():
+    """Load the model and its request-path forms now rather than on first use.
+
+    Called from the WSGI/ASGI entry points; with gunicorn's preload_app the
+    arrays are loaded once in the master and shared by the forked workers.
+    """
+    start = time.perf_counter()
+    try:
+        bundle = get_model_bundle()
+        loaded = time.perf_counter()
+        predictor = bundle.predictor()
+        # Warm up NumPy/sklearn code paths so the first request is not the slow one
+        predictor.predict_proba([[7.0, 300.0]])
+    except FileNotFoundError as e:
+        # predict_view reports the missing model per request; keep serving pages
+        logger.warning("Model preload failed: %s", e)
+        return
+    done = time.perf_counter()
+    logger.info(
+        "Model %s preloaded in %.3fs (load %.3fs, predictor %s %.3fs)",
+        bundle.version, done - start, loaded - start, type(predictor).__name__, done - loaded,
+    )
 
 
 # -------------------------
 # Helper analytics functions
 # -------------------------
+# Thin wrappers over the rule engine (main/rules.py), which holds the
+# thresholds and evaluates them for whole arrays of readings at once.
 def calculate_quality_index(pH, TDS):
     """Simple WQI style score (0-100)."""
-    # pH score (ideal ~7.5)
-    if 6.5 <= pH <= 8.5:
-        ph_score = 100
-    else:
-        deviation = abs(pH - 7.5)
-        ph_score = max(0, 100 - deviation * 20)
-
-    # TDS score
-    if TDS <= 300:
-        tds_score = 100
-    elif TDS <= 600:
-        tds_score = 80
-    elif TDS <= 900:
-        tds_score = 60
-    elif TDS <= 1200:
-        tds_score = 40
-    else:
-        tds_score = 20
-
-    return int((ph_score * 0.5) + (tds_score * 0.5))
+    return get_rule_engine().analyze_one(pH, TDS)["quality_index"]
 
 
 def calculate_parameter_contribution(pH, TDS):
     """Return contribution percentages for pH and TDS (heuristic)."""
-    ph_deviation = abs(pH - 7.5)
-    ph_weight = ph_deviation * 10
-    if TDS <= 300:
-        tds_weight = 1
-    elif TDS <= 600:
-        tds_weight = 2
-    elif TDS <= 900:
-        tds_weight = 3
-    elif TDS <= 1200:
-        tds_weight = 4
-    else:
-        tds_weight = 5
-
-    total = ph_weight + (tds_weight * 10)
-    if total == 0:
-        return {"pH": 50, "TDS": 50}
-    return {"pH": round((ph_weight / total) * 100), "TDS": round(((tds_weight * 10) / total) * 100)}
+    return get_rule_engine().analyze_one(pH, TDS)["contribution"]
 
 
 def check_compliance(pH, TDS):
-    return {
-        "ph_status": "Compliant" if 6.5 <= pH <= 8.5 else "Not Compliant",
-        "tds_status": "Compliant" if TDS <= 500 else "Not Compliant",
-        "who_limit_ph": "6.5–8.5",
-        "who_limit_tds": "<= 500 mg/L",
-    }
+    return get_rule_engine().analyze_one(pH, TDS)["compliance"]
 
 
 def get_health_risk_profile(pH, TDS):
-    profile = []
-    if pH < 6.5:
-        profile.append("Acidic water may cause stomach irritation & corrosion.")
-    elif pH > 8.5:
-        profile.append("Alkaline water may cause skin dryness & mineral imbalance.")
-    if TDS > 900:
-        profile.append("High TDS can cause kidney stress & unpleasant taste.")
-    if len(profile) == 0:
-        profile.append("No major health risks detected.")
-    return profile
+    return get_rule_engine().analyze_one(pH, TDS)["health_risks"]
 
 
 def get_action_cards(result, pH, TDS):
-    cards = []
-    if result == "Safe":
-        cards.append("Water is safe. No action required.")
-    elif result == "Moderate":
-        cards.append("Consider filtration (RO/UF) before drinking.")
-    else:
-        cards.append("Avoid drinking immediately. Use RO and chemical disinfection.")
-
-    if pH < 6.5:
-        cards.append("Add alkaline minerals or buffering agents to balance pH.")
-    elif pH > 8.5:
-        cards.append("Use carbon filters to reduce alkalinity.")
-
-    if TDS > 900:
-        cards.append("Install RO purifier to remove excess dissolved solids.")
-
-    return cards
+    return get_rule_engine().analyze_one(pH, TDS, result)["actions"]
 
 
 def get_confidence(model, pH, TDS):
     try:
-        proba = model.predict_proba([[pH, TDS]])[0]
-        return round(np.max(proba) * 100, 2)
+        return infer(model, [[pH, TDS]]).confidence()[0]
     except Exception:
         return "N/A"
 
 
+# -------------------------
+# Vectorized analytics (batch scoring)
+# -------------------------
+def calculate_quality_index_array(ph, tds):
+    return get_rule_engine().quality_index(ph, tds)
+
+
+def calculate_parameter_contribution_array(ph, tds):
+    return get_rule_engine().contribution(ph, tds)
+
+
+def check_compliance_array(ph, tds):
+    return get_rule_engine().compliance(ph, tds)
+
+
+def get_health_risk_profile_array(ph, tds):
+    return get_rule_engine().health_risks(ph, tds)
+
+
+def get_action_cards_array(results, ph, tds):
+    return get_rule_engine().actions(results, ph, tds)
+
+
+def score_reading(bundle, ph, tds):
+    """Prediction plus analytics payload for one reading (what predict.html shows)."""
+    model = bundle.predictor()
+    metrics = get_metrics()
+    with metrics.timer(PREDICT_SECONDS, predictor=type(model).__name__, mode="single"):
+        inference = infer(model, [[ph, tds]])
+    result_label = inference.labels(get_label_map())[0]
+
+    with metrics.timer(ANALYTICS_SECONDS, mode="single"):
+        analytics = get_rule_engine().analyze_one(ph, tds, result_label)
+
+    return {
+        "prediction_result": result_label,
+        "probabilities": inference.probabilities()[0],
+        **analytics,
+        "confidence": inference.confidence()[0],
+        "model_version": bundle.version,
+    }
+
+
+def score_readings(bundle, ph, tds):
+    """Vectorized score_reading: one predict_proba call for all readings."""
+    ph = np.asarray(ph, dtype=float)
+    tds = np.asarray(tds, dtype=float)
+    model = bundle.predictor(ph.size)
+    metrics = get_metrics()
+    with metrics.timer(PREDICT_SECONDS, predictor=type(model).__name__, mode="batch"):
+        inference = infer(model, np.column_stack([ph, tds]))
+    result_labels = inference.labels(get_label_map())
+    probabilities = inference.probabilities()
+    confidences = inference.confidence()
+
+    with metrics.timer(ANALYTICS_SECONDS, mode="batch"):
+        analytics = get_rule_engine().analyze(ph, tds, result_labels)
+
+    return [
+        {
+            "prediction_result": result_labels[i],
+            "probabilities": probabilities[i],
+            "confidence": confidences[i],
+            "quality_index": analytics["quality_index"][i],
+            "contribution": analytics["contribution"][i],
+            "compliance": analytics["compliance"][i],
+            "health_risks": analytics["health_risks"][i],
+            "actions": analytics["actions"][i],
+            "model_version": bundle.version,
+        }
+        for i in range(ph.size)
+    ]
+
+
+def predict_one(ph, tds):
+    """Payload for one reading, served from the prediction cache when enabled."""
+    bundle = get_model_bundle()
+    cache = get_prediction_cache()
+    if cache is None:
+        payload = score_reading(bundle, ph, tds)
+    else:
+        payload = cache.get_or_compute_many(
+            bundle.version, [(float(ph), float(tds))], lambda missing: [score_reading(bundle, *missing[0])]
+        )[0]
+    get_drift_monitor().observe(bundle.version, ph, tds, payload["prediction_result"])
+    return payload
+
+
+def predict_batch(ph, tds):
+    """Score arrays of pH/TDS readings with a single predict_proba call.
+
+    Returns a list of per-sample dicts carrying the same analytics that
+    ``predict_view`` renders for a single reading. Cached readings are
+    reused; only the misses are scored.
+    """
+    ph = np.asarray(ph, dtype=float)
+    tds = np.asarray(tds, dtype=float)
+    if ph.size == 0:
+        return []
+
+    bundle = get_model_bundle()
+    cache = get_prediction_cache()
+    if cache is None:
+        payloads = score_readings(bundle, ph, tds)
+    else:
+        readings = list(zip(ph.tolist(), tds.tolist()))
+        payloads = cache.get_or_compute_many(
+            bundle.version, readings, lambda missing: score_readings(bundle, *np.array(missing).T)
+        )
+    get_drift_monitor().observe_many(bundle.version, ph, tds, [p["prediction_result"] for p in payloads])
+    return [{"ph": float(p), "tds": float(t), **payload} for p, t, payload in zip(ph, tds, payloads)]
+
+
+def parse_batch_samples(request):
+    """Read (pH, TDS) readings from a CSV upload or a JSON body.
+
+    CSV uploads go in the ``file`` field with ``ph``/``tds`` (or ``pH``/``TDS``)
+    columns. JSON bodies may be a list of ``{"ph": .., "tds": ..}`` objects or
+    ``[ph, tds]`` pairs, optionally wrapped as ``{"samples": [...]}``.
+    Raises ValueError with a user-facing message on malformed input.
+    """
+    upload = request.FILES.get("file")
+    if upload is not None:
+        text = io.TextIOWrapper(upload.file, encoding="utf-8-sig")
+        reader = csv.DictReader(text)
+        columns = {(name or "").strip().lower(): name for name in (reader.fieldnames or [])}
+        if "ph" not in columns or "tds" not in columns:
+            raise ValueError("CSV must have 'ph' and 'tds' columns.")
+        rows = [(row[columns["ph"]], row[columns["tds"]]) for row in reader]
+    else:
+        try:
+            payload = json.loads(request.body or b"null")
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Request body is not valid JSON.")
+        if isinstance(payload, dict):
+            payload = payload.get("samples")
+        if not isinstance(payload, list):
+            raise ValueError("Expected a JSON array of samples.")
+        rows = []
+        for item in payload:
+            if isinstance(item, dict):
+                rows.append((item.get("ph", item.get("pH")), item.get("tds", item.get("TDS"))))
+            elif isinstance(item, (list, tuple)) and len(item) == 2:
+                rows.append((item[0], item[1]))
+            else:
+                raise ValueError("Each sample must be {'ph': .., 'tds': ..} or [ph, tds].")
+
+    max_rows = getattr(settings, "BATCH_PREDICT_MAX_ROWS", 10000)
+    if len(rows) > max_rows:
+        raise ValueError(f"Too many samples (max {max_rows}).")
+
+    try:
+        samples = np.array(rows, dtype=float).reshape(-1, 2)
+    except (TypeError, ValueError):
+        raise ValueError("pH and TDS must be numeric.")
+    if not np.isfinite(samples).all():
+        raise ValueError("pH and TDS must be finite numbers.")
+    return samples[:, 0], samples[:, 1]
+
+
 # -------------------------
 # Views: auth + pages
 # -------------------------
+@cache_anonymous_page
 def home(request):
     return render(request, "main/home.html")
 
 
+@cache_anonymous_page
 def login_view(request):
     if request.method == "POST":
         username = request.POST.get("username", "").strip()
@@ -168,6 +308,7 @@ def logout_view(request):
     return redirect("main:home")
 
 
+@cache_anonymous_page
 def register_view(request):
     if request.method == "POST":
         username = request.POST.get("username", "").strip()
@@ -247,6 +388,44 @@ def reset_password_view(request, username):
 # -------------------------
 # Prediction & History
 # -------------------------
+def history_rows(user, results):
+    """Unsaved PredictionHistory rows for scored readings (dicts with ph, tds and a payload)."""
+    # fields must match models.PredictionHistory
+    return [
+        PredictionHistory(
+            user=user,
+            ph_input=r["ph"],
+            tds_input=r["tds"],
+            result=r["prediction_result"],
+            model_version=r["model_version"],
+        )
+        for r in results
+    ]
+
+
+def save_history(user, results, background=None):
+    """Store scored readings for ``user``.
+
+    ``background`` hands them to the write-behind history writer; by default
+    that follows settings.HISTORY_WRITE_MODE.
+    """
+    if not results:
+        return
+    rows = history_rows(user, results)
+    if background is None:
+        background = history_is_buffered()
+    if background:
+        get_history_writer().submit(rows)
+        return
+    try:
+        write_history_rows(rows)
+    except Exception:
+        # Do not break prediction if history save fails
+        get_metrics().inc(HISTORY_ROWS, len(rows), status="failed")
+        logger.exception("Failed to save %d history rows", len(rows))
+
+
+@cache_anonymous_page
 def predict_view(request):
     # If GET, render the form
     if request.method == "GET":
@@ -271,71 +450,125 @@ def predict_view(request):
         except ValueError:
             messages.error(request, "pH and TDS must be numeric.")
             return redirect("main:predict")
+        # float() also accepts "inf" and "nan"
+        if not (math.isfinite(ph) and math.isfinite(tds)):
+            messages.error(request, "pH and TDS must be numeric.")
+            return redirect("main:predict")
 
-        model = get_model()
-        pred = model.predict([[ph, tds]])[0]
-        labels = getattr(settings, "LABEL_MAP", {0: "Safe", 1: "Moderate", 2: "Contaminated"})
-        result_label = labels.get(int(pred), str(pred))
-
-        probs = None
-        confidence = "N/A"
-        if hasattr(model, "predict_proba"):
-            try:
-                probs = model.predict_proba([[ph, tds]])[0].tolist()
-                confidence = round(max(probs) * 100, 2)
-            except Exception:
-                probs = None
-
-        # analytics
-        wqi = calculate_quality_index(ph, tds)
-        contribution = calculate_parameter_contribution(ph, tds)
-        compliance = check_compliance(ph, tds)
-        health_risks = get_health_risk_profile(ph, tds)
-        actions = get_action_cards(result_label, ph, tds)
-        confidence = get_confidence(model, ph, tds) if confidence == "N/A" else confidence
-
-        # Save history (fields must match models.PredictionHistory)
-        try:
-            if request.user.is_authenticated:
-                PredictionHistory.objects.create(
-                    user=request.user,
-                    ph_input=ph,
-                    tds_input=tds,
-                    result=result_label
-                )
-        except Exception as e:
-            # Do not break prediction if history save fails
-            print("Warning: failed to save history:", e)
-            traceback.print_exc()
+        payload = predict_one(ph, tds)
+        result_label = payload["prediction_result"]
+
+        if request.user.is_authenticated:
+            save_history(request.user, [{"ph": ph, "tds": tds, **payload}])
 
         # Render template with keys expected by predict.html
         return render(request, "main/predict.html", {
             "ph_value": ph,
             "tds_value": tds,
-            "prediction_result": result_label,
-            "probabilities": probs,
-            "quality_index": wqi,
-            "contribution": contribution,
-            "compliance": compliance,
-            "health_risks": health_risks,
-            "actions": actions,
-            "confidence": confidence,
+            **payload,
         })
 
-    except FileNotFoundError as e:
-        traceback.print_exc()
+    except FileNotFoundError:
+        logger.exception("Prediction failed")
         messages.error(request, "Model file missing on server. Contact admin.")
         return redirect("main:predict")
-    except Exception as e:
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Prediction failed")
         messages.error(request, "Internal server error during prediction.")
         return redirect("main:predict")
 
 
+def encode_cursor(row):
+    raw = f"{row.prediction_date.isoformat()}|{row.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(prediction_date, id) from a page cursor; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(date), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid page cursor.")
+
+
+def keyset_page(queryset, page_size, after=None, before=None):
+    """One newest-first page of ``queryset`` by (prediction_date, id).
+
+    ``after`` moves to older rows and ``before`` to newer ones. Each is a
+    decoded cursor. Seeks go through the (user, prediction_date, id) index
+    instead of counting past an OFFSET. Returns (rows, has_older, has_newer).
+    """
+    if before is not None:
+        date, pk = before
+        rows = list(
+            queryset.filter(prediction_date__gte=date)
+            .exclude(prediction_date=date, id__lte=pk)
+            .order_by("prediction_date", "id")[:page_size + 1]
+        )
+        has_newer = len(rows) > page_size
+        return rows[:page_size][::-1], True, has_newer
+
+    if after is not None:
+        date, pk = after
+        queryset = queryset.filter(prediction_date__lte=date).exclude(prediction_date=date, id__gte=pk)
+    rows = list(queryset.order_by("-prediction_date", "-id")[:page_size + 1])
+    return rows[:page_size], len(rows) > page_size, after is not None
+
+
 @login_required(login_url="main:login")
 def history_view(request):
+    default_size = getattr(settings, "HISTORY_PAGE_SIZE", 50)
+    max_size = getattr(settings, "HISTORY_MAX_PAGE_SIZE", 500)
+    try:
+        page_size = min(max(int(request.GET.get("page_size", default_size)), 1), max_size)
+    except ValueError:
+        page_size = default_size
+
+    try:
+        after = decode_cursor(request.GET["after"]) if request.GET.get("after") else None
+        before = decode_cursor(request.GET["before"]) if request.GET.get("before") else None
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect("main:history")
+
     history = PredictionHistory.objects.filter(
         user=request.user
-    ).order_by("-prediction_date")
+    ).only("id", "prediction_date", "ph_input", "tds_input", "result")
+    rows, has_older, has_newer = keyset_page(history, page_size, after=after, before=before)
 
-    return render(request, "main/history.html", {"history": history})
+    return render(request, "main/history.html", {
+        "history": rows,
+        "page_size": page_size,
+        "older_cursor": encode_cursor(rows[-1]) if rows and has_older else None,
+        "newer_cursor": encode_cursor(rows[0]) if rows and has_newer else None,
+        "summary": summarize(request.user, getattr(settings, "HISTORY_SUMMARY_DAYS", 30)),
+    })
+
+
+@login_required(login_url="main:login")
+def history_export_view(request):
+    """Download history as ?format=csv|ndjson, filtered by start/end/result."""
+    fmt = request.GET.get("format", "csv")
+    try:
+        owner = export_owner(request.user, request.GET)
+        start, end, result = parse_export_filters(request.GET)
+        if fmt not in ("csv", "ndjson"):
+            raise ValueError("format must be 'csv' or 'ndjson'.")
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect("main:history")
+
+    return streaming_export_response(export_queryset(owner, start, end, result), fmt)
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint (see main/metrics.py)."""
+    if not getattr(settings, "METRICS_ENABLED", True):
+        raise Http404
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.META.get("HTTP_AUTHORIZATION", "") != f"Bearer {token}":
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(get_metrics().render(), content_type=CONTENT_TYPE)
@@ -19,14 +19,10 @@ else:
     ph = np.round(np.random.uniform(4.5, 9.5, N), 2)
     tds = np.round(np.random.uniform(50, 2000, N), 2)
 
-    labels = []
-    for p, t in zip(ph, tds):
-        if (6.5 <= p <= 8.5) and (t < 500):
-            labels.append(0)
-        elif (6.0 <= p <= 9.0) and (t < 1000):
-            labels.append(1)
-        else:
-            labels.append(2)
+    # 0 Safe, 1 Moderate, 2 Contaminated (same rule as main/synthetic.py rule_labels)
+    safe = (ph >= 6.5) & (ph <= 8.5) & (tds < 500)
+    moderate = (ph >= 6.0) & (ph <= 9.0) & (tds < 1000)
+    labels = np.where(safe, 0, np.where(moderate, 1, 2))
 
     df = pd.DataFrame({"pH": ph, "TDS": tds, "label": labels})
     df.to_csv(CSV_FILE, index=False)
@@ -25,8 +25,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main.middleware.request_metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    # ETag on every GET response, and 304 when it matches If-None-Match
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -54,12 +57,33 @@ else:
         }
     }
 
+# Keep each worker's connection (and its PRAGMA setup) for this many seconds
+# instead of reconnecting on every request; 0 reconnects per request
+DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", "600"))
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Run on every new SQLite connection (main/db.py)
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_SIZE_KB", "20000")),  # negative: KiB, not pages
+}
+
+# Parsed templates are kept in memory outside DEBUG; with DEBUG on, edits
+# show up on the next request
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "main.metrics.InstrumentedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            "loaders": TEMPLATE_LOADERS if DEBUG else [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -86,10 +110,14 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
-
-if not os.environ.get("RENDER"):
+if os.environ.get("RENDER"):
+    # build.sh runs collectstatic, which writes the manifest of hashed names
+    STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+else:
     STATICFILES_DIRS = [BASE_DIR / "static"]
+    # No collectstatic locally: plain names, served straight from the app
+    # static directories
+    WHITENOISE_USE_FINDERS = True
 
 # SECURITY FOR RENDER
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
@@ -108,7 +136,108 @@ CACHES = {
     }
 }
 
+# Anonymous GETs of home/login/register/predict are served from CACHES
+# (main/pagecache.py) for this many seconds; 0 renders every request
+PAGE_CACHE_SECONDS = int(os.environ.get("PAGE_CACHE_SECONDS", "600"))
+
+# Memoized prediction payloads (main/cache.py); "django" uses CACHES[ALIAS]
+PREDICTION_CACHE = {
+    "BACKEND": os.environ.get("PREDICTION_CACHE_BACKEND", "local"),
+    "MAX_ENTRIES": 4096,
+    "ALIAS": "default",
+    "TIMEOUT": 3600,
+    "PH_DECIMALS": 2,
+    "TDS_DECIMALS": 1,
+}
+
+# Threads running model calls for the async (ASGI) prediction endpoint
+ASYNC_INFERENCE_THREADS = int(os.environ.get("ASYNC_INFERENCE_THREADS", "4"))
+
+# History writes: "sync" inserts on the request, "buffered" batches them in
+# main/history.py and flushes every HISTORY_FLUSH_ROWS rows or HISTORY_FLUSH_MS
+HISTORY_WRITE_MODE = os.environ.get("HISTORY_WRITE_MODE", "sync")
+HISTORY_FLUSH_ROWS = int(os.environ.get("HISTORY_FLUSH_ROWS", "200"))
+HISTORY_FLUSH_MS = int(os.environ.get("HISTORY_FLUSH_MS", "250"))
+HISTORY_MAX_BUFFER = 20000
+
+# History page (keyset pagination): default and maximum ?page_size=
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+# Window (days) of the per-result summary on the history page, and the largest
+# window /api/history/summary accepts
+HISTORY_SUMMARY_DAYS = 30
+HISTORY_SUMMARY_MAX_DAYS = 366
+
+# Rows fetched per database round trip (and written per chunk) by history exports
+EXPORT_CHUNK_SIZE = 2000
+
 # ML MODEL PATH (OK)
 ML_MODEL_PATH = BASE_DIR / "waterproj" / "ml_models" / "random_forest_model.joblib"
 
+# Load the model when the WSGI/ASGI app starts instead of on the first request
+ML_PRELOAD = os.environ.get("ML_PRELOAD", "True") == "True"
+
+# Serve predictions from the flat-array compiled forest (main/forest.py)
+ML_FAST_PATH = os.environ.get("ML_FAST_PATH", "True") == "True"
+ML_FAST_PATH_MAX_ROWS = 256  # larger batches are faster through sklearn itself
+
+# Answer from the precomputed decision grid (manage.py build_decision_grid)
+ML_GRID_MODE = os.environ.get("ML_GRID_MODE", "False") == "True"
+
+# "compressed" serves the artifact's .forest file (manage.py compress_model)
+# instead of unpickling the joblib model; "joblib" serves the model as trained
+ML_MODEL_FORMAT = os.environ.get("ML_MODEL_FORMAT", "joblib")
+
+# Versioned model artifacts (main/registry.py); ML_MODEL_PATH is used until a
+# version is promoted. Workers check for a newly promoted version this often.
+ML_REGISTRY_DIR = Path(os.environ.get("ML_REGISTRY_DIR", BASE_DIR / "waterproj" / "ml_models" / "registry"))
+ML_REGISTRY_POLL_SECONDS = int(os.environ.get("ML_REGISTRY_POLL_SECONDS", "30"))
+
+# Appendable .npy training sets and watermarks of `manage.py retrain_model`
+# (main/retraining.py), one subdirectory per label source; each starts as
+# water_quality.csv
+ML_TRAINING_SNAPSHOT_DIR = Path(os.environ.get("ML_TRAINING_SNAPSHOT_DIR",
+                                               BASE_DIR / "waterproj" / "ml_models" / "training"))
+
+# Re-scoring stored history with a model version (main/rescoring.py): rows per
+# chunk transaction, optional pause between chunks, and how long a "running"
+# job may go without progress before another run can take it over
+RESCORE_CHUNK_SIZE = 5000
+RESCORE_PAUSE_SECONDS = float(os.environ.get("RESCORE_PAUSE_SECONDS", "0"))
+RESCORE_STALE_SECONDS = 300
+
+# Overrides for the analytics threshold table (main/rules.py DEFAULT_RULES),
+# e.g. {"tds_who_limit": 600}; per key, unset keys keep their defaults
+WATER_QUALITY_RULES = {}
+
+# Latency histograms and counters at /metrics (main/metrics.py). With
+# METRICS_DIR set, each worker process writes its series there and /metrics
+# sums them; METRICS_TOKEN, if set, must be sent as "Authorization: Bearer ..."
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Per-model-version pH/TDS histograms and class counts of every prediction
+# (main/drift.py), compared at /api/drift with this training data; versions
+# with fewer readings report "insufficient data"
+DRIFT_MONITOR_ENABLED = os.environ.get("DRIFT_MONITOR_ENABLED", "True") == "True"
+DRIFT_REFERENCE_DATA = BASE_DIR / "water_quality.csv"
+DRIFT_MIN_SAMPLES = 100
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s [pid %(process)d] %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        "main": {"handlers": ["console"], "level": os.environ.get("LOG_LEVEL", "INFO"), "propagate": False},
+    },
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'waterproj.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.ML_PRELOAD:
+    # Load the model at startup (before gunicorn forks, with preload_app) so
+    # the first request on each worker does not pay for it.
+    from main.views import preload_model  # noqa: E402
+
+    preload_model()